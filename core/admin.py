@@ -1,16 +1,17 @@
 from django.contrib import admin
-from django.db.models import Count, Q
+from django.db.models import Q
 from django.utils.html import format_html
-from django.utils import timezone
-from datetime import timedelta
 from django import forms
 import csv
 import io
 from .models import (
     Artist, Album, Song, Line, UserProfile,
     SongComment, ArtistComment, SongRating, ArtistRating,
-    PageView, SiteStats
+    PageView, SiteStats, DailyContentStats
 )
+from .analytics import traffic_summary, visitor_summary
+from .charts import resolve_top_content
+from .lyrics import replace_song_lines
 
 
 class LineInline(admin.TabularInline):
@@ -144,26 +145,24 @@ class SongAdmin(admin.ModelAdmin):
         # Process CSV lyrics if provided
         csv_lyrics = form.cleaned_data.get('csv_lyrics', '').strip()
         if csv_lyrics:
-            # Delete existing lines
-            obj.lines.all().delete()
-
-            # Parse and create new lines
+            # Parse the new lines
             csv_reader = csv.reader(io.StringIO(csv_lyrics))
-            line_no = 1
+            lines = []
             for row in csv_reader:
                 if len(row) >= 2:
                     original = row[0].strip()
                     romanized = row[1].strip() if len(row) > 1 and row[1].strip() else None
                     translation_en = row[2].strip() if len(row) > 2 else ''
 
-                    Line.objects.create(
-                        song=obj,
-                        no=line_no,
+                    lines.append(Line(
+                        no=len(lines) + 1,
                         original=original,
                         romanized=romanized,
                         translation_en=translation_en
-                    )
-                    line_no += 1
+                    ))
+
+            # Replace the existing lines (and invalidate the cached lyrics block)
+            replace_song_lines(obj, lines)
 
 
 @admin.register(UserProfile)
@@ -234,6 +233,17 @@ class SiteStatsAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(DailyContentStats)
+class DailyContentStatsAdmin(admin.ModelAdmin):
+    list_display = ("date", "content_type", "content_id", "views")
+    list_filter = ("content_type", "date")
+    date_hierarchy = "date"
+    readonly_fields = ("date", "content_type", "content_id", "views")
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Custom admin index with analytics
 class AnalyticsDashboard(admin.AdminSite):
     site_header = "Lyrics Library Admin"
@@ -242,38 +252,27 @@ class AnalyticsDashboard(admin.AdminSite):
     def index(self, request, extra_context=None):
         extra_context = extra_context or {}
 
-        # Get stats for last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        today = timezone.now().date()
+        # Page view totals from the daily rollups
+        traffic = traffic_summary()
+        total_views = traffic['total_views']
+        views_30d = traffic['views_30d']
+        views_7d = traffic['views_7d']
+        views_today = traffic['views_today']
 
-        # Total page views
-        total_views = PageView.objects.count()
-        views_30d = PageView.objects.filter(viewed_at__gte=thirty_days_ago).count()
-        views_7d = PageView.objects.filter(viewed_at__gte=seven_days_ago).count()
-        views_today = PageView.objects.filter(viewed_at__date=today).count()
-
-        # Unique visitors (by IP)
-        unique_ips_30d = PageView.objects.filter(viewed_at__gte=thirty_days_ago).values('ip_address').distinct().count()
-        unique_ips_7d = PageView.objects.filter(viewed_at__gte=seven_days_ago).values('ip_address').distinct().count()
-        unique_ips_today = PageView.objects.filter(viewed_at__date=today).values('ip_address').distinct().count()
+        # Unique visitors (by IP), estimated from the daily sketches
+        visitors = visitor_summary()
+        unique_ips_30d = visitors['unique_ips_30d']
+        unique_ips_7d = visitors['unique_ips_7d']
+        unique_ips_today = visitors['unique_ips_today']
 
         # User stats
         from django.contrib.auth.models import User
         total_users = User.objects.count()
-        active_users_30d = PageView.objects.filter(
-            viewed_at__gte=thirty_days_ago,
-            user__isnull=False
-        ).values('user').distinct().count()
-
-        # Most viewed content
-        top_songs = PageView.objects.filter(content_type='song').values('content_title').annotate(
-            views=Count('id')
-        ).order_by('-views')[:5]
-
-        top_artists = PageView.objects.filter(content_type='artist').values('content_title').annotate(
-            views=Count('id')
-        ).order_by('-views')[:5]
+        active_users_30d = visitors['active_users_30d']
+
+        # Most viewed content, from the daily rollups
+        top_songs = resolve_top_content('song', limit=5)
+        top_artists = resolve_top_content('artist', limit=5)
 
         extra_context.update({
             'total_views': total_views,
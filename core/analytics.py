@@ -0,0 +1,250 @@
+"""Incremental rollups of PageView into SiteStats and DailyContentStats.
+
+rollup_page_views() folds PageView rows added since the last watermark into
+per-day totals, one primary-key-ordered chunk per transaction, so it can be
+stopped and resumed at any point without double counting. Distinct visitors
+are kept as per-day HyperLogLog sketches that merge across days. The
+dashboards read from the rollup tables plus the small tail of rows not rolled
+up yet.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import DailyContentStats, HourlyContentViews, PageView, RollupWatermark, SiteStats
+
+PAGEVIEW_ROLLUP = 'pageviews'
+
+# SiteStats sketch field -> name used in visitor_summary() results
+SKETCHES = {
+    'ip_sketch': 'unique_ips',
+    'session_sketch': 'unique_visitors',
+    'user_sketch': 'active_users',
+}
+
+
+def _add_visit(sketches, ip_address, session_key, user_id):
+    if ip_address:
+        sketches['ip_sketch'].add(ip_address)
+    if session_key or ip_address:
+        # Visitors without a session cookie are identified by IP
+        sketches['session_sketch'].add(session_key or f"ip:{ip_address}")
+    if user_id:
+        sketches['user_sketch'].add(user_id)
+
+
+def rollup_page_views(chunk_size=5000, max_chunks=None):
+    """Roll up PageView rows past the watermark. Returns the number of rows processed."""
+    processed = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.get_or_create(name=PAGEVIEW_ROLLUP)
+            # Lock the watermark so two rollups can't fold the same rows
+            mark = RollupWatermark.objects.select_for_update().get(pk=mark.pk)
+            ids = list(
+                PageView.objects.filter(id__gt=mark.last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            _fold_chunk(mark.last_id, ids[-1])
+            mark.last_id = ids[-1]
+            mark.save(update_fields=['last_id', 'updated_at'])
+
+        processed += len(ids)
+        chunks += 1
+    return processed
+
+
+def reset_rollups():
+    """Clear rollup rows and rewind the watermark so history is rebuilt from PageView.
+
+    Days older than the oldest remaining PageView row have been archived (see
+    core.archive) and can't be rebuilt, so their rollups are kept.
+    """
+    with transaction.atomic():
+        first_view = PageView.objects.order_by('viewed_at').values_list('viewed_at', flat=True).first()
+        if first_view is not None:
+            since = timezone.localdate(first_view)
+            SiteStats.objects.filter(date__gte=since).delete()
+            DailyContentStats.objects.filter(date__gte=since).delete()
+            HourlyContentViews.objects.filter(hour__gte=first_view.replace(minute=0, second=0, microsecond=0)).delete()
+        RollupWatermark.objects.filter(name=PAGEVIEW_ROLLUP).delete()
+
+
+def _fold_chunk(after_id, upto_id):
+    chunk = PageView.objects.filter(id__gt=after_id, id__lte=upto_id).order_by()
+
+    # Site-wide daily totals
+    daily = (
+        chunk.annotate(date=TruncDate('viewed_at'))
+        .values('date')
+        .annotate(
+            total=Count('id'),
+            registered=Count('id', filter=Q(user__isnull=False)),
+        )
+    )
+    visits = {}
+    for date, ip_address, session_key, user_id in (
+        chunk.annotate(date=TruncDate('viewed_at'))
+        .values_list('date', 'ip_address', 'session_key', 'user_id')
+    ):
+        visits.setdefault(date, []).append((ip_address, session_key, user_id))
+
+    for row in daily:
+        stats, _ = SiteStats.objects.get_or_create(date=row['date'])
+        stats.total_views += row['total']
+        stats.registered_user_views += row['registered']
+        stats.anonymous_views += row['total'] - row['registered']
+
+        # Distinct counts aren't additive, so fold the chunk into the day's sketches
+        sketches = {field: HyperLogLog.from_bytes(getattr(stats, field)) for field in SKETCHES}
+        for visit in visits.get(row['date'], ()):
+            _add_visit(sketches, *visit)
+        for field, sketch in sketches.items():
+            setattr(stats, field, sketch.to_bytes())
+        stats.unique_ips = sketches['ip_sketch'].count()
+        stats.unique_visitors = sketches['session_sketch'].count()
+        stats.save()
+
+    # Per-content daily and hourly views
+    counted = chunk.filter(content_id__isnull=False, content_type__in=['song', 'artist', 'album'])
+    _add_content_views(DailyContentStats, 'date', counted.annotate(date=TruncDate('viewed_at')))
+    _add_content_views(HourlyContentViews, 'hour', counted.annotate(hour=TruncHour('viewed_at')))
+
+
+def _add_content_views(model, period, views):
+    """Add view counts grouped by (period, content_type, content_id) to a rollup table."""
+    rows = views.values(period, 'content_type', 'content_id').annotate(views=Count('id'))
+    deltas = {(row[period], row['content_type'], row['content_id']): row['views'] for row in rows}
+    if not deltas:
+        return
+
+    existing = {
+        (getattr(stat, period), stat.content_type, stat.content_id): stat
+        for stat in model.objects.filter(**{
+            f'{period}__in': {key[0] for key in deltas},
+            'content_id__in': {key[2] for key in deltas},
+        })
+    }
+    updated, created = [], []
+    for key, count in deltas.items():
+        stat = existing.get(key)
+        if stat:
+            stat.views += count
+            updated.append(stat)
+        else:
+            created.append(model(**{period: key[0], 'content_type': key[1], 'content_id': key[2], 'views': count}))
+    model.objects.bulk_update(updated, ['views'], batch_size=500)
+    model.objects.bulk_create(created, batch_size=500)
+
+
+def _unrolled_views():
+    """PageView rows not folded into the rollups yet."""
+    mark = RollupWatermark.objects.filter(name=PAGEVIEW_ROLLUP).first()
+    return PageView.objects.filter(id__gt=mark.last_id if mark else 0).order_by()
+
+
+def traffic_summary(now=None):
+    """View totals for today, the last 7 and 30 days and all time.
+
+    Windows are calendar days (today plus the previous 6 or 29 days), read from
+    SiteStats and topped up with rows the rollup hasn't reached yet.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    windows = {
+        'views_today': today,
+        'views_7d': today - timedelta(days=6),
+        'views_30d': today - timedelta(days=29),
+    }
+
+    # Aggregate aliases can't reuse SiteStats field names, hence the `all_` prefix
+    rolled = SiteStats.objects.aggregate(
+        all_views=Sum('total_views'),
+        all_registered=Sum('registered_user_views'),
+        all_anonymous=Sum('anonymous_views'),
+        **{name: Sum('total_views', filter=Q(date__gte=start)) for name, start in windows.items()}
+    )
+    tail = _unrolled_views().aggregate(
+        all_views=Count('id'),
+        all_registered=Count('id', filter=Q(user__isnull=False)),
+        all_anonymous=Count('id', filter=Q(user__isnull=True)),
+        **{name: Count('id', filter=Q(viewed_at__date__gte=start)) for name, start in windows.items()}
+    )
+    totals = {name: (rolled[name] or 0) + tail[name] for name in rolled}
+    return {
+        'total_views': totals['all_views'],
+        'registered_views': totals['all_registered'],
+        'anonymous_views': totals['all_anonymous'],
+        'views_today': totals['views_today'],
+        'views_7d': totals['views_7d'],
+        'views_30d': totals['views_30d'],
+    }
+
+
+def visitor_summary(now=None):
+    """Approximate distinct IPs, visitors and logged-in users per window.
+
+    Returns keys like 'unique_ips_today', 'unique_visitors_7d' and
+    'active_users_30d' for the windows today/7d/30d/total, computed by merging
+    the per-day sketches instead of running DISTINCT over PageView.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    windows = [
+        ('today', today),
+        ('7d', today - timedelta(days=6)),
+        ('30d', today - timedelta(days=29)),
+    ]
+
+    days = {}
+    for date, *blobs in SiteStats.objects.values_list('date', *SKETCHES):
+        days[date] = {field: HyperLogLog.from_bytes(blob) for field, blob in zip(SKETCHES, blobs)}
+
+    # Rows the rollup hasn't reached yet go into sketches for their own day
+    for date, *visit in (
+        _unrolled_views().annotate(date=TruncDate('viewed_at'))
+        .values_list('date', 'ip_address', 'session_key', 'user_id')
+    ):
+        if date not in days:
+            days[date] = {field: HyperLogLog() for field in SKETCHES}
+        _add_visit(days[date], *visit)
+
+    summary = {}
+    running = {field: HyperLogLog() for field in SKETCHES}
+
+    def snapshot(label):
+        for field, sketch in running.items():
+            summary[f"{SKETCHES[field]}_{label}"] = sketch.count()
+
+    # Walk days newest first, recording each window as its start date is passed
+    pending = list(windows)
+    for date in sorted(days, reverse=True):
+        while pending and date < pending[0][1]:
+            snapshot(pending.pop(0)[0])
+        for field, sketch in days[date].items():
+            running[field].merge(sketch)
+    for label, _ in pending:
+        snapshot(label)
+    snapshot('total')
+    return summary
+
+
+def top_content(content_type, limit=10, since=None):
+    """Most viewed content ids of one type as [{'content_id', 'views'}], from the daily rollup."""
+    stats = DailyContentStats.objects.filter(content_type=content_type)
+    if since is not None:
+        stats = stats.filter(date__gte=since)
+    return list(
+        stats.values('content_id')
+        .annotate(views=Sum('views'))
+        .order_by('-views', 'content_id')[:limit]
+    )
@@ -0,0 +1,122 @@
+"""Archival of old PageView rows to compressed, date-partitioned files.
+
+Rows older than the retention horizon are streamed in primary-key order into
+<archive dir>/<YYYY>/<MM>/pageviews-<YYYY-MM-DD>.jsonl.gz (one JSON object
+per line, gzip members appended per chunk) and then deleted in small batches.
+A row is only deleted after the file holding it has been fsynced, so an
+interrupted run can simply be repeated; iter_archived_page_views() skips the
+duplicates such a rerun may leave behind.
+"""
+import gzip
+import json
+import os
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics import PAGEVIEW_ROLLUP
+from .models import PageView, RollupWatermark
+
+ARCHIVED_FIELDS = (
+    'id', 'content_type', 'content_id', 'content_title', 'url', 'ip_address',
+    'user_id', 'session_key', 'user_agent', 'viewed_at',
+)
+
+
+def get_archive_dir(archive_dir=None):
+    return Path(archive_dir or getattr(settings, 'PAGEVIEW_ARCHIVE_DIR', settings.BASE_DIR / 'archive' / 'pageviews'))
+
+
+def archive_cutoff(days, now=None):
+    """Start of the first day to keep: archives always cover whole days."""
+    today = timezone.localdate(now or timezone.now())
+    return timezone.make_aware(datetime.combine(today - timedelta(days=days), time.min))
+
+
+def archive_path(archive_dir, date):
+    return archive_dir / f"{date:%Y}" / f"{date:%m}" / f"pageviews-{date:%Y-%m-%d}.jsonl.gz"
+
+
+def archive_page_views(before, archive_dir=None, chunk_size=5000, delete_batch_size=500):
+    """Move PageView rows viewed before `before` into the archive. Returns the number moved.
+
+    Rows the rollup hasn't processed yet are left alone so the daily stats
+    never miss them.
+    """
+    archive_dir = get_archive_dir(archive_dir)
+    mark = RollupWatermark.objects.filter(name=PAGEVIEW_ROLLUP).first()
+    if mark is None:
+        return 0
+
+    moved = 0
+    last_id = 0
+    while True:
+        rows = list(
+            PageView.objects.filter(viewed_at__lt=before, id__gt=last_id, id__lte=mark.last_id)
+            .order_by('id')
+            .values(*ARCHIVED_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            break
+
+        by_date = {}
+        for row in rows:
+            date = timezone.localdate(row['viewed_at'])
+            row['viewed_at'] = row['viewed_at'].isoformat()
+            by_date.setdefault(date, []).append(json.dumps(row, ensure_ascii=False))
+        for date, lines in by_date.items():
+            _append(archive_path(archive_dir, date), lines)
+
+        ids = [row['id'] for row in rows]
+        for start in range(0, len(ids), delete_batch_size):
+            # Small autocommitted deletes keep lock times short
+            PageView.objects.filter(id__in=ids[start:start + delete_batch_size]).delete()
+
+        moved += len(rows)
+        last_id = ids[-1]
+    return moved
+
+
+def _append(path, lines):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+            archive.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archived_dates(archive_dir=None):
+    """Dates that have an archive file, oldest first."""
+    archive_dir = get_archive_dir(archive_dir)
+    dates = []
+    for path in archive_dir.glob('*/*/pageviews-*.jsonl.gz'):
+        stamp = path.name[len('pageviews-'):-len('.jsonl.gz')]
+        dates.append(datetime.strptime(stamp, '%Y-%m-%d').date())
+    return sorted(dates)
+
+
+def iter_archived_page_views(start=None, end=None, archive_dir=None):
+    """Yield archived page views as dicts (PageView field values), day by day.
+
+    `start` and `end` are optional inclusive dates. viewed_at is returned as
+    an aware datetime, like a PageView row.
+    """
+    archive_dir = get_archive_dir(archive_dir)
+    for date in archived_dates(archive_dir):
+        if (start and date < start) or (end and date > end):
+            continue
+        seen = set()
+        with gzip.open(archive_path(archive_dir, date), 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                row['viewed_at'] = parse_datetime(row['viewed_at'])
+                yield row
@@ -0,0 +1,328 @@
+"""Version stamps for invalidating cached data across worker processes.
+
+A stamp lives in the Django cache and is bumped whenever the data it covers
+changes. Anything cached under an older stamp is then stale. Stamps are only
+shared between gunicorn workers when CACHE_BACKEND points at a shared backend;
+the default LocMemCache is per process.
+
+cached_value() caches an expensive computation with stale-while-revalidate:
+once it expires (or its version moves) one worker recomputes it under a
+cache lock while the others keep serving the previous value. If the
+recompute fails with a database error, the previous value is served for up
+to CACHE_STALE_IF_ERROR seconds. Like the stamps, the lock only spans
+processes on a shared cache backend.
+"""
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger(__name__)
+
+VERSION_PREFIX = 'version:'
+
+# Bumped by core.signals on any Artist, Album or Song change
+CATALOG_VERSION = 'catalog'
+
+# Bumped by core.signals and core.lyrics when lyric lines change
+LINES_VERSION = 'lines'
+
+# Bumped by core.signals when a name, slug, main artist or publish state
+# changes: everything the typeahead suggestions show (core.typeahead)
+NAMES_VERSION = 'names'
+
+# Bumped by core.charts.build_charts after replacing the chart entries
+CHARTS_VERSION = 'charts'
+
+
+def _fresh_stamp():
+    # Never equal to a stamp a worker saw before the key was evicted
+    return int(time.time() * 1000)
+
+
+# Every TieredCache in this process (see bump_version)
+_tiered_caches = weakref.WeakSet()
+
+
+def get_version(name, backend=None):
+    """Current stamp for `name` (in `backend`, default the default cache)."""
+    backend = backend or cache
+    key = VERSION_PREFIX + name
+    version = backend.get(key)
+    if version is None:
+        backend.add(key, _fresh_stamp(), timeout=None)
+        version = backend.get(key)
+    return version
+
+
+def bump_version(name, backend=None):
+    """Mark everything cached under `name` as stale."""
+    backend = backend or cache
+    key = VERSION_PREFIX + name
+    # This process sees its own bumps straight away; other processes within their check_interval
+    for tiered in list(_tiered_caches):
+        tiered.forget_stamp(name)
+    try:
+        return backend.incr(key)
+    except ValueError:
+        # Evicted or never set
+        backend.set(key, _fresh_stamp(), timeout=None)
+        return backend.get(key)
+
+
+def is_shared(backend=None):
+    """Whether `backend` (default the default cache) is seen by every worker process."""
+    # `cache` is a proxy; check the backend behind it
+    return not isinstance(backend or caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def bump_version_on_commit(name):
+    """Bump now and again once the current transaction commits.
+
+    The second bump stops readers from re-caching pre-commit data under the
+    new stamp; outside a transaction it simply runs straight away.
+    """
+    bump_version(name)
+    transaction.on_commit(lambda: bump_version(name))
+
+
+class VersionedValue:
+    """A per-process value rebuilt when its version stamp moves.
+
+    The stamp is re-read at most every `check_interval` seconds, so hot paths
+    don't hit the shared cache on every call either.
+    """
+
+    def __init__(self, name, build, check_interval=2.0):
+        self.name = name
+        self.build = build
+        self.check_interval = check_interval
+        self._value = None
+        self._version = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._value is not None and now < self._next_check:
+            return self._value
+        with self._lock:
+            if self._value is None or time.monotonic() >= self._next_check:
+                version = get_version(self.name)
+                if self._value is None or version != self._version:
+                    self._value = self.build()
+                    self._version = version
+                self._next_check = time.monotonic() + self.check_interval
+            return self._value
+
+    def invalidate(self):
+        """Force a stamp check on the next get() in this process."""
+        self._next_check = 0.0
+
+
+class _CachedNone:
+    """Stored for a cached None, which a cache backend's get() can't tell from a miss."""
+
+    def __reduce__(self):
+        return '_CACHED_NONE'  # Unpickles to the same instance
+
+
+_CACHED_NONE = _CachedNone()
+_MISSING = object()
+
+
+class TieredCache:
+    """A bounded per-process LRU with TTL in front of a shared Django cache.
+
+    For small values read on nearly every request. Keys may be versioned by
+    a stamp name: the stamp is part of the key in both tiers and re-read from
+    the shared tier at most every `check_interval` seconds, so a bump
+    anywhere retires local entries everywhere within that interval, without
+    any messaging between processes. Local entries also expire after
+    `local_timeout` seconds. When the shared tier is per process too (e.g.
+    LocMemCache), stamps bumped in other workers are never seen, so entries
+    there are held no longer than `local_timeout` either. None is a value
+    like any other. Hits and misses are counted per tier, per process.
+    """
+
+    def __init__(self, shared=None, max_entries=1000, local_timeout=30.0, check_interval=2.0):
+        self._shared = shared
+        self.max_entries = max_entries
+        self.local_timeout = local_timeout
+        self.check_interval = check_interval
+        self._local = OrderedDict()  # Full key -> (expires at, value), least recently used first
+        self._stamps = {}  # Stamp name -> (stamp, next check)
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(('local_hit', 'local_miss', 'shared_hit', 'shared_miss'), 0)
+        _tiered_caches.add(self)
+
+    @property
+    def shared(self):
+        return self._shared if self._shared is not None else cache
+
+    def _stamp(self, name):
+        now = time.monotonic()
+        stamp, next_check = self._stamps.get(name, (None, 0.0))
+        if now >= next_check:
+            stamp = get_version(name, self.shared)
+            self._stamps[name] = (stamp, now + self.check_interval)
+        return stamp
+
+    def forget_stamp(self, name):
+        self._stamps.pop(name, None)
+
+    def _key(self, key, version):
+        return f"{key}@{version}:{self._stamp(version)}" if version else key
+
+    def _store_local(self, full_key, value, timeout):
+        local_timeout = self.local_timeout if timeout is None else min(self.local_timeout, timeout)
+        with self._lock:
+            self._local[full_key] = (time.monotonic() + local_timeout, value)
+            self._local.move_to_end(full_key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key, default=None, version=None):
+        full_key = self._key(key, version)
+        with self._lock:
+            entry = self._local.get(full_key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._local.move_to_end(full_key)
+                self._counts['local_hit'] += 1
+                return entry[1]
+            self._local.pop(full_key, None)
+            self._counts['local_miss'] += 1
+
+        value = self.shared.get(full_key)
+        if value is None:
+            self._counts['shared_miss'] += 1
+            return default
+        self._counts['shared_hit'] += 1
+        if value is _CACHED_NONE:
+            value = None
+        self._store_local(full_key, value, None)
+        return value
+
+    def set(self, key, value, timeout=300, version=None):
+        full_key = self._key(key, version)
+        shared_timeout = timeout
+        if not is_shared(self._shared):
+            shared_timeout = self.local_timeout if timeout is None else min(self.local_timeout, timeout)
+        self.shared.set(full_key, _CACHED_NONE if value is None else value, shared_timeout)
+        self._store_local(full_key, value, timeout)
+
+    def get_or_set(self, key, build, timeout=300, version=None):
+        value = self.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            value = build()
+            self.set(key, value, timeout, version=version)
+        return value
+
+    def delete(self, key, version=None):
+        full_key = self._key(key, version)
+        self.shared.delete(full_key)
+        with self._lock:
+            self._local.pop(full_key, None)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+            self._stamps.clear()
+
+    def stats(self):
+        """{'local': ..., 'shared': ...} hits, misses and hit rate (%) of each tier in this process."""
+        counts = dict(self._counts)
+        return {
+            tier: {
+                'hits': counts[f'{tier}_hit'],
+                'misses': counts[f'{tier}_miss'],
+                'hit_rate': _hit_rate(counts[f'{tier}_hit'], counts[f'{tier}_miss']),
+            }
+            for tier in ('local', 'shared')
+        }
+
+
+# Shared by the hot read paths (e.g. core.conditional's catalog-wide stamps)
+tiered_cache = TieredCache(
+    max_entries=getattr(settings, 'LOCAL_CACHE_MAX_ENTRIES', 1000),
+    local_timeout=getattr(settings, 'LOCAL_CACHE_TIMEOUT', 30.0),
+)
+
+
+def cached_value(key, build, timeout, version=None, lock_timeout=30, wait=5.0):
+    """(value, fresh) of `build()`, cached under `key` for `timeout` seconds.
+
+    A value built under a different `version` counts as expired. An expired
+    value is rebuilt by one caller at a time; the rest get it back with
+    fresh=False for up to CACHE_STALE_TIMEOUT seconds past expiry. With
+    nothing to serve, callers wait up to `wait` seconds for the one building
+    it before building it themselves.
+    """
+    stale_timeout = getattr(settings, 'CACHE_STALE_TIMEOUT', 300)
+    error_timeout = getattr(settings, 'CACHE_STALE_IF_ERROR', 3600)
+    lock_key = f"lock:{key}"
+    deadline = time.monotonic() + wait
+    while True:
+        entry = cache.get(key)
+        now = time.time()
+        if entry is not None and entry['version'] == version and now < entry['fresh_until']:
+            return entry['value'], True
+        locked = cache.add(lock_key, 1, lock_timeout)
+        if locked:
+            break
+        if entry is not None and now < entry['fresh_until'] + stale_timeout:
+            return entry['value'], False
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.05)
+
+    try:
+        value = build()
+    except DatabaseError:
+        if entry is not None and now < entry['fresh_until'] + error_timeout:
+            logger.warning("Serving stale %s: rebuild failed", key, exc_info=True)
+            return entry['value'], False
+        raise
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    cache.set(key, {'value': value, 'version': version, 'fresh_until': time.time() + timeout},
+              timeout + max(stale_timeout, error_timeout))
+    return value, True
+
+
+def count_event(name):
+    """Increment a shared counter (e.g. cache hits), kept in the cache without expiry."""
+    key = f"counter:{name}"
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def get_counts(*names):
+    counts = cache.get_many([f"counter:{name}" for name in names])
+    return {name: counts.get(f"counter:{name}", 0) for name in names}
+
+
+def hit_rate_stats(hit, miss):
+    """{'hits', 'misses', 'hit_rate'} of a pair of counters; hit_rate is a percentage or None."""
+    counts = get_counts(hit, miss)
+    return {
+        'hits': counts[hit],
+        'misses': counts[miss],
+        'hit_rate': _hit_rate(counts[hit], counts[miss]),
+    }
+
+
+def _hit_rate(hits, misses):
+    return round(100 * hits / (hits + misses), 1) if hits + misses else None
@@ -0,0 +1,151 @@
+"""Chart engine: ranks songs, artists and albums from the hourly view buckets.
+
+build_charts() computes the daily, weekly and monthly charts from
+HourlyContentViews, the all-time chart from ContentViewCounter and a
+'trending' chart whose score decays each hour's views exponentially with age.
+The results replace the rows in ChartEntry, which is all the homepage reads.
+resolve_chart() turns ranked (content_type, content_id, views) keys back into
+objects for display.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .analytics import top_content
+from .caching import CHARTS_VERSION, bump_version
+from .models import Album, Artist, ChartEntry, ContentViewCounter, HourlyContentViews, Song
+from .tracking import COUNTED_TYPES, describe_content
+
+CHART_SIZE = 50
+
+# Sliding windows over the hourly buckets
+CHART_WINDOWS = {
+    'daily': timedelta(hours=24),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+}
+
+TRENDING_WINDOW = timedelta(days=7)
+TRENDING_HALF_LIFE = timedelta(hours=24)  # A view counts half as much a day later
+
+# Hourly buckets are only needed for the longest window
+HOURLY_RETENTION = timedelta(days=31)
+
+# What chart keys resolve against; objects these exclude silently drop out
+CHART_QUERYSETS = {
+    'song': lambda: Song.objects.filter(is_published=True).select_related('artist', 'album'),
+    'artist': lambda: Artist.objects.all(),
+    'album': lambda: Album.objects.select_related('artist'),
+}
+
+
+def build_charts(now=None, size=CHART_SIZE):
+    """Recompute every chart and replace the materialized ChartEntry rows."""
+    now = now or timezone.now()
+    entries = []
+    for content_type in COUNTED_TYPES:
+        hourly = HourlyContentViews.objects.filter(content_type=content_type)
+
+        for chart, window in CHART_WINDOWS.items():
+            rows = (
+                hourly.filter(hour__gt=now - window)
+                .values('content_id')
+                .annotate(total=Sum('views'))
+                .order_by('-total', 'content_id')[:size]
+            )
+            entries += _entries(chart, content_type, [
+                (row['content_id'], row['total'], row['total']) for row in rows
+            ], now)
+
+        all_time = (
+            ContentViewCounter.objects.filter(content_type=content_type, views__gt=0)
+            .order_by('-views', 'content_id')
+            .values_list('content_id', 'views')[:size]
+        )
+        entries += _entries('all_time', content_type, [
+            (content_id, views, views) for content_id, views in all_time
+        ], now)
+
+        entries += _entries('trending', content_type, trending(content_type, now, size), now)
+
+    with transaction.atomic():
+        ChartEntry.objects.all().delete()
+        ChartEntry.objects.bulk_create(entries, batch_size=500)
+        HourlyContentViews.objects.filter(hour__lt=now - HOURLY_RETENTION).delete()
+    bump_version(CHARTS_VERSION)
+    return len(entries)
+
+
+def trending(content_type, now, size=CHART_SIZE):
+    """[(content_id, views, score)] ranked by exponentially time-decayed views."""
+    scores, views = {}, {}
+    rows = (
+        HourlyContentViews.objects.filter(content_type=content_type, hour__gt=now - TRENDING_WINDOW)
+        .values_list('content_id', 'hour', 'views')
+    )
+    half_life = TRENDING_HALF_LIFE.total_seconds()
+    for content_id, hour, count in rows:
+        age = max((now - hour).total_seconds(), 0)
+        scores[content_id] = scores.get(content_id, 0.0) + count * 0.5 ** (age / half_life)
+        views[content_id] = views.get(content_id, 0) + count
+    ranked = sorted(scores, key=lambda content_id: (-scores[content_id], content_id))[:size]
+    return [(content_id, views[content_id], scores[content_id]) for content_id in ranked]
+
+
+def _entries(chart, content_type, ranked, now):
+    return [
+        ChartEntry(
+            chart=chart, content_type=content_type, rank=rank, content_id=content_id,
+            views=views, score=score, computed_at=now,
+        )
+        for rank, (content_id, views, score) in enumerate(ranked, start=1)
+    ]
+
+
+def chart_entries(chart, content_types=COUNTED_TYPES):
+    """Materialized entries of one chart, grouped by content type and in rank order."""
+    grouped = {content_type: [] for content_type in content_types}
+    for entry in ChartEntry.objects.filter(chart=chart, content_type__in=content_types):
+        grouped[entry.content_type].append(entry)
+    return grouped
+
+
+def resolve_chart(keys, limit=None):
+    """Objects for ranked chart keys, fetched with one query per content type.
+
+    `keys` are ChartEntry rows or (content_type, content_id, views) tuples.
+    Rank order is kept and missing or unpublished items are dropped. Each
+    object gets `chart_views` and a display `chart_title`.
+    """
+    keys = [
+        (key.content_type, key.content_id, key.views) if isinstance(key, ChartEntry) else tuple(key)
+        for key in keys
+    ]
+    ids = {}
+    for content_type, content_id, _ in keys:
+        if content_type in CHART_QUERYSETS:
+            ids.setdefault(content_type, set()).add(content_id)
+    objects = {
+        content_type: CHART_QUERYSETS[content_type]().in_bulk(list(type_ids))
+        for content_type, type_ids in ids.items()
+    }
+
+    resolved = []
+    for content_type, content_id, views in keys:
+        obj = objects.get(content_type, {}).get(content_id)
+        if obj is None:
+            continue
+        obj.chart_views = views
+        obj.chart_title = describe_content(obj)
+        resolved.append(obj)
+        if limit and len(resolved) >= limit:
+            break
+    return resolved
+
+
+def resolve_top_content(content_type, limit=10, since=None):
+    """Most viewed objects of one type from the daily rollups, resolved for display."""
+    rows = top_content(content_type, limit=limit, since=since)
+    return resolve_chart([(content_type, row['content_id'], row['views']) for row in rows])
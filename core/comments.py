@@ -0,0 +1,44 @@
+"""Comment threads of song and artist pages.
+
+A page renders only the newest COMMENTS_PER_PAGE comments of its thread. The
+rest load on demand from the comment_thread view, one keyset page (core.pagination)
+at a time, newest first by created_at and id. Posting to the same view
+returns just the new comment's markup. Song.comment_count and
+Artist.comment_count are kept by core.signals, so a page view never counts
+the thread.
+"""
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+
+from .forms import ArtistCommentForm, SongCommentForm
+from .models import Artist, Song
+from .pagination import paginate_keyset
+
+COMMENTS_PER_PAGE = 20
+CURSOR_PARAM = 'c'
+
+# Content type: (commented model, comment form, comment's foreign key to the model)
+COMMENT_TYPES = {
+    'song': (Song, SongCommentForm, 'song'),
+    'artist': (Artist, ArtistCommentForm, 'artist'),
+}
+
+
+def comment_page(obj, params):
+    """Keyset page of `obj`'s comments addressed by params[CURSOR_PARAM], newest first."""
+    comments = obj.comments.select_related('user').order_by('-created_at', '-id')
+    return paginate_keyset(comments, params, CURSOR_PARAM, per_page=COMMENTS_PER_PAGE)
+
+
+def render_comments(comments):
+    return render_to_string('partials/comment_list.html', {'comments': comments})
+
+
+def rebuild_comment_counts(model, comment_model, key):
+    """Recount comment_count of every row of `model` from `comment_model`, whose foreign key to it is `key`."""
+    counts = (
+        comment_model.objects.filter(**{key: OuterRef('pk')}).order_by()
+        .values(key).annotate(count=Count('pk')).values('count')
+    )
+    model.objects.update(comment_count=Coalesce(Subquery(counts), 0))
@@ -0,0 +1,223 @@
+"""Conditional GET (ETag / Last-Modified / 304) and the page cache for catalog pages.
+
+Each detail and index page has a validator: a few aggregate queries over the
+rows it shows, returning their updated_at and row counts. Song.updated_at
+also moves when lines, artist credits or comments are edited (core.lyrics,
+core.signals).
+Counts catch deletions. The table-wide stamps of index and chart pages are
+held in core.caching.tiered_cache between catalog edits. The ETag hashes
+every part. Last-Modified is the latest timestamp, and django's condition()
+answers If-None-Match and If-Modified-Since with a 304 before the view body
+or any template work runs.
+Responses carry Cache-Control: no-cache so browsers revalidate each visit.
+
+Otherwise the rendered response is cached under the path and the ETag for
+PAGE_CACHE_TIMEOUT seconds. Any change to a row the page shows changes the
+ETag, so a cached page is never served after its content changed. The
+timeout only bounds how stale its view count gets. Validators set
+request.tracked_object, so PageViewMiddleware records 304s and cache hits
+like any other view.
+
+Pages are rendered the same for every visitor; per-user state (header,
+favorites, ratings, CSRF tokens) is filled in by static/js/user_state.js
+(see core.userstate). So signed-in users get 304s and cache hits too. Only
+GET/HEAD requests without pending flash messages are validated or cached.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Q
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .caching import CATALOG_VERSION, CHARTS_VERSION, count_event, hit_rate_stats, tiered_cache
+from .models import Album, Artist, ChartEntry, Song
+
+
+def _stamp(queryset):
+    """(row count, latest updated_at) of `queryset`."""
+    result = queryset.aggregate(count=Count('pk', distinct=True), latest=Max('updated_at'))
+    return result['count'], result['latest']
+
+
+def _comments_stamp(obj):
+    """(comment count, newest comment id) of a song or artist.
+
+    The count is stored on the row and the newest comment is the first entry
+    of the thread index, so long threads cost no more than short ones.
+    Comment edits move the owner's updated_at instead (core.signals).
+    """
+    newest = obj.comments.order_by('-created_at', '-id').values_list('id', flat=True).first()
+    return obj.comment_count, newest
+
+
+def _table_stamp(name, queryset):
+    """_stamp() of a catalog-wide queryset, held in the tiered cache under the catalog version.
+
+    Index and chart pages ask for these on every request; a catalog edit
+    bumps the stamp, so they are only aggregated again after one.
+    """
+    return tiered_cache.get_or_set(f"stamp:{name}", lambda: _stamp(queryset), version=CATALOG_VERSION)
+
+
+def _published_songs_stamp():
+    return _table_stamp('songs', Song.objects.filter(is_published=True))
+
+
+def _artists_stamp():
+    return _table_stamp('artists', Artist.objects.all())
+
+
+def _albums_stamp():
+    return _table_stamp('albums', Album.objects.all())
+
+
+def conditional_page(validator):
+    """Decorate a view so GETs are answered from `validator(request, **kwargs)`.
+
+    The validator returns the parts the page depends on (datetimes and
+    _stamp() tuples), or None to render the page as usual (e.g. a 404).
+    """
+    def parts(request, *args, **kwargs):
+        if not hasattr(request, '_page_validator'):
+            request._page_validator = None
+            # Pending flash messages are part of the page too
+            if request.method in ('GET', 'HEAD') and not get_messages(request):
+                request._page_validator = validator(request, *args, **kwargs)
+        return request._page_validator
+
+    def etag(request, *args, **kwargs):
+        if not hasattr(request, '_page_etag'):
+            page_parts = parts(request, *args, **kwargs)
+            request._page_etag = None
+            if page_parts is not None:
+                salted = [getattr(settings, 'PAGE_MARKUP_VERSION', ''), *page_parts]
+                request._page_etag = hashlib.sha1(repr(salted).encode('utf-8')).hexdigest()
+        return request._page_etag
+
+    def last_modified(request, *args, **kwargs):
+        page_parts = parts(request, *args, **kwargs)
+        if page_parts is None:
+            return None
+        times = [part[1] if isinstance(part, tuple) else part for part in page_parts]
+        times = [time for time in times if isinstance(time, datetime)]
+        return max(times) if times else None
+
+    def decorator(view):
+        @wraps(view)
+        def cached_view(request, *args, **kwargs):
+            page_etag = etag(request, *args, **kwargs)
+            timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+            if page_etag is None or not timeout:
+                return view(request, *args, **kwargs)
+
+            path = hashlib.sha1(request.get_full_path().encode('utf-8')).hexdigest()
+            key = f"page:{path}:{page_etag}"
+            response = cache.get(key)
+            if response is not None:
+                count_event('page_cache_hit')
+                return response
+
+            count_event('page_cache_miss')
+            response = view(request, *args, **kwargs)
+            # A page that rendered a CSRF token is tied to this visitor's cookie, and one
+            # built from stale data (see caching.cached_value) isn't the page the ETag names
+            if (response.status_code == 200 and not response.streaming
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+                    and not getattr(request, 'stale_page', False)):
+                cache.set(key, response, timeout)
+            return response
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(cached_view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if getattr(request, 'stale_page', False):
+                del response['ETag']
+                del response['Last-Modified']
+            if getattr(request, '_page_validator', None) is not None:
+                # Revalidate on every visit instead of trusting heuristic freshness
+                patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def page_cache_stats():
+    return hit_rate_stats('page_cache_hit', 'page_cache_miss')
+
+
+def charts_page(request):
+    computed_at = tiered_cache.get_or_set(
+        "stamp:charts", lambda: ChartEntry.objects.aggregate(computed_at=Max('computed_at'))['computed_at'],
+        version=CHARTS_VERSION,
+    )
+    return [
+        request.GET.get('chart', ''), computed_at,
+        _published_songs_stamp(), _artists_stamp(), _albums_stamp(),
+    ]
+
+
+def song_page(request, artist, song):
+    s = (
+        Song.objects.select_related('artist', 'album').defer('lyrics_payload')
+        .filter(artist__slug=artist, slug=song, is_published=True).first()
+    )
+    if s is None:
+        return None
+    request.tracked_object = s  # Still recorded when the page is answered with a 304
+    return [
+        s.updated_at, s.artist.updated_at, s.album.updated_at if s.album else None,
+        _stamp(Artist.objects.filter(song_credits__song=s)),
+        _comments_stamp(s),
+        (s.rating_count, s.rating_sum),
+    ]
+
+
+def artist_page(request, artist):
+    a = Artist.objects.filter(slug=artist).first()
+    if a is None:
+        return None
+    request.tracked_object = a
+    return [
+        a.updated_at,
+        _stamp(Song.objects.filter(credits__artist=a, is_published=True)),
+        # Co-credited artists are named and linked on the song cards
+        _stamp(Artist.objects.filter(song_credits__song__credits__artist=a, song_credits__song__is_published=True)),
+        _comments_stamp(a),
+        (a.rating_count, a.rating_sum),
+    ]
+
+
+def album_page(request, artist, album):
+    alb = Album.objects.select_related('artist').filter(artist__slug=artist, slug=album).first()
+    if alb is None:
+        return None
+    request.tracked_object = alb
+    return [
+        alb.updated_at, alb.artist.updated_at,
+        _stamp(alb.songs.filter(is_published=True)),
+        # Every artist credited on the album or one of its songs is named on the page
+        _stamp(Artist.objects.filter(
+            Q(album_credits__album=alb) | Q(song_credits__song__album=alb, song_credits__song__is_published=True)
+        )),
+    ]
+
+
+def artists_index_page(request):
+    return [_artists_stamp()]
+
+
+def albums_index_page(request):
+    return [_albums_stamp(), _artists_stamp()]
+
+
+def songs_index_page(request):
+    return [_published_songs_stamp(), _artists_stamp(), _albums_stamp()]
@@ -0,0 +1,102 @@
+"""Artist credits of songs and albums, in one ordered table each.
+
+Song.artist, Song.additional_artists and Song.featured_artists (Album.artist
+and Album.additional_artists) stay the editable source of truth, e.g. in the
+admin. Whenever they change, core.signals rewrites the song's SongCredit (the
+album's AlbumCredit) rows: main artist first, then additional, then featured
+artists in the order they were linked. Pages then read every credit of a list
+of songs with one prefetch (`Song.objects.with_credits()`), and
+Song.get_artist_display() and friends build from it.
+
+An artist's discography is likewise one ordered, paged query over their
+credits (discography()), whatever role they had on each song.
+
+Migration 0025 fills the tables for existing rows; `manage.py sync_credits`
+does the same for rows written without signals (e.g. bulk_create).
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import Coalesce
+
+from .models import Album, AlbumCredit, Song, SongCredit
+from .pagination import paginate_keyset
+
+BATCH_SIZE = 500
+
+DISCOGRAPHY_PER_PAGE = 48
+DISCOGRAPHY_PARAM = 'p'
+
+
+def sync_song_credits(song_ids):
+    _sync(Song, SongCredit, 'song', song_ids)
+
+
+def sync_album_credits(album_ids):
+    _sync(Album, AlbumCredit, 'album', album_ids)
+
+
+def sync_all_credits(song_model, song_credit_model, album_model, album_credit_model, batch_size=BATCH_SIZE):
+    """Rewrite every credit, in batches."""
+    for model, credit_model, owner in (
+        (song_model, song_credit_model, 'song'),
+        (album_model, album_credit_model, 'album'),
+    ):
+        ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            _sync(model, credit_model, owner, ids[start:start + batch_size])
+
+
+def _sync(model, credit_model, owner, ids):
+    ids = list(ids)
+    credited = {
+        pk: [('main', artist_id)]
+        for pk, artist_id in model.objects.filter(pk__in=ids).values_list('pk', 'artist_id')
+    }
+    # Albums have no featured artists
+    for role, relation in (('additional', 'additional_artists'), ('featured', 'featured_artists')):
+        if not hasattr(model, relation):
+            continue
+        through = getattr(model, relation).through
+        links = (
+            through.objects.filter(**{f"{owner}_id__in": ids})
+            .order_by('pk').values_list(f"{owner}_id", 'artist_id')
+        )
+        for pk, artist_id in links:
+            if pk in credited:
+                credited[pk].append((role, artist_id))
+
+    rows = [
+        credit_model(**{f"{owner}_id": pk}, artist_id=artist_id, role=role, position=position)
+        for pk, credits in credited.items()
+        for position, (role, artist_id) in enumerate(credits)
+    ]
+    with transaction.atomic():
+        credit_model.objects.filter(**{f"{owner}_id__in": ids}).delete()
+        credit_model.objects.bulk_create(rows)
+
+
+def discography(artist, params):
+    """(keyset page, summary) of the published songs `artist` is credited on, newest first.
+
+    Page items are SongCredits with their song, its album and main artist
+    loaded; `role` tells a main, additional or featured appearance. The
+    summary holds the number of songs, the count per role and the year range,
+    aggregated by the database.
+    """
+    credits = SongCredit.objects.filter(artist=artist, song__is_published=True)
+    summary = credits.aggregate(
+        songs=Count('song', distinct=True),
+        main=Count('pk', filter=Q(role='main')),
+        additional=Count('pk', filter=Q(role='additional')),
+        featured=Count('pk', filter=Q(role='featured')),
+        year_min=Min('song__year'),
+        year_max=Max('song__year'),
+    )
+    page = paginate_keyset(
+        credits.select_related('song__artist', 'song__album').defer('song__lyrics_payload')
+        # Songs without a year go last
+        .annotate(sort_year=Coalesce('song__year', 0))
+        .order_by('-sort_year', 'song__title', 'pk'),
+        params, DISCOGRAPHY_PARAM, per_page=DISCOGRAPHY_PER_PAGE,
+    )
+    return page, summary
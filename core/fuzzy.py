@@ -0,0 +1,329 @@
+"""Trigram fuzzy matching for romanized lyrics and catalog names.
+
+Romanized Punjabi is spelled many ways ("mehnat", "mehnaat", "mihnat"), so
+exact matching misses most of them. Each distinct word of Line.romanized,
+and each song title, artist name and album title (whole and word by word), is
+stored once as a FuzzyTerm with postings from its character trigrams. The
+trigrams are built the way pg_trgm builds them: every word is padded with two
+leading spaces and one trailing space.
+
+Terms are scored by trigram Jaccard similarity, the same measure pg_trgm's
+similarity() uses. The vocabulary grows far more slowly than the number of
+lines, but a lookup still groups every posting of the query's trigrams, so
+its cost grows with the vocabulary. Each lookup query therefore gets a time
+budget (FUZZY_SEARCH_TIMEOUT): words not matched within it are only searched
+for exactly. The index works the same on SQLite and PostgreSQL.
+
+FuzzyTerm.line_count counts the lyric lines a word is in. Together with the
+term's occurrences it tells when nothing uses a term any more; such terms are
+pruned as lines and names are deleted or changed, and a rebuild starts over.
+"""
+import logging
+import math
+import time
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from .models import Album, Artist, FuzzyTerm, FuzzyTermOccurrence, FuzzyTrigram, Line, Song
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = 0.3  # pg_trgm's default
+MAX_QUERY_WORDS = 6  # Later words of long queries aren't fuzzy matched
+MAX_CANDIDATES = 200  # Terms scored per query word
+MAX_VARIANTS = 10  # Spellings a query word expands to in lyric search
+
+# Field each content type is indexed by
+NAME_FIELDS = {'song': 'title', 'artist': 'name', 'album': 'title'}
+NAME_MODELS = {'song': Song, 'artist': Artist, 'album': Album}
+
+
+def normalize(text):
+    """Lowercased words of `text`, anything but letters, digits and marks collapsed to single spaces."""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    kept = ''.join(ch if ch.isalnum() or unicodedata.category(ch).startswith('M') else ' ' for ch in text)
+    return ' '.join(kept.split())[:255].strip()
+
+
+def trigrams(text):
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """Trigram Jaccard similarity of two strings, as pg_trgm's similarity()."""
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def similar_terms(text, threshold=SIMILARITY_THRESHOLD, limit=MAX_CANDIDATES):
+    """[(term id, term text, similarity)] of indexed terms nearest to `text`, best first."""
+    grams = trigrams(text)
+    if not grams:
+        return []
+    # A term sharing n of the query's trigrams scores at most n / len(grams)
+    min_shared = max(1, math.ceil(threshold * len(grams)))
+    rows = (
+        FuzzyTrigram.objects.filter(trigram__in=grams)
+        .values('term_id', 'term__text', 'term__trigram_count')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=min_shared)
+        .order_by('-shared', 'term_id')[:limit]
+    )
+    scored = []
+    for row in rows:
+        score = row['shared'] / (len(grams) + row['term__trigram_count'] - row['shared'])
+        if score >= threshold:
+            scored.append((row['term_id'], row['term__text'], score))
+    scored.sort(key=lambda term: (-term[2], term[1]))
+    return scored
+
+
+@contextmanager
+def time_limit(milliseconds):
+    """Cancel any database query run inside that takes over `milliseconds` (OperationalError).
+
+    Uses statement_timeout on PostgreSQL and a progress handler on SQLite;
+    other databases, and a limit of 0, run unbounded.
+    """
+    if not milliseconds or connection.vendor not in ('postgresql', 'sqlite'):
+        yield
+        return
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(milliseconds))])
+            yield
+            # Outlives the savepoint otherwise; a cancelled query rolls it back anyway
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout TO DEFAULT")
+        return
+    # Like statement_timeout, the clock restarts with every query, not on connecting
+    connection.ensure_connection()
+    deadline = [math.inf]
+
+    def start_clock(execute, sql, params, many, context):
+        deadline[0] = time.monotonic() + milliseconds / 1000
+        return execute(sql, params, many, context)
+
+    connection.connection.set_progress_handler(lambda: time.monotonic() > deadline[0], 1000)
+    try:
+        with connection.execute_wrapper(start_clock):
+            yield
+    finally:
+        connection.connection.set_progress_handler(None, 0)
+
+
+class FuzzyQuery:
+    """Trigram lookup of one search query, shared by every kind of result."""
+
+    def __init__(self, q, threshold=SIMILARITY_THRESHOLD):
+        self.query = normalize(q)
+        self.threshold = threshold
+        self.words = list(dict.fromkeys(self.query.split()))[:MAX_QUERY_WORDS]
+        parts = self.words if len(self.words) == 1 else [self.query] + self.words
+        # Parts not looked up within the budget match nothing fuzzily
+        self.similar = dict.fromkeys(parts, [])
+        try:
+            with time_limit(getattr(settings, 'FUZZY_SEARCH_TIMEOUT', 100)):
+                for part in parts:
+                    self.similar[part] = similar_terms(part, threshold)
+        except OperationalError:
+            logger.warning("Fuzzy lookup of %r ran out of time", self.query)
+
+    def variants(self):
+        """{query word: [indexed single-word spellings, best first]}"""
+        return {
+            word: [text for _, text, _ in self.similar[word] if ' ' not in text][:MAX_VARIANTS]
+            for word in self.words
+        }
+
+    def matches(self, content_type, limit=20):
+        """[(object id, similarity)] of songs, artists or albums whose title or name is nearest, best first.
+
+        An object scores the better of its whole-title similarity and the mean
+        over query words of their best match among its title's words.
+        """
+        if not self.words:
+            return []
+        term_scores = {}
+        for part, terms in self.similar.items():
+            for term_id, _, score in terms:
+                term_scores.setdefault(term_id, {})[part] = score
+
+        best = {}
+        occurrences = FuzzyTermOccurrence.objects.filter(
+            content_type=content_type, term_id__in=list(term_scores)
+        ).values_list('object_id', 'term_id')
+        for object_id, term_id in occurrences:
+            scores = best.setdefault(object_id, {})
+            for part, score in term_scores[term_id].items():
+                scores[part] = max(scores.get(part, 0.0), score)
+
+        results = []
+        for object_id, scores in best.items():
+            by_word = sum(scores.get(word, 0.0) for word in self.words) / len(self.words)
+            score = max(scores.get(self.query, 0.0), by_word)
+            if score >= self.threshold:
+                results.append((object_id, score))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
+
+
+def with_fuzzy_matches(queryset, exact, matches, *ordering):
+    """`queryset` narrowed to `exact` plus fuzzy `matches`: exact hits first, then by similarity."""
+    ids = [object_id for object_id, _ in matches]
+    match_order = Case(
+        When(exact, then=Value(0)),
+        *[When(pk=object_id, then=Value(position)) for position, object_id in enumerate(ids, start=1)],
+        default=Value(len(ids) + 1),
+        output_field=IntegerField(),
+    )
+    return (
+        queryset.filter(exact | Q(pk__in=ids))
+        .annotate(match_order=match_order)
+        .order_by('match_order', *ordering)
+    )
+
+
+def index_terms(texts):
+    """Add texts to the vocabulary with their trigram postings. Returns {normalized text: term id}."""
+    texts = {normalize(text) for text in texts} - {''}
+    term_ids = {}
+    for chunk in _chunks(sorted(texts)):
+        term_ids.update(FuzzyTerm.objects.filter(text__in=chunk).values_list('text', 'id'))
+        new = [text for text in chunk if text not in term_ids]
+        if not new:
+            continue
+        FuzzyTerm.objects.bulk_create(
+            [FuzzyTerm(text=text, trigram_count=len(trigrams(text))) for text in new],
+            ignore_conflicts=True,
+        )
+        created = dict(FuzzyTerm.objects.filter(text__in=new).values_list('text', 'id'))
+        FuzzyTrigram.objects.bulk_create(
+            [FuzzyTrigram(trigram=gram, term_id=term_id) for text, term_id in created.items() for gram in trigrams(text)],
+            batch_size=1000, ignore_conflicts=True,
+        )
+        term_ids.update(created)
+    return term_ids
+
+
+def name_terms(name):
+    """Terms a title or name is indexed under: the whole of it and each word."""
+    name = normalize(name)
+    return {name, *name.split()} - {''}
+
+
+def index_object(content_type, object_id, name):
+    """(Re)index the title or name of one song, artist or album."""
+    with transaction.atomic():
+        previous = _remove_occurrences(content_type, object_id)
+        term_ids = index_terms(name_terms(name))
+        FuzzyTermOccurrence.objects.bulk_create([
+            FuzzyTermOccurrence(term_id=term_id, content_type=content_type, object_id=object_id)
+            for term_id in term_ids.values()
+        ], ignore_conflicts=True)
+        prune_terms(id__in=previous - set(term_ids.values()))
+
+
+def unindex_object(content_type, object_id):
+    with transaction.atomic():
+        prune_terms(id__in=_remove_occurrences(content_type, object_id))
+
+
+def _remove_occurrences(content_type, object_id):
+    """Delete one object's occurrences. Returns the ids of their terms."""
+    occurrences = FuzzyTermOccurrence.objects.filter(content_type=content_type, object_id=object_id)
+    term_ids = set(occurrences.values_list('term_id', flat=True))
+    occurrences.delete()
+    return term_ids
+
+
+def index_line_words(texts):
+    """Add the words of romanized lyric lines to the vocabulary, counting the lines."""
+    counts = _line_word_counts(texts)
+    with transaction.atomic():
+        index_terms(counts)
+        _add_line_counts(counts, 1)
+
+
+def unindex_line_words(texts):
+    """Take the words of deleted (or changed) lines back out, pruning those no line uses any more."""
+    counts = _line_word_counts(texts)
+    with transaction.atomic():
+        _add_line_counts(counts, -1)
+        for chunk in _chunks(sorted(counts)):
+            prune_terms(text__in=chunk)
+
+
+def prune_terms(**filters):
+    """Delete the terms among `filters` that are in no lyric line and no title or name."""
+    FuzzyTerm.objects.filter(line_count=0, occurrences__isnull=True, **filters).delete()
+
+
+def _line_word_counts(texts):
+    """Counter of normalized words: the number of the given lines each is in."""
+    counts = Counter()
+    for text in texts:
+        counts.update(set(normalize(text).split()))
+    return counts
+
+
+def _add_line_counts(counts, sign):
+    by_count = {}
+    for text, count in counts.items():
+        by_count.setdefault(count, []).append(text)
+    for count, texts in by_count.items():
+        for chunk in _chunks(sorted(texts)):
+            FuzzyTerm.objects.filter(text__in=chunk).update(line_count=F('line_count') + sign * count)
+
+
+def rebuild_fuzzy_index(batch_size=5000):
+    """Rebuild the whole index from the catalog, dropping every unused term. Returns the number of terms."""
+    with transaction.atomic():
+        FuzzyTerm.objects.all().delete()
+
+        line_words = Counter()
+        last_id = 0
+        while True:
+            rows = list(
+                Line.objects.filter(id__gt=last_id).exclude(romanized__isnull=True)
+                .order_by('id').values_list('id', 'romanized')[:batch_size]
+            )
+            if not rows:
+                break
+            line_words.update(_line_word_counts(romanized for _, romanized in rows))
+            last_id = rows[-1][0]
+
+        names = []
+        for content_type, field in NAME_FIELDS.items():
+            model = NAME_MODELS[content_type]
+            names += [(content_type, pk, name) for pk, name in model.objects.values_list('pk', field).iterator()]
+        words = set(line_words)
+        for _, _, name in names:
+            words.update(name_terms(name))
+
+        term_ids = index_terms(words)
+        _add_line_counts(line_words, 1)
+        FuzzyTermOccurrence.objects.bulk_create([
+            FuzzyTermOccurrence(term_id=term_ids[text], content_type=content_type, object_id=pk)
+            for content_type, pk, name in names
+            for text in name_terms(name)
+        ], batch_size=1000, ignore_conflicts=True)
+    return len(term_ids)
+
+
+def _chunks(items, size=500):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,79 @@
+"""HyperLogLog sketches for approximate distinct counts.
+
+A sketch with precision p keeps 2**p one-byte registers (4 KB at the default
+p=12, ~1.6% standard error). Sketches of the same precision merge by taking
+the register-wise maximum, so per-day sketches answer multi-day distinct
+counts without rescanning raw rows.
+"""
+import hashlib
+import math
+import zlib
+from collections import Counter
+
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+    """Mergeable approximate distinct counter."""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError("register count does not match precision")
+
+    def add(self, value):
+        """Add a value (anything with a stable str())."""
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        x = int.from_bytes(digest, 'big')
+        index = x >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = x & ((1 << rest_bits) - 1)
+        # Position of the leftmost 1-bit in the remaining bits (1-based)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one (in place)."""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added."""
+        m = self.size
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        histogram = Counter(self.registers)
+        estimate = alpha * m * m / sum(n * 2.0 ** -rank for rank, n in histogram.items())
+        zeros = histogram[0]
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting is more accurate here
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self):
+        """Compact serialized form: precision byte + zlib-compressed registers."""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        data = bytes(data)
+        return cls(precision=data[0], registers=zlib.decompress(data[1:]))
@@ -0,0 +1,117 @@
+"""Lyrics of a song page: the write path and cached rendering.
+
+Lyrics are written rarely and read on every song view, so the work is done
+on write. Whenever a song's lines change, refresh_lyrics() stores on the Song,
+in the same transaction, the lyrics document the page needs (zlib-compressed
+JSON, Song.lyrics_payload) with its hash, and bumps Song.lyrics_version. Line
+signals call it after every save or delete. replace_song_lines(), used by CSV
+imports, calls it once after rewriting every line.
+
+The rendered lyrics block of song_detail.html is cached under lyrics_version,
+so it is never stale. A cache miss renders from the stored payload without
+touching core_line. Songs saved before the payload existed fall back to
+loading their lines until `manage.py backfill_lyrics` has run.
+"""
+import hashlib
+import json
+import threading
+import zlib
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .caching import LINES_VERSION, bump_version_on_commit
+from .fuzzy import index_line_words
+from .models import Line, Song
+
+LYRICS_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Songs whose lines are being rewritten in this thread; refreshed once at the end
+_deferred = threading.local()
+
+
+def lyrics_data(lines):
+    """Per-line dicts the song page's display toggles render from."""
+    return [
+        {
+            "no": line.no,
+            "original": line.original,
+            "romanized": line.romanized or "",
+            "translation": line.translation_en,
+        }
+        for line in lines
+    ]
+
+
+def encode_lyrics(data):
+    """(compressed payload, SHA-256 hex digest) of a lyrics document."""
+    document = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(document), hashlib.sha256(document).hexdigest()
+
+
+def decode_lyrics(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+def song_lyrics(song):
+    """Lyrics document of `song`, from its stored payload when there is one."""
+    if song.lyrics_hash:
+        return decode_lyrics(song.lyrics_payload)
+    return lyrics_data(song.lines.all())
+
+
+def render_lyrics_block(song):
+    """Rendered lyrics block of a song page, from the cache when its lyrics_version matches."""
+    key = f"lyrics:{song.pk}:{song.lyrics_version}"
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string("partials/song_lyrics.html", {"lyrics": song_lyrics(song)})
+        cache.set(key, html, LYRICS_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def refresh_lyrics(song_id, lines=None):
+    """Store the lyrics payload and hash of a song from its lines, bump its lyrics_version and updated_at.
+
+    `lines` are the song's lines in order, if already loaded.
+    """
+    if song_id in getattr(_deferred, "song_ids", ()):
+        return
+    if lines is None:
+        lines = Line.objects.filter(song_id=song_id).order_by("no")
+    payload, digest = encode_lyrics(lyrics_data(lines))
+    Song.objects.filter(pk=song_id).update(
+        lyrics_payload=payload, lyrics_hash=digest, lyrics_version=F("lyrics_version") + 1,
+        updated_at=timezone.now(),
+    )
+
+
+@contextmanager
+def _defer_refresh(song_id):
+    song_ids = _deferred.__dict__.setdefault("song_ids", set())
+    song_ids.add(song_id)
+    try:
+        yield
+    finally:
+        song_ids.discard(song_id)
+
+
+def replace_song_lines(song, lines):
+    """Replace every line of `song` with the given unsaved Lines, in one transaction."""
+    lines = sorted(lines, key=lambda line: line.no)
+    with transaction.atomic():
+        # Deleting fires a Line signal per row; refresh the payload once instead
+        with _defer_refresh(song.pk):
+            song.lines.all().delete()
+        for line in lines:
+            line.song = song
+        # The full-text index follows through database triggers; the rest is updated here once
+        Line.objects.bulk_create(lines)
+        index_line_words(line.romanized for line in lines if line.romanized)
+        refresh_lyrics(song.pk, lines)
+        bump_version_on_commit(LINES_VERSION)
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.archive import archive_cutoff, archive_page_views, get_archive_dir
+from core.models import PageView
+
+
+class Command(BaseCommand):
+    help = "Move page views older than the retention horizon into gzip JSONL archives and delete them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Keep this many days of raw page views (default: PAGEVIEW_RETENTION_DAYS).")
+        parser.add_argument("--archive-dir", default=None,
+                            help="Archive root directory (default: PAGEVIEW_ARCHIVE_DIR).")
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="Rows read and archived per chunk.")
+        parser.add_argument("--delete-batch-size", type=int, default=500,
+                            help="Rows deleted per statement.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report how many rows would be archived.")
+
+    def handle(self, days, archive_dir, chunk_size, delete_batch_size, dry_run, **_):
+        if days is None:
+            days = getattr(settings, "PAGEVIEW_RETENTION_DAYS", 180)
+        before = archive_cutoff(days)
+
+        if dry_run:
+            count = PageView.objects.filter(viewed_at__lt=before).count()
+            self.stdout.write(f"{count} page views before {before:%Y-%m-%d} would be archived")
+            return
+
+        moved = archive_page_views(
+            before,
+            archive_dir=archive_dir,
+            chunk_size=chunk_size,
+            delete_batch_size=delete_batch_size,
+        )
+        remaining = PageView.objects.filter(viewed_at__lt=before).count()
+        if remaining:
+            self.stdout.write(self.style.WARNING(
+                f"{remaining} old page views were skipped because they are not rolled up yet; "
+                "run rollup_stats and try again"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} page views before {before:%Y-%m-%d} to {get_archive_dir(archive_dir)}"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.lyrics import refresh_lyrics
+from core.models import Song
+
+
+class Command(BaseCommand):
+    help = "Store the compressed lyrics payload and hash on songs that don't have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Regenerate the payload of every song, not just those missing one.")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Songs processed per transaction.")
+
+    def handle(self, all, batch_size, **_):
+        songs = Song.objects.all() if all else Song.objects.filter(lyrics_hash="")
+        done = 0
+        last_id = 0
+        while True:
+            batch = list(
+                songs.filter(pk__gt=last_id).order_by("pk").only("pk").prefetch_related("lines")[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                for song in batch:
+                    refresh_lyrics(song.pk, song.lines.all())
+            done += len(batch)
+            last_id = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(f"Stored lyrics payloads for {done} songs"))
@@ -0,0 +1,80 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.analytics import visitor_summary
+from core.hll import HyperLogLog
+from core.models import PageView
+
+
+class Command(BaseCommand):
+    help = "Compare HyperLogLog unique-visitor estimates with exact DISTINCT queries (accuracy and latency)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--synthetic", type=int, nargs="*", default=None,
+                            help="Benchmark the sketch alone on N random values instead of the database "
+                                 "(e.g. --synthetic 1000 100000 1000000).")
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Runs per measurement; the fastest is reported.")
+
+    def handle(self, synthetic, repeat, **_):
+        if synthetic is not None:
+            self.benchmark_synthetic(synthetic or [1000, 100000, 1000000])
+        else:
+            self.benchmark_database(repeat)
+
+    def timed(self, fn, repeat):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best * 1000
+
+    def benchmark_database(self, repeat):
+        now = timezone.now()
+        today = timezone.localdate(now)
+        windows = {
+            "today": PageView.objects.filter(viewed_at__date__gte=today),
+            "7d": PageView.objects.filter(viewed_at__date__gte=today - timedelta(days=6)),
+            "30d": PageView.objects.filter(viewed_at__date__gte=today - timedelta(days=29)),
+            "total": PageView.objects.all(),
+        }
+
+        summary, sketch_ms = self.timed(lambda: visitor_summary(now), repeat)
+        self.stdout.write(f"Sketch merge for all windows: {sketch_ms:.1f} ms")
+        self.stdout.write(f"{'metric':<24}{'exact':>10}{'estimate':>10}{'error':>9}{'exact ms':>11}")
+
+        for label, views in windows.items():
+            for metric, field in [("unique_ips", "ip_address"), ("active_users", "user")]:
+                queryset = views.order_by().values(field).distinct()
+                if field == "user":
+                    queryset = queryset.filter(user__isnull=False)
+                elif field == "ip_address":
+                    queryset = queryset.filter(ip_address__isnull=False)
+                exact, exact_ms = self.timed(queryset.count, repeat)
+                estimate = summary[f"{metric}_{label}"]
+                error = abs(estimate - exact) / exact * 100 if exact else 0.0
+                self.stdout.write(
+                    f"{metric + '_' + label:<24}{exact:>10}{estimate:>10}{error:>8.2f}%{exact_ms:>11.1f}"
+                )
+
+    def benchmark_synthetic(self, sizes):
+        self.stdout.write(f"{'values':>10}{'estimate':>12}{'error':>9}{'add ms':>10}{'count ms':>10}{'bytes':>8}")
+        for size in sizes:
+            values = [f"{random.getrandbits(32)}.{i}" for i in range(size)]
+            sketch = HyperLogLog()
+            start = time.perf_counter()
+            sketch.update(values)
+            add_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            estimate = sketch.count()
+            count_ms = (time.perf_counter() - start) * 1000
+            error = abs(estimate - size) / size * 100
+            self.stdout.write(
+                f"{size:>10}{estimate:>12}{error:>8.2f}%{add_ms:>10.1f}{count_ms:>10.2f}{len(sketch.to_bytes()):>8}"
+            )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.charts import build_charts
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily, weekly, monthly, all-time and trending charts."
+
+    def handle(self, **_):
+        entries = build_charts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt charts ({entries} entries)"))
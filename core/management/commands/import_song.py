@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 import csv
+from core.lyrics import replace_song_lines
 from core.models import Artist, Song, Line
 
 class Command(BaseCommand):
@@ -23,26 +24,29 @@ class Command(BaseCommand):
             defaults={"year": year, "is_published": publish},
         )
         if not created:
-            # idempotent re-import: wipe lines + update metadata
-            Line.objects.filter(song=song).delete()
+            # idempotent re-import: update metadata (lines are replaced below)
             song.year = year
             song.is_published = publish
             song.save()
 
-        # 2) Read the CSV and create lines
+        # 2) Read the CSV and replace the lines
         with open(csv_path, newline="", encoding="utf-8") as f:
             reader = csv.DictReader(f)
             required = {"no", "original", "translation_en"}
             if not required.issubset(reader.fieldnames or []):
                 raise SystemExit(f"CSV must include headers: {sorted(required)}")
 
-            for row in reader:
-                Line.objects.create(
-                    song=song,
+            lines = [
+                Line(
                     no=int(row["no"]),
                     original=(row["original"] or "").strip(),
                     translation_en=(row["translation_en"] or "").strip(),
                     romanized=((row.get("romanized") or "").strip() or None),
                 )
+                for row in reader
+            ]
+
+        # Also bumps the song's lyrics version so its cached lyrics block is replaced
+        replace_song_lines(song, lines)
 
         self.stdout.write(self.style.SUCCESS(f"Imported {song.title}"))
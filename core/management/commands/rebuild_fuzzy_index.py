@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.fuzzy import rebuild_fuzzy_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the trigram index used for fuzzy search of romanized lyrics, titles and names."
+
+    def handle(self, **_):
+        terms = rebuild_fuzzy_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {terms} terms"))
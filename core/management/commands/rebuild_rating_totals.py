@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.ratings import RATING_MODELS, rebuild_totals
+
+
+class Command(BaseCommand):
+    help = "Recount rating_count, rating_sum and rating_score of every song and artist from their ratings."
+
+    def handle(self, **_):
+        for model, (rating_model, key) in RATING_MODELS.items():
+            rebuild_totals(model, rating_model, key)
+        self.stdout.write(self.style.SUCCESS("Rebuilt rating totals of songs and artists"))
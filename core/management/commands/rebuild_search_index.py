@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from core.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text index over lyric lines (tsvector on PostgreSQL, FTS5 on SQLite)."
+
+    def handle(self, **_):
+        with transaction.atomic():
+            installed = install_search_index(connection)
+        if installed:
+            self.stdout.write(self.style.SUCCESS(f"Search index rebuilt ({connection.vendor})"))
+        else:
+            self.stdout.write(self.style.WARNING("Full-text search isn't available here; search uses icontains"))
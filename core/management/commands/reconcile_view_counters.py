@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core.archive import iter_archived_page_views
+from core.tracking import reconcile_view_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-content view counters from the PageView table and its archives."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-archive", action="store_true",
+                            help="Count only live PageView rows, ignoring archived page views.")
+
+    def handle(self, skip_archive, **_):
+        archived = () if skip_archive else iter_archived_page_views()
+        fixed = reconcile_view_counters(archived)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled view counters ({fixed} corrected)"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from core.analytics import reset_rollups, rollup_page_views
+from core.charts import build_charts
+
+
+class Command(BaseCommand):
+    help = "Roll up new page views into SiteStats and daily/hourly per-content stats, then rebuild the charts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="Page views folded per transaction.")
+        parser.add_argument("--max-chunks", type=int, default=None,
+                            help="Stop after this many chunks (backfill a large table over several runs).")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Drop existing rollups and rebuild them from the start of PageView.")
+        parser.add_argument("--skip-charts", action="store_true",
+                            help="Don't rebuild the materialized charts afterwards.")
+
+    def handle(self, chunk_size, max_chunks, rebuild, skip_charts, **_):
+        if rebuild:
+            reset_rollups()
+            self.stdout.write("Cleared existing rollups")
+
+        processed = rollup_page_views(chunk_size=chunk_size, max_chunks=max_chunks)
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {processed} page views"))
+
+        if not skip_charts:
+            entries = build_charts()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt charts ({entries} entries)"))
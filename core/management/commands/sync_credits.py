@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.credits import sync_all_credits
+from core.models import Album, AlbumCredit, Song, SongCredit
+
+
+class Command(BaseCommand):
+    help = "Rewrite the ordered artist credits of every song and album from their artist relations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Songs or albums processed per transaction.")
+
+    def handle(self, batch_size, **_):
+        sync_all_credits(Song, SongCredit, Album, AlbumCredit, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {SongCredit.objects.count()} song credits and {AlbumCredit.objects.count()} album credits"
+        ))
@@ -1,13 +1,33 @@
+from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
-from .models import PageView
+from .tracking import record_page_view, describe_content
+
+
+# URL name -> (content type, title used when the view didn't load an object)
+TRACKED_PAGES = {
+    'home': ('home', 'Home / Charts'),
+    'charts': ('home', 'Home / Charts'),
+    'song_detail': ('song', ''),
+    'artist_detail': ('artist', ''),
+    'album_detail': ('album', ''),
+    'artists_index': ('other', 'Artists Index'),
+    'albums_index': ('other', 'Albums Index'),
+    'songs_index': ('other', 'Songs Index'),
+    'top_rated': ('other', 'Top Rated'),
+}
+
+# URL names that are never recorded (typeahead fires on every keystroke,
+# user_state on every page load, comment_thread on "load more")
+UNTRACKED_PAGES = {'typeahead', 'user_state', 'comment_thread'}
 
 
 class PageViewMiddleware(MiddlewareMixin):
     """Middleware to track page views for analytics"""
 
     def process_response(self, request, response):
-        # Only track successful GET requests (not POST, redirects, errors, etc.)
-        if request.method == 'GET' and response.status_code == 200:
+        # Only track successful GET requests (not POST, redirects, errors, etc.);
+        # a 304 is a visit whose page the browser already had (see core.conditional)
+        if request.method == 'GET' and response.status_code in (200, 304):
             # Skip admin and static file requests
             if not request.path.startswith('/admin/') and not request.path.startswith('/static/'):
                 # Get IP address
@@ -17,52 +37,35 @@ class PageViewMiddleware(MiddlewareMixin):
                 else:
                     ip_address = request.META.get('REMOTE_ADDR')
 
-                # Determine content type and details
-                content_type = 'other'
+                # Determine content type from the matched URL pattern
+                match = getattr(request, 'resolver_match', None)
+                url_name = match.url_name if match else None
+                if url_name in UNTRACKED_PAGES:
+                    return response
+                content_type, content_title = TRACKED_PAGES.get(url_name, ('other', ''))
                 content_id = None
-                content_title = ''
 
-                path = request.path
-                if path == '/' or path.startswith('/charts'):
-                    content_type = 'home'
-                    content_title = 'Home / Charts'
-                elif path.startswith('/album/'):
-                    # Album detail page: /album/<artist-slug>/<album-slug>/
-                    parts = path.strip('/').split('/')
-                    if len(parts) >= 3:
-                        content_type = 'album'
-                elif path.startswith('/a/'):
-                    # Could be artist or song
-                    parts = path.strip('/').split('/')
-                    if len(parts) == 2:  # /a/artist-slug/
-                        content_type = 'artist'
-                        # Try to get artist from request (if available)
-                    elif len(parts) == 3:  # /a/artist-slug/song-slug/
-                        content_type = 'song'
-                elif path.startswith('/artists'):
-                    content_type = 'other'
-                    content_title = 'Artists Index'
-                elif path.startswith('/albums'):
-                    content_type = 'other'
-                    content_title = 'Albums Index'
-                elif path.startswith('/songs'):
-                    content_type = 'other'
-                    content_title = 'Songs Index'
+                # Detail views attach the object they rendered (see views.song_detail etc.)
+                obj = getattr(request, 'tracked_object', None)
+                if obj is not None:
+                    content_id = obj.pk
+                    content_title = describe_content(obj)
 
-                # Create page view record
+                # Record the page view (written now, or queued in buffered mode)
                 try:
-                    PageView.objects.create(
-                        content_type=content_type,
-                        content_id=content_id,
-                        content_title=content_title,
-                        url=request.path,
-                        ip_address=ip_address,
-                        user=request.user if request.user.is_authenticated else None,
-                        session_key=request.session.session_key or '',
-                        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
-                    )
+                    record_page_view({
+                        'content_type': content_type,
+                        'content_id': content_id,
+                        'content_title': content_title[:500],
+                        'url': request.path,
+                        'ip_address': ip_address,
+                        'user_id': request.user.pk if request.user.is_authenticated else None,
+                        'session_key': request.session.session_key or '',
+                        'user_agent': request.META.get('HTTP_USER_AGENT', '')[:500],
+                        'viewed_at': timezone.now(),
+                    })
                 except Exception:
                     # Silently fail if tracking fails (don't break the site)
                     pass
 
-        return response
\ No newline at end of file
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_song_additional_artists_alter_song_artist_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pageview',
+            name='viewed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
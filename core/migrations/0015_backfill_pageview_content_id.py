@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+def backfill_content_ids(apps, schema_editor):
+    """Fill content_id/content_title on existing song, artist and album views from their URL."""
+    PageView = apps.get_model("core", "PageView")
+    Song = apps.get_model("core", "Song")
+    Artist = apps.get_model("core", "Artist")
+    Album = apps.get_model("core", "Album")
+
+    urls = (
+        PageView.objects.filter(content_type__in=["song", "artist", "album"], content_id__isnull=True)
+        .values_list("content_type", "url")
+        .order_by()  # Meta ordering would add viewed_at to the SELECT DISTINCT
+        .distinct()
+    )
+    for content_type, url in urls:
+        parts = url.strip("/").split("/")
+        obj = title = None
+        if content_type == "song" and len(parts) >= 3:
+            # /a/<artist-slug>/<song-slug>/
+            obj = Song.objects.select_related("artist").filter(artist__slug=parts[1], slug=parts[2]).first()
+            if obj:
+                title = f"{obj.title} — {obj.artist.name}"
+        elif content_type == "artist" and len(parts) >= 2:
+            # /a/<artist-slug>/
+            obj = Artist.objects.filter(slug=parts[1]).first()
+            if obj:
+                title = obj.name
+        elif content_type == "album" and len(parts) >= 3:
+            # /album/<artist-slug>/<album-slug>/
+            obj = Album.objects.select_related("artist").filter(artist__slug=parts[1], slug=parts[2]).first()
+            if obj:
+                title = f"{obj.title} — {obj.artist.name}"
+
+        if obj:
+            PageView.objects.filter(
+                content_type=content_type, url=url, content_id__isnull=True
+            ).update(content_id=obj.pk, content_title=title[:500])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_pageview_viewed_at_default"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_content_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_backfill_pageview_content_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyContentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('content_type', models.CharField(choices=[('song', 'Song'), ('artist', 'Artist'), ('album', 'Album'), ('home', 'Home'), ('other', 'Other')], max_length=20)),
+                ('content_id', models.IntegerField()),
+                ('views', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Daily Content Statistics',
+                'verbose_name_plural': 'Daily Content Statistics',
+                'ordering': ['-date', '-views'],
+                'indexes': [models.Index(fields=['content_type', 'date'], name='core_dailyc_content_4cdc71_idx')],
+                'unique_together': {('date', 'content_type', 'content_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    PageView = apps.get_model('core', 'PageView')
+    ContentViewCounter = apps.get_model('core', 'ContentViewCounter')
+    totals = (
+        PageView.objects.filter(content_id__isnull=False, content_type__in=['song', 'artist', 'album'])
+        .values('content_type', 'content_id')
+        .annotate(views=Count('id'))
+        .order_by()
+    )
+    ContentViewCounter.objects.bulk_create(
+        [ContentViewCounter(**row) for row in totals],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_rollup_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentViewCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('song', 'Song'), ('artist', 'Artist'), ('album', 'Album'), ('home', 'Home'), ('other', 'Other')], max_length=20)),
+                ('content_id', models.IntegerField()),
+                ('views', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('content_type', 'content_id')},
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
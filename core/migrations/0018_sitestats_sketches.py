@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+from ._frozen import HyperLogLog
+
+
+def build_sketches(apps, schema_editor):
+    """Sketch the days that were rolled up before SiteStats had sketches."""
+    SiteStats = apps.get_model('core', 'SiteStats')
+    PageView = apps.get_model('core', 'PageView')
+    RollupWatermark = apps.get_model('core', 'RollupWatermark')
+    mark = RollupWatermark.objects.filter(name='pageviews').first()
+    if mark is None:
+        return
+
+    for stats in SiteStats.objects.all():
+        ips, sessions, users = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        rows = PageView.objects.filter(
+            viewed_at__date=stats.date, id__lte=mark.last_id
+        ).values_list('ip_address', 'session_key', 'user_id').order_by()
+        for ip_address, session_key, user_id in rows.iterator(chunk_size=5000):
+            if ip_address:
+                ips.add(ip_address)
+            if session_key or ip_address:
+                sessions.add(session_key or f"ip:{ip_address}")
+            if user_id:
+                users.add(user_id)
+        stats.ip_sketch = ips.to_bytes()
+        stats.session_sketch = sessions.to_bytes()
+        stats.user_sketch = users.to_bytes()
+        stats.save(update_fields=['ip_sketch', 'session_sketch', 'user_sketch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_contentviewcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitestats',
+            name='ip_sketch',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sitestats',
+            name='session_sketch',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sitestats',
+            name='user_sketch',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(build_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:26
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def backfill_hourly_views(apps, schema_editor):
+    """Bucket the last month of already rolled-up views so charts have history."""
+    PageView = apps.get_model('core', 'PageView')
+    HourlyContentViews = apps.get_model('core', 'HourlyContentViews')
+    RollupWatermark = apps.get_model('core', 'RollupWatermark')
+    mark = RollupWatermark.objects.filter(name='pageviews').first()
+    if mark is None:
+        return
+
+    rows = (
+        PageView.objects.filter(
+            id__lte=mark.last_id,
+            viewed_at__gte=timezone.now() - timedelta(days=31),
+            content_id__isnull=False,
+            content_type__in=['song', 'artist', 'album'],
+        )
+        .annotate(hour=TruncHour('viewed_at'))
+        .values('hour', 'content_type', 'content_id')
+        .annotate(views=Count('id'))
+        .order_by()
+    )
+    HourlyContentViews.objects.bulk_create([HourlyContentViews(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_sitestats_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chart', models.CharField(choices=[('daily', 'Today'), ('weekly', 'This Week'), ('monthly', 'This Month'), ('all_time', 'All Time'), ('trending', 'Trending Now')], max_length=20)),
+                ('content_type', models.CharField(choices=[('song', 'Song'), ('artist', 'Artist'), ('album', 'Album'), ('home', 'Home'), ('other', 'Other')], max_length=20)),
+                ('rank', models.PositiveIntegerField()),
+                ('content_id', models.IntegerField()),
+                ('views', models.BigIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Chart entries',
+                'ordering': ['chart', 'content_type', 'rank'],
+                'unique_together': {('chart', 'content_type', 'rank')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyContentViews',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('content_type', models.CharField(choices=[('song', 'Song'), ('artist', 'Artist'), ('album', 'Album'), ('home', 'Home'), ('other', 'Other')], max_length=20)),
+                ('content_id', models.IntegerField()),
+                ('views', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-hour', '-views'],
+                'indexes': [models.Index(fields=['content_type', 'hour'], name='core_hourly_content_fc2c37_idx')],
+                'unique_together': {('hour', 'content_type', 'content_id')},
+            },
+        ),
+        migrations.RunPython(backfill_hourly_views, migrations.RunPython.noop),
+    ]
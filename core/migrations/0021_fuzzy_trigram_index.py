@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._frozen import rebuild_fuzzy_index
+
+
+def build_index(apps, schema_editor):
+    rebuild_fuzzy_index(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_line_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FuzzyTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=255, unique=True)),
+                ('trigram_count', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FuzzyTermOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('song', 'Song'), ('artist', 'Artist'), ('album', 'Album'), ('home', 'Home'), ('other', 'Other')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='core.fuzzyterm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content_type', 'object_id'], name='core_fuzzyt_content_d028dc_idx')],
+                'unique_together': {('term', 'content_type', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FuzzyTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='core.fuzzyterm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram'], name='core_fuzzyt_trigram_951ff0_idx')],
+                'unique_together': {('trigram', 'term')},
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
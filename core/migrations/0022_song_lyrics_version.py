@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_fuzzy_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='lyrics_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_song_lyrics_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='lyrics_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='lyrics_payload',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._frozen import sync_all_credits
+
+
+def fill_credits(apps, schema_editor):
+    sync_all_credits(
+        apps.get_model('core', 'Song'), apps.get_model('core', 'SongCredit'),
+        apps.get_model('core', 'Album'), apps.get_model('core', 'AlbumCredit'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlbumCredit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('main', 'Main'), ('additional', 'Additional')], max_length=10)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='core.album')),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='album_credits', to='core.artist')),
+            ],
+            options={
+                'ordering': ['position'],
+                'unique_together': {('album', 'position')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SongCredit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('main', 'Main'), ('additional', 'Additional'), ('featured', 'Featured')], max_length=10)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='song_credits', to='core.artist')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='core.song')),
+            ],
+            options={
+                'ordering': ['position'],
+                'unique_together': {('song', 'position')},
+            },
+        ),
+        migrations.RunPython(fill_credits, migrations.RunPython.noop),
+    ]
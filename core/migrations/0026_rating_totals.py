@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:55
+
+from django.db import migrations, models
+
+from ._frozen import rebuild_rating_totals
+
+
+def fill_rating_totals(apps, schema_editor):
+    rebuild_rating_totals(apps.get_model('core', 'Song'), apps.get_model('core', 'SongRating'), 'song')
+    rebuild_rating_totals(apps.get_model('core', 'Artist'), apps.get_model('core', 'ArtistRating'), 'artist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_artist_credits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='rating_score',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='rating_score',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['-rating_score'], name='artist_rating_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['-rating_score'], name='song_rating_score_idx'),
+        ),
+        migrations.RunPython(fill_rating_totals, migrations.RunPython.noop),
+    ]
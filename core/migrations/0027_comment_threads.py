@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+from ._frozen import rebuild_comment_counts
+
+
+def fill_comment_counts(apps, schema_editor):
+    rebuild_comment_counts(apps.get_model('core', 'Song'), apps.get_model('core', 'SongComment'), 'song')
+    rebuild_comment_counts(apps.get_model('core', 'Artist'), apps.get_model('core', 'ArtistComment'), 'artist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_rating_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='artistcomment',
+            index=models.Index(fields=['artist', '-created_at', '-id'], name='artistcomment_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songcomment',
+            index=models.Index(fields=['song', '-created_at', '-id'], name='songcomment_thread_idx'),
+        ),
+        migrations.RunPython(fill_comment_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:10
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import F
+
+from ._frozen import normalize
+
+
+def count_line_words(apps, schema_editor):
+    """Count the lyric lines each indexed word is in."""
+    Line = apps.get_model('core', 'Line')
+    FuzzyTerm = apps.get_model('core', 'FuzzyTerm')
+    counts = Counter()
+    for romanized in Line.objects.exclude(romanized__isnull=True).values_list('romanized', flat=True).iterator():
+        counts.update(set(normalize(romanized).split()))
+    by_count = {}
+    for text, count in counts.items():
+        by_count.setdefault(count, []).append(text)
+    for count, texts in by_count.items():
+        for start in range(0, len(texts), 500):
+            FuzzyTerm.objects.filter(text__in=texts[start:start + 500]).update(line_count=F('line_count') + count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fuzzyterm',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_line_words, migrations.RunPython.noop),
+    ]
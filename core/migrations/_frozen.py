@@ -0,0 +1,258 @@
+"""Copies of the app helpers the data migrations run, as they were when written.
+
+Migrations must keep working on a fresh database however core.search,
+core.fuzzy, core.credits, core.ratings, core.comments and core.hll change
+later, so they import from here instead. Never edit these to follow the app;
+a later migration that needs newer behaviour gets its own copy.
+(The leading underscore keeps the migration loader from reading this module.)
+"""
+import hashlib
+import unicodedata
+import zlib
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+# core.hll (0018)
+
+class HyperLogLog:
+    """Write side of core.hll.HyperLogLog, in its serialized format."""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        x = int.from_bytes(digest, 'big')
+        index = x >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = x & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def to_bytes(self):
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+
+# core.search (0020, 0024)
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(original, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(romanized, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(translation_en, '')), 'C')"
+)
+FTS_COLUMNS = 'original, romanized, translation_en'
+
+
+def install_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                "ALTER TABLE core_line ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({POSTGRES_VECTOR}) STORED"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS core_line_search_vector_idx ON core_line USING GIN (search_vector)"
+            )
+            return True
+        if conn.vendor != 'sqlite':
+            return False
+
+        _drop_sqlite_index(cursor)
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE core_line_fts USING fts5({FTS_COLUMNS}, "
+                "content='core_line', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5
+            return False
+        new_row = f"INSERT INTO core_line_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, new.original, new.romanized, new.translation_en);"
+        old_row = (
+            f"INSERT INTO core_line_fts(core_line_fts, rowid, {FTS_COLUMNS}) "
+            "VALUES ('delete', old.id, old.original, old.romanized, old.translation_en);"
+        )
+        cursor.execute(f"CREATE TRIGGER core_line_fts_ai AFTER INSERT ON core_line BEGIN {new_row} END")
+        cursor.execute(f"CREATE TRIGGER core_line_fts_ad AFTER DELETE ON core_line BEGIN {old_row} END")
+        cursor.execute(f"CREATE TRIGGER core_line_fts_au AFTER UPDATE ON core_line BEGIN {old_row} {new_row} END")
+        cursor.execute("INSERT INTO core_line_fts(core_line_fts) VALUES ('rebuild')")
+        return True
+
+
+def uninstall_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS core_line_search_vector_idx")
+            cursor.execute("ALTER TABLE core_line DROP COLUMN IF EXISTS search_vector")
+        elif conn.vendor == 'sqlite':
+            _drop_sqlite_index(cursor)
+
+
+def _drop_sqlite_index(cursor):
+    for trigger in ('core_line_fts_ai', 'core_line_fts_ad', 'core_line_fts_au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS core_line_fts")
+
+
+# core.fuzzy (0021, 0028)
+
+def normalize(text):
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    kept = ''.join(ch if ch.isalnum() or unicodedata.category(ch).startswith('M') else ' ' for ch in text)
+    return ' '.join(kept.split())[:255].strip()
+
+
+def trigrams(text):
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def name_terms(name):
+    name = normalize(name)
+    return {name, *name.split()} - {''}
+
+
+def index_terms(texts, Term, Trigram):
+    texts = {normalize(text) for text in texts} - {''}
+    term_ids = {}
+    for chunk in _chunks(sorted(texts)):
+        term_ids.update(Term.objects.filter(text__in=chunk).values_list('text', 'id'))
+        new = [text for text in chunk if text not in term_ids]
+        if not new:
+            continue
+        Term.objects.bulk_create(
+            [Term(text=text, trigram_count=len(trigrams(text))) for text in new],
+            ignore_conflicts=True,
+        )
+        created = dict(Term.objects.filter(text__in=new).values_list('text', 'id'))
+        Trigram.objects.bulk_create(
+            [Trigram(trigram=gram, term_id=term_id) for text, term_id in created.items() for gram in trigrams(text)],
+            batch_size=1000, ignore_conflicts=True,
+        )
+        term_ids.update(created)
+    return term_ids
+
+
+def rebuild_fuzzy_index(apps, batch_size=5000):
+    """Index every romanized lyric word and song, artist and album name."""
+    Term = apps.get_model('core', 'FuzzyTerm')
+    Trigram = apps.get_model('core', 'FuzzyTrigram')
+    Occurrence = apps.get_model('core', 'FuzzyTermOccurrence')
+    Line = apps.get_model('core', 'Line')
+    with transaction.atomic():
+        Term.objects.all().delete()
+
+        words = set()
+        last_id = 0
+        while True:
+            rows = list(
+                Line.objects.filter(id__gt=last_id).exclude(romanized__isnull=True)
+                .order_by('id').values_list('id', 'romanized')[:batch_size]
+            )
+            if not rows:
+                break
+            for _, romanized in rows:
+                words.update(normalize(romanized).split())
+            last_id = rows[-1][0]
+
+        names = []
+        for content_type, field in (('song', 'title'), ('artist', 'name'), ('album', 'title')):
+            model = apps.get_model('core', content_type.capitalize())
+            names += [(content_type, pk, name) for pk, name in model.objects.values_list('pk', field).iterator()]
+        for _, _, name in names:
+            words.update(name_terms(name))
+
+        term_ids = index_terms(words, Term, Trigram)
+        Occurrence.objects.bulk_create([
+            Occurrence(term_id=term_ids[text], content_type=content_type, object_id=pk)
+            for content_type, pk, name in names
+            for text in name_terms(name)
+        ], batch_size=1000, ignore_conflicts=True)
+
+
+def _chunks(items, size=500):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# core.credits (0025)
+
+def sync_all_credits(song_model, song_credit_model, album_model, album_credit_model, batch_size=500):
+    for model, credit_model, owner in (
+        (song_model, song_credit_model, 'song'),
+        (album_model, album_credit_model, 'album'),
+    ):
+        ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            _sync_credits(model, credit_model, owner, ids[start:start + batch_size])
+
+
+def _sync_credits(model, credit_model, owner, ids):
+    credited = {
+        pk: [('main', artist_id)]
+        for pk, artist_id in model.objects.filter(pk__in=ids).values_list('pk', 'artist_id')
+    }
+    for role, relation in (('additional', 'additional_artists'), ('featured', 'featured_artists')):
+        if not hasattr(model, relation):
+            continue
+        through = getattr(model, relation).through
+        links = (
+            through.objects.filter(**{f"{owner}_id__in": ids})
+            .order_by('pk').values_list(f"{owner}_id", 'artist_id')
+        )
+        for pk, artist_id in links:
+            if pk in credited:
+                credited[pk].append((role, artist_id))
+
+    rows = [
+        credit_model(**{f"{owner}_id": pk}, artist_id=artist_id, role=role, position=position)
+        for pk, credits in credited.items()
+        for position, (role, artist_id) in enumerate(credits)
+    ]
+    with transaction.atomic():
+        credit_model.objects.filter(**{f"{owner}_id__in": ids}).delete()
+        credit_model.objects.bulk_create(rows)
+
+
+# core.ratings (0026)
+
+def bayesian_score(total, count):
+    weight = max(float(getattr(settings, 'RATING_PRIOR_WEIGHT', 5)), 1.0)
+    mean = float(getattr(settings, 'RATING_PRIOR_MEAN', 3.0))
+    return ExpressionWrapper(
+        (Value(weight * mean) + total) / (Value(weight) + count), output_field=FloatField()
+    )
+
+
+def rebuild_rating_totals(model, rating_model, key):
+    totals = (
+        rating_model.objects.filter(**{key: OuterRef('pk')}).order_by()
+        .values(key).annotate(count=Count('pk'), total=Sum('rating'))
+    )
+    with transaction.atomic():
+        model.objects.update(
+            rating_count=Coalesce(Subquery(totals.values('count')), 0),
+            rating_sum=Coalesce(Subquery(totals.values('total')), 0),
+        )
+        model.objects.filter(rating_count=0).update(rating_score=None)
+        model.objects.filter(rating_count__gt=0).update(
+            rating_score=bayesian_score(F('rating_sum'), F('rating_count'))
+        )
+
+
+# core.comments (0027)
+
+def rebuild_comment_counts(model, comment_model, key):
+    counts = (
+        comment_model.objects.filter(**{key: OuterRef('pk')}).order_by()
+        .values(key).annotate(count=Count('pk')).values('count')
+    )
+    model.objects.update(comment_count=Coalesce(Subquery(counts), 0))
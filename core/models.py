@@ -1,26 +1,136 @@
 from django.db import models
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
-class Artist(models.Model):
+class LoadedValuesMixin:
+    """Remembers the TRACKED_FIELDS values last read from or written to the database.
+
+    Save signals use has_changed() to skip work for fields an edit didn't
+    touch; Artist and Song saves always name their update_fields (to keep
+    the counters out), so those can't tell.
+    """
+    TRACKED_FIELDS = ()  # Attribute names, e.g. 'artist_id'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded()
+        return instance
+
+    def has_changed(self, field):
+        """Whether `field` differs from the database row (always true before the first save)."""
+        loaded = getattr(self, '_loaded_values', {})
+        return field not in loaded or loaded[field] != getattr(self, field)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {self._meta.get_field(name).attname for name in update_fields}
+        self._remember_loaded(update_fields)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded()
+
+    def _remember_loaded(self, fields=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in self.TRACKED_FIELDS:
+            # Deferred fields stay unknown rather than being fetched here
+            if field in self.__dict__ and (fields is None or field in fields):
+                loaded[field] = self.__dict__[field]
+
+
+class Artist(LoadedValuesMixin, models.Model):
     name = models.CharField(max_length=160, unique=True)
     slug = models.SlugField(unique=True, blank=True)
     # Optional fields for the artist page
     image_url = models.URLField(blank=True)
     about = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Kept by core.ratings: number and sum of ratings, and their Bayesian average
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_score = models.FloatField(null=True, blank=True, editable=False)
+    # Kept by core.signals
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Only ever written through core.ratings and core.signals, never from a (possibly stale) instance
+    COUNTER_FIELDS = ('rating_count', 'rating_sum', 'rating_score', 'comment_count')
+
+    # Read by core.signals through has_changed()
+    TRACKED_FIELDS = ('name', 'slug')
+
+    class Meta:
+        indexes = [models.Index(fields=['-rating_score'], name='artist_rating_score_idx')]
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def get_absolute_url(self):
+        return reverse("artist_detail", kwargs={"artist": self.slug})
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.name
 
 
-class Album(models.Model):
+class CreditedQuerySet(models.QuerySet):
+    def with_credits(self):
+        """Prefetch every artist credit, with its artist, in one query (see Song.get_credits())."""
+        credit_model = self.model._meta.get_field('credits').related_model
+        return self.prefetch_related(
+            models.Prefetch('credits', queryset=credit_model.objects.select_related('artist'))
+        )
+
+
+class CreditedMixin:
+    """Artist accessors of songs and albums, read from their ordered credits."""
+
+    def get_credits(self):
+        """Artist credits in display order; one query unless prefetched with with_credits()."""
+        if 'credits' in getattr(self, '_prefetched_objects_cache', {}):
+            return list(self.credits.all())
+        if self.pk is None:
+            return []
+        return list(self.credits.select_related('artist'))
+
+    def credited_artists(self, *roles):
+        """Credited artists with one of `roles`, in order."""
+        return [artist for role, artist in self._credited() if role in roles]
+
+    def _credited(self):
+        """(role, artist) of every credit, in order."""
+        if self.pk is None:
+            return [('main', self.artist)] if self.artist_id else []
+        credits = self.get_credits()
+        if credits:
+            return [(credit.role, credit.artist) for credit in credits]
+        # Rows written without signals (e.g. bulk_create) until core.credits syncs them
+        credited = [('main', self.artist)]
+        for role, relation in self.CREDIT_RELATIONS:
+            credited.extend((role, artist) for artist in getattr(self, relation).all())
+        return credited
+
+    def get_additional_artists(self):
+        return self.credited_artists('additional')
+
+
+class Album(LoadedValuesMixin, CreditedMixin, models.Model):
     title = models.CharField(max_length=200)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='albums', help_text="Primary artist")
     additional_artists = models.ManyToManyField(Artist, blank=True, related_name='collab_albums', help_text="Additional artists on this album")
@@ -28,6 +138,15 @@ class Album(models.Model):
     year = models.IntegerField(null=True, blank=True)
     image = models.ImageField(upload_to='album_images/', blank=True, null=True)
     image_url = models.URLField(blank=True, null=True, help_text="Or provide an image URL instead of uploading")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CreditedQuerySet.as_manager()
+
+    # Relations mirrored into AlbumCredit (after the main artist), by role
+    CREDIT_RELATIONS = (('additional', 'additional_artists'),)
+
+    # Read by core.signals through has_changed()
+    TRACKED_FIELDS = ('title', 'slug', 'artist_id')
 
     def get_image_url(self):
         """Return image URL or uploaded image"""
@@ -39,9 +158,10 @@ class Album(models.Model):
 
     def get_all_artists(self):
         """Return all artists (primary + additional)"""
-        artists = [self.artist]
-        artists.extend(self.additional_artists.all())
-        return artists
+        return self.credited_artists('main', 'additional')
+
+    def get_absolute_url(self):
+        return reverse("album_detail", kwargs={"artist": self.artist.slug, "album": self.slug})
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -49,7 +169,7 @@ class Album(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self) -> str:
-        additional = self.additional_artists.all()
+        additional = self.get_additional_artists()
         if additional:
             artist_names = f"{self.artist.name}, " + ", ".join(a.name for a in additional)
             return f"{self.title} ({artist_names})"
@@ -59,7 +179,7 @@ class Album(models.Model):
         unique_together = ('title', 'artist')
 
 
-class Song(models.Model):
+class Song(LoadedValuesMixin, CreditedMixin, models.Model):
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='main_songs', help_text="Primary artist")
     additional_artists = models.ManyToManyField(Artist, blank=True, related_name='collab_songs', help_text="Additional primary artists (not features)")
     title = models.CharField(max_length=200)
@@ -70,6 +190,39 @@ class Song(models.Model):
     is_published = models.BooleanField(default=False)
     image = models.ImageField(upload_to='song_images/', blank=True, null=True)
     image_url = models.URLField(blank=True, null=True, help_text="Or provide an image URL instead of uploading")
+    # Also moved by core.lyrics when lines change, and by core.signals when artists are linked
+    updated_at = models.DateTimeField(auto_now=True)
+    # Written by core.lyrics whenever a line changes: the version keys the cached
+    # lyrics block, the payload is the zlib-compressed JSON of the lines and the
+    # hash is its SHA-256 (empty until `manage.py backfill_lyrics` has run)
+    lyrics_version = models.PositiveIntegerField(default=0, editable=False)
+    lyrics_payload = models.BinaryField(blank=True, default=b'', editable=False)
+    lyrics_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # Kept by core.ratings: number and sum of ratings, and their Bayesian average
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_score = models.FloatField(null=True, blank=True, editable=False)
+    # Kept by core.signals
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CreditedQuerySet.as_manager()
+
+    # Only ever written through core.lyrics, core.ratings and core.signals, never from a (possibly stale) instance
+    LYRICS_FIELDS = ('lyrics_version', 'lyrics_payload', 'lyrics_hash')
+    COUNTER_FIELDS = ('rating_count', 'rating_sum', 'rating_score', 'comment_count')
+
+    # Relations mirrored into SongCredit (after the main artist), by role
+    CREDIT_RELATIONS = (('additional', 'additional_artists'), ('featured', 'featured_artists'))
+
+    # Read by core.signals through has_changed()
+    TRACKED_FIELDS = ('title', 'slug', 'artist_id', 'is_published')
+
+    class Meta:
+        indexes = [models.Index(fields=['-rating_score'], name='song_rating_score_idx')]
+
+    @property
+    def rating_average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
 
     def get_image_url(self):
         """Return song image if exists, otherwise return album image"""
@@ -83,37 +236,80 @@ class Song(models.Model):
 
     def get_all_primary_artists(self):
         """Return all primary artists (main + additional, not features)"""
-        artists = [self.artist]
-        artists.extend(self.additional_artists.all())
-        return artists
+        return self.credited_artists('main', 'additional')
+
+    def get_featured_artists(self):
+        return self.credited_artists('featured')
 
     def get_artist_display(self):
         """Return artist display string: 'Artist 1, Artist 2 feat. Featured Artist'"""
-        primary = [self.artist]
-        primary.extend(self.additional_artists.all())
-        primary_names = ", ".join(a.name for a in primary)
+        credited = self._credited()
+        primary_names = ", ".join(artist.name for role, artist in credited if role != 'featured')
 
-        featured = list(self.featured_artists.all())
+        featured = [artist for role, artist in credited if role == 'featured']
         if featured:
             featured_names = ", ".join(a.name for a in featured)
             return f"{primary_names} feat. {featured_names}"
         return primary_names
 
+    def get_absolute_url(self):
+        return reverse("song_detail", kwargs={"artist": self.artist.slug, "song": self.slug})
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(f"{self.artist.name}-{self.title}")
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LYRICS_FIELDS + self.COUNTER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return f"{self.title} — {self.get_artist_display()}"
 
 
+class SongCredit(models.Model):
+    """An artist credited on a song, in display order. Written by core.credits only."""
+    ROLE_CHOICES = [('main', 'Main'), ('additional', 'Additional'), ('featured', 'Featured')]
+
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='credits')
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='song_credits')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['position']
+        unique_together = ('song', 'position')
+
+    def __str__(self) -> str:
+        return f"{self.artist.name} ({self.role}) on {self.song.title}"
+
+
+class AlbumCredit(models.Model):
+    """An artist credited on an album, in display order. Written by core.credits only."""
+    ROLE_CHOICES = [('main', 'Main'), ('additional', 'Additional')]
+
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='credits')
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='album_credits')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['position']
+        unique_together = ('album', 'position')
+
+    def __str__(self) -> str:
+        return f"{self.artist.name} ({self.role}) on {self.album.title}"
+
+
 class Line(models.Model):
     song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name="lines")
     no = models.IntegerField()
     original = models.TextField()
     romanized = models.TextField(blank=True, null=True)
     translation_en = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("song", "no")
@@ -143,6 +339,8 @@ class SongComment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # Keyset pages of one thread (core.comments)
+        indexes = [models.Index(fields=['song', '-created_at', '-id'], name='songcomment_thread_idx')]
 
     def __str__(self) -> str:
         return f"{self.user.username} on {self.song.title}"
@@ -157,6 +355,8 @@ class ArtistComment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # Keyset pages of one thread (core.comments)
+        indexes = [models.Index(fields=['artist', '-created_at', '-id'], name='artistcomment_thread_idx')]
 
     def __str__(self) -> str:
         return f"{self.user.username} on {self.artist.name}"
@@ -208,7 +408,7 @@ class PageView(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     session_key = models.CharField(max_length=40, blank=True)
     user_agent = models.CharField(max_length=500, blank=True)
-    viewed_at = models.DateTimeField(auto_now_add=True)
+    viewed_at = models.DateTimeField(default=timezone.now)  # Set at request time, even when written later
 
     class Meta:
         ordering = ['-viewed_at']
@@ -223,14 +423,31 @@ class PageView(models.Model):
         return f"{self.content_type}: {self.content_title or self.url} at {self.viewed_at}"
 
 
+class ContentViewCounter(models.Model):
+    """Running view total per song/artist/album, incremented as views are recorded"""
+    content_type = models.CharField(max_length=20, choices=PageView.CONTENT_TYPE_CHOICES)
+    content_id = models.IntegerField()
+    views = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('content_type', 'content_id')
+
+    def __str__(self) -> str:
+        return f"{self.content_type} #{self.content_id}: {self.views} views"
+
+
 class SiteStats(models.Model):
     """Aggregate site statistics updated daily"""
     date = models.DateField(unique=True)
     total_views = models.IntegerField(default=0)
-    unique_visitors = models.IntegerField(default=0)  # Based on IP + session
+    unique_visitors = models.IntegerField(default=0)  # Based on IP + session (estimated from session_sketch)
     unique_ips = models.IntegerField(default=0)
     registered_user_views = models.IntegerField(default=0)
     anonymous_views = models.IntegerField(default=0)
+    # HyperLogLog sketches (core.hll) so multi-day distinct counts can be merged
+    ip_sketch = models.BinaryField(null=True, blank=True)
+    session_sketch = models.BinaryField(null=True, blank=True)  # Session key, or IP when there is no session
+    user_sketch = models.BinaryField(null=True, blank=True)
 
     class Meta:
         ordering = ['-date']
@@ -239,3 +456,120 @@ class SiteStats(models.Model):
 
     def __str__(self) -> str:
         return f"Stats for {self.date}: {self.total_views} views, {self.unique_visitors} unique visitors"
+
+
+class DailyContentStats(models.Model):
+    """Views per song/artist/album per day, rolled up from PageView"""
+    date = models.DateField()
+    content_type = models.CharField(max_length=20, choices=PageView.CONTENT_TYPE_CHOICES)
+    content_id = models.IntegerField()
+    views = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', '-views']
+        unique_together = ('date', 'content_type', 'content_id')
+        indexes = [
+            models.Index(fields=['content_type', 'date']),
+        ]
+        verbose_name = 'Daily Content Statistics'
+        verbose_name_plural = 'Daily Content Statistics'
+
+    def __str__(self) -> str:
+        return f"{self.content_type} #{self.content_id} on {self.date}: {self.views} views"
+
+
+class HourlyContentViews(models.Model):
+    """Views per song/artist/album per hour, rolled up from PageView for the charts"""
+    hour = models.DateTimeField()  # Start of the hour
+    content_type = models.CharField(max_length=20, choices=PageView.CONTENT_TYPE_CHOICES)
+    content_id = models.IntegerField()
+    views = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-hour', '-views']
+        unique_together = ('hour', 'content_type', 'content_id')
+        indexes = [
+            models.Index(fields=['content_type', 'hour']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.content_type} #{self.content_id} at {self.hour:%Y-%m-%d %H:00}: {self.views} views"
+
+
+class ChartEntry(models.Model):
+    """One ranked position in a materialized chart, rebuilt by core.charts.build_charts"""
+    CHART_CHOICES = [
+        ('daily', 'Today'),
+        ('weekly', 'This Week'),
+        ('monthly', 'This Month'),
+        ('all_time', 'All Time'),
+        ('trending', 'Trending Now'),
+    ]
+
+    chart = models.CharField(max_length=20, choices=CHART_CHOICES)
+    content_type = models.CharField(max_length=20, choices=PageView.CONTENT_TYPE_CHOICES)
+    rank = models.PositiveIntegerField()
+    content_id = models.IntegerField()
+    views = models.BigIntegerField(default=0)
+    score = models.FloatField(default=0)  # Ranking score; time-decayed views for 'trending'
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['chart', 'content_type', 'rank']
+        unique_together = ('chart', 'content_type', 'rank')
+        verbose_name_plural = 'Chart entries'
+
+    def __str__(self) -> str:
+        return f"{self.get_chart_display()} #{self.rank}: {self.content_type} #{self.content_id}"
+
+
+class RollupWatermark(models.Model):
+    """Last PageView id folded into the rollup tables by a named rollup"""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} at PageView #{self.last_id}"
+
+
+class FuzzyTerm(models.Model):
+    """A normalized word or title in the trigram index (see core.fuzzy)"""
+    text = models.CharField(max_length=255, unique=True)
+    trigram_count = models.PositiveSmallIntegerField()
+    # Lyric lines the word is in; kept by core.fuzzy so unused terms can be pruned
+    line_count = models.PositiveIntegerField(default=0, editable=False)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class FuzzyTrigram(models.Model):
+    """Posting from a character trigram to a FuzzyTerm containing it"""
+    trigram = models.CharField(max_length=3)
+    term = models.ForeignKey(FuzzyTerm, on_delete=models.CASCADE, related_name='trigrams')
+
+    class Meta:
+        unique_together = ('trigram', 'term')
+        indexes = [
+            models.Index(fields=['trigram']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.trigram!r} -> {self.term}"
+
+
+class FuzzyTermOccurrence(models.Model):
+    """Song title, artist name or album title a FuzzyTerm was indexed from"""
+    term = models.ForeignKey(FuzzyTerm, on_delete=models.CASCADE, related_name='occurrences')
+    content_type = models.CharField(max_length=20, choices=PageView.CONTENT_TYPE_CHOICES)
+    object_id = models.IntegerField()
+
+    class Meta:
+        unique_together = ('term', 'content_type', 'object_id')
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.term} in {self.content_type} #{self.object_id}"
@@ -0,0 +1,186 @@
+"""Keyset (seek) pagination with capped counts.
+
+Pages are addressed by an opaque cursor that holds the sort-key values of the
+row at the edge of the page. Fetching the next page is a range query on those
+keys with a LIMIT, never an OFFSET, so deep pages cost the same as the first.
+Totals are only counted up to COUNT_CAP and shown as "1000+" beyond that.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+COUNT_CAP = 1000
+
+
+class KeysetPage:
+    """One page of results plus cursors for its neighbours."""
+
+    def __init__(self, object_list, count, params, param, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.count = count  # Capped at COUNT_CAP + 1
+        self.params = params
+        self.param = param
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def count_label(self):
+        return f"{COUNT_CAP}+" if self.count > COUNT_CAP else str(self.count)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def next_query(self):
+        return self._query(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self._query(self.previous_cursor)
+
+    def _query(self, cursor):
+        params = self.params.copy()
+        params[self.param] = cursor
+        return params.urlencode()
+
+
+def paginate_keyset(queryset, params, param, per_page=20):
+    """Page of `queryset`, in its ordering, addressed by the cursor in `params[param]` (e.g. request.GET).
+
+    The ordering must be plain field or annotation names with non-null values.
+    """
+    ordering = [str(field) for field in queryset.query.order_by or queryset.model._meta.ordering]
+    if not {'pk', 'id', '-pk', '-id'} & set(ordering):
+        ordering.append('pk')  # Unique tiebreaker so no row is skipped or repeated
+
+    direction, values = decode_cursor(params.get(param), len(ordering))
+    forward = direction != 'before'
+    page_qs = queryset.order_by(*(ordering if forward else [_reverse(field) for field in ordering]))
+    if values is not None:
+        try:
+            page_qs = page_qs.filter(_seek(ordering, values, forward))
+        except (ValidationError, ValueError, TypeError):
+            # Values the sort fields can't take (a crafted cursor): first page
+            direction, values, forward = None, None, True
+            page_qs = queryset.order_by(*ordering)
+    rows = list(page_qs[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    if values is None and not more:
+        count = len(rows)
+    else:
+        count = queryset.order_by()[:COUNT_CAP + 1].count()
+
+    has_next = more if forward else values is not None
+    has_previous = values is not None if forward else more
+    return KeysetPage(
+        rows, count, params, param,
+        next_cursor=encode_cursor('after', _key(rows[-1], ordering)) if rows and has_next else None,
+        previous_cursor=encode_cursor('before', _key(rows[0], ordering)) if rows and has_previous else None,
+    )
+
+
+def paginate_ids(queryset, ids, params, param, per_page=20, more_ids=None):
+    """Page of a precomputed, ordered id list (e.g. cached results), hydrated from `queryset`.
+
+    `ids` may hold COUNT_CAP + 1 ids to signal "more than COUNT_CAP". Pages
+    past the first COUNT_CAP ids come from `more_ids(offset, limit)`, which
+    returns the ids at those positions of the full result; without it they
+    can't be reached. Cursors hold the id and position at the page edge; one
+    whose id is no longer in the list falls back to the first page.
+    """
+    direction, values = decode_cursor(params.get(param), 2)
+    complete = len(ids) <= COUNT_CAP
+    visible = ids if complete else ids[:COUNT_CAP]
+    start = 0
+    if values is not None:
+        edge_id, edge = values
+        if edge_id in visible:
+            edge = visible.index(edge_id)
+        elif complete or more_ids is None or not isinstance(edge, int) or edge < COUNT_CAP:
+            edge = None
+        if edge is not None:
+            start = edge + 1 if direction == 'after' else max(edge - per_page, 0)
+
+    page_ids = visible[start:start + per_page + 1]
+    if not complete and more_ids is not None and len(page_ids) <= per_page:
+        offset = max(start, len(visible))
+        page_ids += more_ids(offset, start + per_page + 1 - offset)
+    has_next = len(page_ids) > per_page
+    page_ids = page_ids[:per_page]
+    objects = queryset.in_bulk(page_ids)
+
+    return KeysetPage(
+        [objects[pk] for pk in page_ids if pk in objects], len(ids), params, param,
+        next_cursor=encode_cursor('after', [page_ids[-1], start + len(page_ids) - 1]) if has_next else None,
+        previous_cursor=encode_cursor('before', [page_ids[0], start]) if page_ids and start > 0 else None,
+    )
+
+
+def encode_cursor(direction, values):
+    # Datetimes go in as ISO strings; the seek filter parses them back
+    payload = json.dumps([direction, values], separators=(',', ':'), default=_isoformat).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """(direction, values), or (None, None) for a missing or malformed cursor."""
+    if not cursor:
+        return None, None
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError, binascii.Error):
+        return None, None
+    if direction not in ('after', 'before') or not isinstance(values, list) or len(values) != size:
+        return None, None
+    return direction, values
+
+
+def _isoformat(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Can't put {type(value).__name__} in a cursor")
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f"-{field}"
+
+
+def _seek(ordering, values, forward):
+    """Rows strictly beyond `values` in `ordering` (or before them, going backwards)."""
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'gt' if field.startswith('-') != forward else 'lt'
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+    return condition
+
+
+def _key(obj, ordering):
+    values = []
+    for field in ordering:
+        value = obj
+        for attr in field.lstrip('-').split('__'):
+            value = getattr(value, attr)
+        values.append(value)
+    return values
@@ -0,0 +1,85 @@
+"""Rating aggregates stored on Song and Artist, and the "top rated" lists.
+
+Pages show an average rating and the stats page totals, so instead of
+aggregating the rating tables on every view, each Song and Artist carries
+rating_count and rating_sum. rate() changes them in the same transaction as
+the rating itself; deleting a rating (core.signals) takes it back out.
+
+rating_score is the Bayesian average of the ratings: as if every item also
+had RATING_PRIOR_WEIGHT votes of RATING_PRIOR_MEAN, so one 5-star vote
+doesn't top the list. It is written along with the totals and indexed, so
+top_rated() reads the first rows of that index. Ratings changed outside
+rate() (e.g. in the admin), or a change to either prior, need
+`manage.py rebuild_rating_totals`.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Artist, ArtistRating, Song, SongRating
+
+# Rated model: (rating model, its foreign key to the rated model)
+RATING_MODELS = {
+    Song: (SongRating, 'song'),
+    Artist: (ArtistRating, 'artist'),
+}
+
+
+def bayesian_score(total, count):
+    """Expression for the Bayesian average of `total` over `count` ratings."""
+    weight = max(float(getattr(settings, 'RATING_PRIOR_WEIGHT', 5)), 1.0)
+    mean = float(getattr(settings, 'RATING_PRIOR_MEAN', 3.0))
+    return ExpressionWrapper(
+        (Value(weight * mean) + total) / (Value(weight) + count), output_field=FloatField()
+    )
+
+
+def rate(obj, user, value):
+    """Create or change `user`'s rating of a Song or Artist and update its totals. True if new."""
+    rating_model, key = RATING_MODELS[type(obj)]
+    with transaction.atomic():
+        previous = (
+            rating_model.objects.select_for_update().filter(user=user, **{key: obj})
+            .values_list('rating', flat=True).first()
+        )
+        _, created = rating_model.objects.update_or_create(user=user, **{key: obj}, defaults={'rating': value})
+        adjust_totals(type(obj), obj.pk, int(created), value - (previous or 0))
+    return created
+
+
+def adjust_totals(model, pk, count, total):
+    """Add `count` ratings summing to `total` to one row's totals, and rescore it."""
+    new_count = F('rating_count') + count
+    new_total = F('rating_sum') + total
+    model.objects.filter(pk=pk).update(
+        rating_count=new_count, rating_sum=new_total, rating_score=bayesian_score(new_total, new_count),
+    )
+    if count < 0:
+        # Unrated again: off the top rated lists
+        model.objects.filter(pk=pk, rating_count=0).update(rating_score=None)
+
+
+def rebuild_totals(model, rating_model, key):
+    """Recount the totals and scores of every row of `model` from `rating_model`, whose foreign key to it is `key`."""
+    totals = (
+        rating_model.objects.filter(**{key: OuterRef('pk')}).order_by()
+        .values(key).annotate(count=Count('pk'), total=Sum('rating'))
+    )
+    with transaction.atomic():
+        model.objects.update(
+            rating_count=Coalesce(Subquery(totals.values('count')), 0),
+            rating_sum=Coalesce(Subquery(totals.values('total')), 0),
+        )
+        model.objects.filter(rating_count=0).update(rating_score=None)
+        model.objects.filter(rating_count__gt=0).update(
+            rating_score=bayesian_score(F('rating_sum'), F('rating_count'))
+        )
+
+
+def top_rated(model, limit=20):
+    """Rated songs (published only) or artists, best Bayesian average first."""
+    queryset = model.objects.filter(rating_score__isnull=False)
+    if model is Song:
+        queryset = queryset.filter(is_published=True).select_related('artist')
+    return list(queryset.order_by('-rating_score', 'pk')[:limit])
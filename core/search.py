@@ -0,0 +1,274 @@
+"""Full-text search over lyric lines.
+
+On PostgreSQL core_line carries a stored, generated tsvector column
+(search_vector) with a GIN index. On SQLite an FTS5 external-content table
+(core_line_fts) is kept in sync with core_line by triggers. Either way the
+index follows every insert, update and delete, including bulk imports. Both
+are installed by install_search_index() (migration 0020, or
+`manage.py rebuild_search_index`). When neither is available, or
+SEARCH_BACKEND is 'icontains', search falls back to icontains scans.
+
+search_catalog() builds the result querysets for every section of the search
+page. cached_result_ids() caches the ordered ids they match under the
+normalized query and the catalog and lines version stamps, so a popular
+query is computed once per catalog or lyrics change. Only the first COUNT_CAP ids per section are
+cached; the rare visits beyond them query with result_ids_from().
+"""
+import hashlib
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .caching import CATALOG_VERSION, LINES_VERSION, count_event, get_version, hit_rate_stats
+from .fuzzy import FuzzyQuery, with_fuzzy_matches
+from .models import Album, Artist, Line, Song
+from .pagination import COUNT_CAP
+
+# Matches in the original text rank above romanized, then translation
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(original, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(romanized, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(translation_en, '')), 'C')"
+)
+FTS_COLUMNS = 'original, romanized, translation_en'
+FTS_WEIGHTS = '3.0, 2.0, 1.0'
+
+# Order of equally ranked lines (and of every icontains result)
+LINE_ORDER = ('song__artist__name', 'song__title', 'no')
+
+
+def search_terms(q):
+    """Whitespace-separated words of a query that contain something searchable."""
+    return [term for term in q.split() if any(ch.isalnum() for ch in term)]
+
+
+def term_alternatives(terms, variants=None):
+    """Each query term with its fuzzy spelling variants (see core.fuzzy), for OR-matching."""
+    variants = variants or {}
+    return [list(dict.fromkeys([term, *variants.get(term.lower(), [])])) for term in terms]
+
+
+class IContainsBackend:
+    """Substring scan over every line; no index required."""
+
+    name = 'icontains'
+
+    def search_lines(self, queryset, q, variants=None):
+        match = Q(original__icontains=q) | Q(translation_en__icontains=q) | Q(romanized__icontains=q)
+        for spellings in (variants or {}).values():
+            for spelling in spellings:
+                match |= Q(romanized__icontains=spelling)
+        return queryset.filter(match).order_by(*LINE_ORDER)
+
+
+class PostgresBackend:
+    """tsvector/GIN search; every term matches as a prefix, ranked with ts_rank."""
+
+    name = 'postgres'
+
+    def search_lines(self, queryset, q, variants=None):
+        terms = search_terms(q)
+        if not terms:
+            return IContainsBackend().search_lines(queryset, q)
+        clauses, params = [], []
+        for alternatives in term_alternatives(terms, variants):
+            clauses.append('(' + ' || '.join(["to_tsquery('simple', quote_literal(%s) || ':*')"] * len(alternatives)) + ')')
+            params += alternatives
+        tsquery = ' && '.join(clauses)
+        matches = RawSQL(f"SELECT id FROM core_line WHERE search_vector @@ ({tsquery})", params)
+        rank = RawSQL(f"ts_rank(core_line.search_vector, {tsquery})", params, output_field=FloatField())
+        return (
+            queryset.filter(id__in=matches)
+            .annotate(search_rank=rank)
+            .order_by('-search_rank', *LINE_ORDER)
+        )
+
+
+class SQLiteFTSBackend:
+    """FTS5 search; every term matches as a prefix, ranked with bm25."""
+
+    name = 'sqlite_fts'
+
+    def search_lines(self, queryset, q, variants=None):
+        terms = search_terms(q)
+        if not terms:
+            return IContainsBackend().search_lines(queryset, q)
+        # Quote each term so user input can't be parsed as FTS5 syntax
+        match = ' AND '.join(
+            '(' + ' OR '.join('"%s"*' % term.replace('"', '""') for term in alternatives) + ')'
+            for alternatives in term_alternatives(terms, variants)
+        )
+        matches = RawSQL("SELECT rowid FROM core_line_fts WHERE core_line_fts MATCH %s", (match,))
+        rank = RawSQL(
+            f"SELECT -bm25(core_line_fts, {FTS_WEIGHTS}) FROM core_line_fts "
+            "WHERE core_line_fts MATCH %s AND rowid = core_line.id",
+            (match,), output_field=FloatField(),
+        )
+        return (
+            queryset.filter(id__in=matches)
+            .annotate(search_rank=rank)
+            .order_by('-search_rank', *LINE_ORDER)
+        )
+
+
+# Whether the index exists, per database, checked once per process
+_index_available = {}
+
+
+def get_search_backend():
+    """Backend for the default database, honouring the SEARCH_BACKEND setting."""
+    if getattr(settings, 'SEARCH_BACKEND', 'auto') == 'icontains':
+        return IContainsBackend()
+    key = (connection.vendor, connection.settings_dict['NAME'])
+    if key not in _index_available:
+        _index_available[key] = search_index_installed(connection)
+    if not _index_available[key]:
+        return IContainsBackend()
+    return PostgresBackend() if connection.vendor == 'postgresql' else SQLiteFTSBackend()
+
+
+def search_lines(queryset, q, variants=None):
+    """Lines in `queryset` matching `q`, best matches first.
+
+    `variants` maps query words to alternative spellings that also match.
+    """
+    return get_search_backend().search_lines(queryset, q, variants)
+
+
+def search_index_installed(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'core_line' AND column_name = 'search_vector'"
+            )
+            return cursor.fetchone() is not None
+        if conn.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_line_fts'")
+            return cursor.fetchone() is not None
+    return False
+
+
+def install_search_index(conn):
+    """Create (or rebuild) the full-text index for core_line. Returns False if unsupported."""
+    _index_available.clear()
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                "ALTER TABLE core_line ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({POSTGRES_VECTOR}) STORED"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS core_line_search_vector_idx ON core_line USING GIN (search_vector)"
+            )
+            return True
+        if conn.vendor != 'sqlite':
+            return False
+
+        # Django rebuilds SQLite tables to alter them, which drops the triggers;
+        # rerun this (`manage.py rebuild_search_index`) after migrations that alter Line
+        _drop_sqlite_index(cursor)
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE core_line_fts USING fts5({FTS_COLUMNS}, "
+                "content='core_line', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5
+            return False
+        new_row = f"INSERT INTO core_line_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, new.original, new.romanized, new.translation_en);"
+        old_row = (
+            f"INSERT INTO core_line_fts(core_line_fts, rowid, {FTS_COLUMNS}) "
+            "VALUES ('delete', old.id, old.original, old.romanized, old.translation_en);"
+        )
+        cursor.execute(f"CREATE TRIGGER core_line_fts_ai AFTER INSERT ON core_line BEGIN {new_row} END")
+        cursor.execute(f"CREATE TRIGGER core_line_fts_ad AFTER DELETE ON core_line BEGIN {old_row} END")
+        cursor.execute(f"CREATE TRIGGER core_line_fts_au AFTER UPDATE ON core_line BEGIN {old_row} {new_row} END")
+        cursor.execute("INSERT INTO core_line_fts(core_line_fts) VALUES ('rebuild')")
+        return True
+
+
+def uninstall_search_index(conn):
+    _index_available.clear()
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS core_line_search_vector_idx")
+            cursor.execute("ALTER TABLE core_line DROP COLUMN IF EXISTS search_vector")
+        elif conn.vendor == 'sqlite':
+            _drop_sqlite_index(cursor)
+
+
+def _drop_sqlite_index(cursor):
+    for trigger in ('core_line_fts_ai', 'core_line_fts_ad', 'core_line_fts_au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS core_line_fts")
+
+
+def normalize_query(q):
+    """NFC, case-folded and whitespace-collapsed form of a search query."""
+    return ' '.join(unicodedata.normalize('NFC', q).casefold().split())
+
+
+def search_catalog(q):
+    """Ordered querysets of the songs, lyric lines, albums and artists matching `q`."""
+    # Trigram lookup for misspelled or differently romanized queries, shared by all sections
+    fuzzy = FuzzyQuery(q)
+    return {
+        'songs': with_fuzzy_matches(
+            Song.objects.filter(is_published=True).select_related('artist', 'album'),
+            Q(title__icontains=q) | Q(artist__name__icontains=q) | Q(album__title__icontains=q),
+            fuzzy.matches('song'),
+            'title',
+        ).distinct(),
+        'lines': search_lines(
+            Line.objects.filter(song__is_published=True).select_related('song', 'song__artist'),
+            q, variants=fuzzy.variants(),
+        ),
+        'albums': with_fuzzy_matches(
+            Album.objects.select_related('artist'),
+            Q(title__icontains=q) | Q(artist__name__icontains=q),
+            fuzzy.matches('album'),
+            'title',
+        ).distinct(),
+        'artists': with_fuzzy_matches(
+            Artist.objects.all(), Q(name__icontains=q), fuzzy.matches('artist'), 'name'
+        ).distinct(),
+    }
+
+
+def cached_result_ids(q):
+    """{section: [ids in result order]} for `q`, at most COUNT_CAP + 1 per section.
+
+    Cached under the normalized query and the catalog and lines versions, so
+    any catalog or lyrics edit invalidates every entry. Hits and misses are
+    counted (see search_cache_stats()).
+    """
+    q = normalize_query(q)
+    digest = hashlib.sha1(q.encode('utf-8')).hexdigest()
+    key = f"search:{get_version(CATALOG_VERSION)}:{get_version(LINES_VERSION)}:{digest}"
+    ids = cache.get(key)
+    if ids is not None:
+        count_event('search_cache_hit')
+        return ids
+
+    count_event('search_cache_miss')
+    ids = {
+        section: list(queryset.values_list('pk', flat=True)[:COUNT_CAP + 1])
+        for section, queryset in search_catalog(q).items()
+    }
+    cache.set(key, ids, getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300))
+    return ids
+
+
+def result_ids_from(q, section, offset, limit):
+    """Ids of one section's results for `q` at positions beyond the cached ones, uncached."""
+    queryset = search_catalog(normalize_query(q))[section]
+    return list(queryset.values_list('pk', flat=True)[offset:offset + limit])
+
+
+def search_cache_stats():
+    return hit_rate_stats('search_cache_hit', 'search_cache_miss')
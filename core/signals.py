@@ -0,0 +1,171 @@
+"""Keep derived search indexes, lyrics payloads, artist credits, rating and comment counts and cache stamps in step with edits."""
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import CATALOG_VERSION, LINES_VERSION, NAMES_VERSION, bump_version_on_commit
+from .credits import sync_album_credits, sync_song_credits
+from .fuzzy import NAME_FIELDS, index_line_words, index_object, unindex_line_words, unindex_object
+from .lyrics import refresh_lyrics
+from .models import (
+    Album, AlbumCredit, Artist, ArtistComment, ArtistRating, Line, Song, SongComment, SongCredit, SongRating,
+    UserProfile,
+)
+from .ratings import adjust_totals
+from .userstate import user_state_version
+
+INDEXED_MODELS = {Song: 'song', Artist: 'artist', Album: 'album'}
+
+# Fields the typeahead suggestions are built from, per model (see NAMES_VERSION)
+SUGGESTED_FIELDS = {
+    Song: ('title', 'slug', 'artist_id', 'is_published'),
+    Artist: ('name', 'slug'),
+    Album: ('title', 'slug', 'artist_id'),
+}
+
+# Credited model: (credit sync, credit model, its foreign key to the credited model)
+CREDITED_MODELS = {
+    Song: (sync_song_credits, SongCredit, 'song_id'),
+    Album: (sync_album_credits, AlbumCredit, 'album_id'),
+}
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+def index_name(sender, instance, update_fields=None, **kwargs):
+    bump_version_on_commit(CATALOG_VERSION)
+    if any(instance.has_changed(field) for field in SUGGESTED_FIELDS[sender]):
+        bump_version_on_commit(NAMES_VERSION)
+    content_type = INDEXED_MODELS[sender]
+    field = NAME_FIELDS[content_type]
+    if (update_fields is None or field in update_fields) and instance.has_changed(field):
+        index_object(content_type, instance.pk, getattr(instance, field))
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Album)
+def sync_main_credit(sender, instance, update_fields=None, **kwargs):
+    # The main artist is a foreign key; the other credits follow m2m_changed below
+    if (update_fields is None or 'artist' in update_fields) and instance.has_changed('artist_id'):
+        CREDITED_MODELS[sender][0]([instance.pk])
+
+
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Album)
+def unindex_name(sender, instance, **kwargs):
+    bump_version_on_commit(CATALOG_VERSION)
+    bump_version_on_commit(NAMES_VERSION)
+    unindex_object(INDEXED_MODELS[sender], instance.pk)
+
+
+@receiver(pre_save, sender=Line)
+def remember_romanized(sender, instance, update_fields=None, **kwargs):
+    # The words being replaced, to take out of the fuzzy index's line counts
+    instance._indexed_romanized = None
+    if instance.pk and (update_fields is None or 'romanized' in update_fields):
+        instance._indexed_romanized = (
+            Line.objects.filter(pk=instance.pk).values_list('romanized', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Line)
+def index_line(sender, instance, update_fields=None, **kwargs):
+    bump_version_on_commit(LINES_VERSION)
+    refresh_lyrics(instance.song_id)
+    if update_fields is not None and 'romanized' not in update_fields:
+        return
+    previous = getattr(instance, '_indexed_romanized', None)
+    if previous != instance.romanized:
+        if instance.romanized:
+            index_line_words([instance.romanized])
+        if previous:
+            unindex_line_words([previous])
+
+
+@receiver(post_delete, sender=Line)
+def unindex_line(sender, instance, **kwargs):
+    bump_version_on_commit(LINES_VERSION)
+    refresh_lyrics(instance.song_id)
+    if instance.romanized:
+        unindex_line_words([instance.romanized])
+
+
+@receiver(m2m_changed, sender=Song.additional_artists.through)
+@receiver(m2m_changed, sender=Song.featured_artists.through)
+@receiver(m2m_changed, sender=Album.additional_artists.through)
+def touch_linked_artists(sender, instance, action, reverse, model, pk_set=None, **kwargs):
+    # Artist credits are shown on the page, so they count as a change to it (see core.conditional)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    bump_version_on_commit(CATALOG_VERSION)
+    now = timezone.now()
+    if not reverse:
+        type(instance).objects.filter(pk=instance.pk).update(updated_at=now)
+        CREDITED_MODELS[type(instance)][0]([instance.pk])
+        return
+    # Changed from the artist's side: `model` is Song or Album
+    sync, credit_model, credit_key = CREDITED_MODELS[model]
+    if pk_set is None:
+        # Cleared: the credits still list what the artist was linked to
+        role = 'featured' if sender is Song.featured_artists.through else 'additional'
+        pk_set = set(
+            credit_model.objects.filter(artist=instance, role=role).values_list(credit_key, flat=True)
+        )
+    if pk_set:
+        model.objects.filter(pk__in=pk_set).update(updated_at=now)
+        sync(pk_set)
+
+
+@receiver(post_delete, sender=SongRating)
+def unrate_song(sender, instance, **kwargs):
+    # New and changed ratings are counted by core.ratings.rate()
+    adjust_totals(Song, instance.song_id, -1, -instance.rating)
+
+
+@receiver(post_delete, sender=ArtistRating)
+def unrate_artist(sender, instance, **kwargs):
+    adjust_totals(Artist, instance.artist_id, -1, -instance.rating)
+
+
+@receiver(post_save, sender=SongComment)
+@receiver(post_delete, sender=SongComment)
+@receiver(post_save, sender=ArtistComment)
+@receiver(post_delete, sender=ArtistComment)
+def count_comment(sender, instance, created=None, **kwargs):
+    model, pk = (Song, instance.song_id) if sender is SongComment else (Artist, instance.artist_id)
+    if created is False:
+        # Edited, not added: the page's comment stamp only sees new and deleted comments
+        model.objects.filter(pk=pk).update(updated_at=timezone.now())
+        return
+    step = 1 if created else -1
+    model.objects.filter(pk=pk).update(comment_count=F('comment_count') + step)
+
+
+@receiver(post_save, sender=SongRating)
+@receiver(post_delete, sender=SongRating)
+@receiver(post_save, sender=ArtistRating)
+@receiver(post_delete, sender=ArtistRating)
+def bump_rater_state(sender, instance, **kwargs):
+    # The user's cached favorites and ratings (core.userstate)
+    bump_version_on_commit(user_state_version(instance.user_id))
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_songs.through)
+@receiver(m2m_changed, sender=UserProfile.favorite_artists.through)
+def bump_favoriter_state(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_version_on_commit(user_state_version(instance.user_id))
+        return
+    # Changed from the song's or artist's side: `instance` is the Song or Artist
+    if action == 'pre_clear':
+        user_ids = instance.favorited_by.values_list('user_id', flat=True)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        user_ids = UserProfile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)
+    else:
+        return
+    for user_id in user_ids:
+        bump_version_on_commit(user_state_version(user_id))
@@ -0,0 +1,220 @@
+from datetime import timedelta
+from io import StringIO
+import shutil
+import tempfile
+from unittest.mock import Mock, patch
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.analytics import traffic_summary, top_content, visitor_summary
+from core.archive import iter_archived_page_views
+from core.caching import TieredCache, bump_version, cached_value
+from core.charts import resolve_chart
+from core.hll import HyperLogLog
+from core.models import Artist, ChartEntry, DailyContentStats, PageView, SiteStats, Song
+
+
+class RollupStatsTest(TestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="Diljit Dosanjh")
+        self.song = Song.objects.create(artist=artist, title="Lover", is_published=True)
+        now = timezone.now()
+        self.yesterday = now - timedelta(days=1)
+        for when, ip in [(self.yesterday, "10.0.0.1"), (now, "10.0.0.1"), (now, "10.0.0.2")]:
+            self.view(when, ip)
+
+    def view(self, when, ip):
+        PageView.objects.create(
+            content_type="song", content_id=self.song.pk, url=self.song.get_absolute_url(),
+            ip_address=ip, viewed_at=when,
+        )
+
+    def test_rollup_is_incremental_and_idempotent(self):
+        call_command("rollup_stats", chunk_size=2, stdout=StringIO())
+        call_command("rollup_stats", stdout=StringIO())
+
+        today = SiteStats.objects.get(date=timezone.localdate())
+        self.assertEqual(today.total_views, 2)
+        self.assertEqual(today.unique_ips, 2)
+        self.assertEqual(DailyContentStats.objects.get(date=today.date).views, 2)
+
+        self.view(timezone.now(), "10.0.0.3")
+        call_command("rollup_stats", stdout=StringIO())
+        today.refresh_from_db()
+        self.assertEqual(today.total_views, 3)
+        self.assertEqual(today.unique_ips, 3)
+        self.assertEqual(top_content("song"), [{"content_id": self.song.pk, "views": 4}])
+
+    def test_summary_includes_rows_not_rolled_up(self):
+        call_command("rollup_stats", stdout=StringIO())
+        self.view(timezone.now(), "10.0.0.4")
+        summary = traffic_summary()
+        self.assertEqual(summary["total_views"], 4)
+        self.assertEqual(summary["views_today"], 3)
+        self.assertEqual(summary["views_7d"], 4)
+
+    def test_rebuild_matches_incremental(self):
+        call_command("rollup_stats", stdout=StringIO())
+        call_command("rollup_stats", rebuild=True, chunk_size=1, stdout=StringIO())
+        self.assertEqual(SiteStats.objects.get(date=timezone.localdate()).total_views, 2)
+        self.assertEqual(traffic_summary()["total_views"], 3)
+
+
+class HyperLogLogTest(TestCase):
+    def test_estimate_merge_and_round_trip(self):
+        first = HyperLogLog().update(f"user-{i}" for i in range(20000))
+        second = HyperLogLog().update(f"user-{i}" for i in range(10000, 30000))
+        self.assertAlmostEqual(first.count(), 20000, delta=20000 * 0.05)
+
+        restored = HyperLogLog.from_bytes(first.to_bytes())
+        self.assertEqual(restored.count(), first.count())
+        self.assertAlmostEqual(restored.merge(second).count(), 30000, delta=30000 * 0.05)
+
+    def test_visitor_summary_merges_days(self):
+        now = timezone.now()
+        for days_ago, ip in [(0, "1.1.1.1"), (1, "1.1.1.1"), (1, "2.2.2.2"), (10, "3.3.3.3")]:
+            PageView.objects.create(url="/", ip_address=ip, viewed_at=now - timedelta(days=days_ago))
+        call_command("rollup_stats", stdout=StringIO())
+        PageView.objects.create(url="/", ip_address="4.4.4.4", viewed_at=now)
+
+        summary = visitor_summary(now)
+        self.assertEqual(summary["unique_ips_today"], 2)
+        self.assertEqual(summary["unique_ips_7d"], 3)
+        self.assertEqual(summary["unique_ips_30d"], 4)
+        self.assertEqual(summary["unique_ips_total"], 4)
+
+
+class ArchivePageViewsTest(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        now = timezone.now()
+        for days_ago in (400, 400, 300, 1):
+            PageView.objects.create(url=f"/old/{days_ago}/", ip_address="1.1.1.1",
+                                    viewed_at=now - timedelta(days=days_ago))
+
+    def archive(self):
+        with override_settings(PAGEVIEW_ARCHIVE_DIR=self.archive_dir):
+            call_command("archive_pageviews", days=180, chunk_size=2, delete_batch_size=1,
+                         stdout=StringIO())
+
+    def test_only_rolled_up_rows_are_archived(self):
+        self.archive()
+        self.assertEqual(PageView.objects.count(), 4)
+
+    def test_old_rows_move_to_archive_and_rollups_survive_rebuild(self):
+        call_command("rollup_stats", stdout=StringIO())
+        self.archive()
+        self.assertEqual(list(PageView.objects.values_list("url", flat=True)), ["/old/1/"])
+
+        archived = list(iter_archived_page_views(archive_dir=self.archive_dir))
+        self.assertEqual(sorted(row["url"] for row in archived), ["/old/300/", "/old/400/", "/old/400/"])
+        self.assertIsNotNone(archived[0]["viewed_at"].tzinfo)
+
+        call_command("rollup_stats", rebuild=True, stdout=StringIO())
+        self.assertEqual(traffic_summary()["total_views"], 4)
+
+
+class ChartEngineTest(TestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="AP Dhillon")
+        self.old_hit = Song.objects.create(artist=artist, title="Excuses", is_published=True)
+        self.new_hit = Song.objects.create(artist=artist, title="With You", is_published=True)
+        now = timezone.now()
+        for song, hours_ago, count in [(self.old_hit, 100, 5), (self.new_hit, 1, 3), (self.old_hit, 30 * 24, 4)]:
+            for _ in range(count):
+                PageView.objects.create(content_type="song", content_id=song.pk, url=song.get_absolute_url(),
+                                        viewed_at=now - timedelta(hours=hours_ago))
+        call_command("rollup_stats", stdout=StringIO())
+
+    def ranking(self, chart):
+        return list(ChartEntry.objects.filter(chart=chart, content_type="song").values_list("content_id", "views"))
+
+    def test_windows_and_trending(self):
+        self.assertEqual(self.ranking("daily"), [(self.new_hit.pk, 3)])
+        self.assertEqual(self.ranking("weekly"), [(self.old_hit.pk, 5), (self.new_hit.pk, 3)])
+        self.assertEqual(self.ranking("trending")[0], (self.new_hit.pk, 3))
+
+    def test_homepage_reads_materialized_chart(self):
+        resp = self.client.get("/charts/?chart=trending")
+        self.assertEqual([s.pk for s in resp.context["top_songs"]], [self.new_hit.pk, self.old_hit.pk])
+        self.assertContains(resp, "Top Songs Trending Now")
+
+    def test_resolver_keeps_rank_and_drops_hidden_items(self):
+        hidden = Song.objects.create(artist=self.old_hit.artist, title="Draft", is_published=False)
+        keys = [("song", self.new_hit.pk, 3), ("song", hidden.pk, 2), ("artist", self.old_hit.artist_id, 9),
+                ("song", 999999, 1), ("song", self.old_hit.pk, 1)]
+        with self.assertNumQueries(2):
+            resolved = resolve_chart(keys)
+        self.assertEqual([obj.chart_title for obj in resolved], ["With You — AP Dhillon", "AP Dhillon", "Excuses — AP Dhillon"])
+        self.assertEqual([obj.chart_views for obj in resolved], [3, 9, 1])
+
+
+class StaleWhileRevalidateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_expired_value_served_while_rebuilding_and_on_error(self):
+        self.assertEqual(cached_value("k", lambda: 1, timeout=0), (1, True))
+        cache.add("lock:k", 1)  # Another worker is rebuilding it
+        self.assertEqual(cached_value("k", lambda: 2, timeout=60), (1, False))
+        cache.delete("lock:k")
+
+        def broken():
+            raise OperationalError("database is down")
+        self.assertEqual(cached_value("k", broken, timeout=60), (1, False))
+        self.assertEqual(cached_value("k", lambda: 3, timeout=60), (3, True))
+        self.assertEqual(cached_value("k", lambda: 4, timeout=60, version=2), (4, True))
+
+    def test_stats_page_is_cached(self):
+        self.client.get("/stats/")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/stats/").status_code, 200)
+        # Only the page view itself is written
+        self.assertEqual([q["sql"] for q in queries if "core_pageview" not in q["sql"] and "SAVEPOINT" not in q["sql"]], [])
+
+
+class TieredCacheTest(TestCase):
+    def check_tiers(self, shared):
+        # Two workers sharing one backend
+        first, second = TieredCache(shared, max_entries=2), TieredCache(shared, max_entries=2, check_interval=0)
+        self.assertEqual(first.get_or_set("a", lambda: 1, version="catalog"), 1)
+        self.assertEqual(second.get("a", version="catalog"), 1)  # From the shared tier
+        self.assertEqual(second.get("a", version="catalog"), 1)  # From its own
+        self.assertEqual(second.stats()["local"], {"hits": 1, "misses": 1, "hit_rate": 50.0})
+        self.assertEqual(second.stats()["shared"], {"hits": 1, "misses": 0, "hit_rate": 100.0})
+
+        bump_version("catalog", shared)  # An edit in the first worker
+        self.assertIsNone(second.get("a", version="catalog"))
+        self.assertEqual(first.get_or_set("a", lambda: 2, version="catalog"), 2)
+
+        # Least recently used entries leave the local tier first
+        for key in ("b", "c"):
+            first.set(key, key)
+        self.assertEqual(list(first._local), ["b", "c"])
+
+    def test_none_is_cached_and_per_process_tiers_expire_together(self):
+        shared = LocMemCache("tiered-none-test", {})
+        first, second = TieredCache(shared, local_timeout=5), TieredCache(shared, local_timeout=5)
+        build = Mock(return_value=None)
+        self.assertIsNone(first.get_or_set("empty", build, version="charts"))
+        self.assertIsNone(first.get_or_set("empty", build, version="charts"))  # Local tier
+        self.assertIsNone(second.get_or_set("empty", build, version="charts"))  # Shared tier
+        self.assertEqual(build.call_count, 1)
+
+        # Not seen by other processes' bumps: held for local_timeout, not 300s
+        with patch.object(shared, "set") as shared_set:
+            first.set("a", 1, timeout=300)
+        self.assertEqual(shared_set.call_args.args[2], 5)
+
+    def test_locmem_shared_tier(self):
+        self.check_tiers(LocMemCache("tiered-test", {}))
+
+    def test_file_based_shared_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.check_tiers(FileBasedCache(directory, {}))
@@ -1,11 +1,26 @@
 from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.http import QueryDict
 from django.urls import reverse
-from core.models import Artist, Song, Line
+from unittest.mock import patch
+from core.caching import tiered_cache
+from core.credits import discography
+from core.lyrics import decode_lyrics, render_lyrics_block
+from core.pagination import encode_cursor
+from core.ratings import rate, top_rated
+from core.userstate import UserState, load_user_state
+from core.models import Album, Artist, Song, Line, PageView, SongComment, SongRating, UserProfile
+from django.contrib.auth.models import User
 import csv, tempfile
+from io import StringIO
 
 class ImportAndViewsTest(TestCase):
     def setUp(self):
+        cache.clear()  # Lyrics blocks are keyed by song pk, which is reused between tests
+        tiered_cache.clear_local()
         # build a small CSV in a temp file
         self.tmp = tempfile.NamedTemporaryFile(mode="w+", newline="", suffix=".csv", delete=False, encoding="utf-8")
         writer = csv.DictWriter(self.tmp, fieldnames=["no","original","romanized","translation_en"])
@@ -22,6 +37,7 @@ class ImportAndViewsTest(TestCase):
             title="295",
             year=2021,
             publish=True,
+            stdout=StringIO(),
         )
 
     def test_home_lists_song(self):
@@ -40,3 +56,237 @@ class ImportAndViewsTest(TestCase):
         resp = self.client.get("/search/?q=mehnat")
         self.assertContains(resp, "295")
         self.assertContains(resp, "mehnat")
+
+
+    def test_lyrics_block_is_cached_until_lines_change(self):
+        song = Song.objects.get(title="295")
+        render_lyrics_block(song)
+        with self.assertNumQueries(0):
+            self.assertIn("Hard work", render_lyrics_block(song))
+
+        line = song.lines.get(no=2)
+        line.translation_en = "Effort"
+        line.save()
+        song.refresh_from_db()
+        self.assertIn("Effort", render_lyrics_block(song))
+
+        version = song.lyrics_version
+        call_command("import_song", self.tmp.name, artist="Sidhu Moose Wala", title="295", year=2021, publish=True, stdout=StringIO())
+        song.refresh_from_db()
+        self.assertGreater(song.lyrics_version, version)
+        self.assertIn("Hard work", render_lyrics_block(song))
+        self.assertEqual(song.lines.count(), 2)
+
+    def test_lyrics_payload_is_stored_and_backfilled(self):
+        song = Song.objects.get(title="295")
+        self.assertEqual([line["translation"] for line in decode_lyrics(song.lyrics_payload)], ["Fate", "Hard work"])
+        digest = song.lyrics_hash
+
+        Song.objects.filter(pk=song.pk).update(lyrics_payload=b"", lyrics_hash="")
+        call_command("backfill_lyrics", stdout=StringIO())
+        song.refresh_from_db()
+        self.assertEqual(song.lyrics_hash, digest)
+
+        cache.clear()
+        url = reverse("song_detail", kwargs={"artist": song.artist.slug, "song": song.slug})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(url), "Hard work")
+        self.assertFalse([q for q in queries if 'FROM "core_line"' in q["sql"]])
+
+    def test_unchanged_pages_answer_304(self):
+        song = Song.objects.get(title="295")
+        url = reverse("song_detail", kwargs={"artist": song.artist.slug, "song": song.slug})
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        line = song.lines.get(no=1)
+        line.translation_en = "Destiny"
+        line.save()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(resp, "Destiny")
+
+        index = self.client.get("/songs/")
+        self.assertEqual(
+            self.client.get("/songs/", HTTP_IF_MODIFIED_SINCE=index["Last-Modified"]).status_code, 304
+        )
+
+    def test_anonymous_pages_are_cached_until_content_changes(self):
+        song = Song.objects.get(title="295")
+        url = reverse("song_detail", kwargs={"artist": song.artist.slug, "song": song.slug})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(url), "Hard work")
+        # Only the newest comment's id is read, never the thread
+        [thread] = [q["sql"] for q in queries if 'FROM "core_songcomment"' in q["sql"]]
+        self.assertNotIn("COUNT", thread)
+        self.assertIn("LIMIT 1", thread)
+        self.assertEqual(PageView.objects.filter(content_type="song", content_id=song.pk).count(), 2)
+
+        user = User.objects.create_user("reader", password="pw")
+        comment = SongComment.objects.create(song=song, user=user, text="Classic")
+        SongComment.objects.create(song=song, user=user, text="Newer")
+        self.assertContains(self.client.get(url), "Classic")
+        comment.text = "Timeless"
+        comment.save()
+        self.assertContains(self.client.get(url), "Timeless")
+
+    def test_pages_are_shared_and_user_state_is_separate(self):
+        song = Song.objects.get(title="295")
+        url = reverse("song_detail", kwargs={"artist": song.artist.slug, "song": song.slug})
+        user = User.objects.create_user("reader", password="pw")
+        UserProfile.objects.create(user=user).favorite_songs.add(song)
+        SongRating.objects.create(song=song, user=user, rating=4)
+        anonymous = self.client.get(url)
+
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=anonymous["ETag"]).status_code, 304)
+
+        state = self.client.get(reverse("user_state"), {"song": f"{song.pk},x", "artist": ""}).json()
+        self.assertEqual(state["username"], "reader")
+        self.assertEqual(state["song"], {str(song.pk): {"favorite": True, "rating": 4}})
+        self.assertEqual(state["artist"], {})
+        self.assertTrue(state["csrf_token"])
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("user_state")).json(), {"authenticated": False})
+
+    def test_artist_credits_follow_relations_and_prefetch_once(self):
+        song = Song.objects.get(title="295")
+        guest, feature = Artist.objects.create(name="Karan Aujla"), Artist.objects.create(name="Divine")
+        song.featured_artists.add(feature)
+        song.additional_artists.add(guest)
+        self.assertEqual(
+            [(c.role, c.artist.name) for c in song.credits.all()],
+            [("main", "Sidhu Moose Wala"), ("additional", "Karan Aujla"), ("featured", "Divine")],
+        )
+        with self.assertNumQueries(2):
+            songs = list(Song.objects.with_credits())
+            self.assertEqual(songs[0].get_artist_display(), "Sidhu Moose Wala, Karan Aujla feat. Divine")
+            self.assertEqual(str(songs[0]), "295 — Sidhu Moose Wala, Karan Aujla feat. Divine")
+
+        # Cleared from the artist's side
+        feature.featured_songs.clear()
+        self.assertEqual(Song.objects.get(pk=song.pk).get_artist_display(), "Sidhu Moose Wala, Karan Aujla")
+
+    def test_rating_totals_and_top_rated(self):
+        song = Song.objects.get(title="295")
+        other = Song.objects.create(artist=song.artist, title="Once", is_published=True)
+        users = [User.objects.create_user(f"rater{i}", password="pw") for i in range(3)]
+        for user in users:
+            rate(song, user, 4)
+        rate(other, users[0], 5)
+        self.assertFalse(rate(song, users[0], 5))  # Changed, not added
+        song.refresh_from_db()
+        self.assertEqual((song.rating_count, song.rating_sum), (3, 13))
+        # A single 5-star vote doesn't beat three votes averaging 4.3
+        self.assertEqual(top_rated(Song), [song, other])
+
+        SongRating.objects.filter(song=other).delete()
+        Song.objects.filter(pk=song.pk).update(rating_count=0, rating_sum=0)
+        call_command("rebuild_rating_totals", stdout=StringIO())
+        self.assertEqual([(s.pk, s.rating_count, s.rating_sum) for s in top_rated(Song)], [(song.pk, 3, 13)])
+        self.assertContains(self.client.get(reverse("top_rated")), "295")
+
+    def test_comment_thread_pages_and_posts_fragments(self):
+        song = Song.objects.get(title="295")
+        user = User.objects.create_user("talker", password="pw")
+        for i in range(25):
+            SongComment.objects.create(song=song, user=user, text=f"comment {i}")
+        song_url = reverse("song_detail", kwargs={"artist": song.artist.slug, "song": song.slug})
+        page = self.client.get(song_url)
+        self.assertContains(page, "comment 24")
+        self.assertNotContains(page, "comment 4<")
+
+        thread_url = reverse("comment_thread", args=["song", song.pk])
+        more = self.client.get(f"{thread_url}?{page.context['comments'].next_query}").json()
+        self.assertIn("comment 0<", more["html"])
+        self.assertNotIn("comment 5<", more["html"])
+        self.assertIsNone(more["next"])
+
+        # Cursor values the sort fields can't take fall back to the first page
+        crafted = encode_cursor("after", ["notadate", 1])
+        self.assertContains(self.client.get(song_url, {"c": crafted}), "comment 24")
+        self.assertIn("comment 24<", self.client.get(thread_url, {"c": crafted}).json()["html"])
+
+        self.client.force_login(user)
+        resp = self.client.post(thread_url, {"text": "fresh"}, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(resp.status_code, 201)
+        self.assertContains(resp, "fresh", status_code=201)
+        self.assertNotContains(resp, "comment 0", status_code=201)
+        SongComment.objects.filter(text="comment 0").delete()
+        song.refresh_from_db()
+        self.assertEqual(song.comment_count, 25)
+
+    def test_favorite_toggles_are_idempotent_and_state_is_cached(self):
+        song = Song.objects.get(title="295")
+        user = User.objects.create_user("fan", password="pw")
+        self.client.force_login(user)
+        url = reverse("toggle_favorite_song", args=[song.pk])
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {"favorite": "1"}).json(), {"favorite": True})
+        self.assertEqual(list(user.profile.favorite_songs.all()), [song])
+        self.assertEqual(self.client.post(url).json(), {"favorite": False})  # No parameter: flips
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        rate(song, user, 3)  # Changed outside UserState: its cached copy is retired
+        with self.assertNumQueries(5):
+            self.assertEqual(load_user_state(user, {"song": [song.pk]}), {"song": {song.pk: {"favorite": False, "rating": 3}}})
+        with self.assertNumQueries(0):
+            self.assertFalse(UserState.for_user(user).is_favorite("song", song.pk))
+
+        # LocMemCache is per process: other workers never see this one's bumps
+        with patch.object(cache, "set") as cache_set, self.settings(LOCAL_CACHE_TIMEOUT=30):
+            UserState.for_user(user).save()
+        self.assertEqual(cache_set.call_args.args[2], 30)
+
+    def test_artist_discography_lists_every_role(self):
+        main = Artist.objects.get(name="Sidhu Moose Wala")
+        guest = Artist.objects.create(name="Karan Aujla")
+        song = Song.objects.get(title="295")
+        older = Song.objects.create(artist=guest, title="Older", year=2018, is_published=True)
+        older.additional_artists.add(main)
+        undated = Song.objects.create(artist=guest, title="Undated", is_published=True)
+        undated.featured_artists.add(main)
+        Song.objects.create(artist=main, title="Draft", year=2022)
+
+        with self.assertNumQueries(2):  # Summary and page
+            page, summary = discography(main, QueryDict())
+            rows = [(c.song.title, c.role, c.song.artist.name) for c in page]
+        self.assertEqual(rows, [
+            ("295", "main", "Sidhu Moose Wala"),
+            ("Older", "additional", "Karan Aujla"),
+            ("Undated", "featured", "Karan Aujla"),
+        ])
+        self.assertEqual(
+            summary,
+            {"songs": 3, "main": 1, "additional": 1, "featured": 1, "year_min": 2018, "year_max": 2021},
+        )
+
+        resp = self.client.get(reverse("artist_detail", args=[main.slug]))
+        self.assertContains(resp, "3 songs")
+        self.assertContains(resp, "2018–2021")
+        self.assertContains(resp, reverse("song_detail", kwargs={"artist": guest.slug, "song": older.slug}))
+        resp = self.client.get(reverse("artist_detail", args=[main.slug]), {"p": encode_cursor("after", ["x", "y", "z"])})
+        self.assertContains(resp, "Undated")
+
+    def test_pages_follow_renames_of_credited_artists(self):
+        main = Artist.objects.get(name="Sidhu Moose Wala")
+        guest = Artist.objects.create(name="Karan Aujla")
+        album = Album.objects.create(artist=main, title="Moosetape")
+        album.additional_artists.add(guest)
+        song = Song.objects.get(title="295")
+        song.album = album
+        song.save()
+        song.featured_artists.add(guest)
+        guest_url = reverse("artist_detail", args=[guest.slug])
+        album_url = reverse("album_detail", kwargs={"artist": main.slug, "album": album.slug})
+        self.assertContains(self.client.get(guest_url), "feat. on Sidhu Moose Wala")
+        self.assertContains(self.client.get(album_url), "Karan Aujla")
+
+        main.name = "Moose Wala"
+        main.save()
+        self.assertContains(self.client.get(guest_url), "feat. on Moose Wala")
+        self.assertContains(self.client.get(album_url), "Karan Aujla")
+        guest.name = "Karan"
+        guest.save()
+        self.assertNotContains(self.client.get(album_url), "Karan Aujla")
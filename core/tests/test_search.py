@@ -0,0 +1,258 @@
+import time
+from unittest.mock import Mock, patch
+from django.test import TestCase, override_settings
+from django.db import OperationalError
+from core import signals
+from core.caching import NAMES_VERSION, get_version
+from core.models import Artist, FuzzyTerm, Line, PageView, Song, SongCredit
+from core.fuzzy import FuzzyQuery, rebuild_fuzzy_index, similarity, time_limit
+from core.search import (
+    IContainsBackend, cached_result_ids, get_search_backend, normalize_query, search_cache_stats, search_lines,
+)
+from core.typeahead import prefix_index
+
+
+class LineSearchTest(TestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="Karan Aujla")
+        self.song = Song.objects.create(artist=artist, title="Softly", is_published=True)
+        self.lines = Line.objects.bulk_create([
+            Line(song=self.song, no=1, original="ਦਿਲ ਦੀ ਗੱਲ", romanized="dil di gall", translation_en="Talk of the heart"),
+            Line(song=self.song, no=2, original="ਰਾਤਾਂ", romanized="raatan", translation_en="Nights without the heart, dil"),
+            Line(song=self.song, no=3, original="ਸੁਪਨੇ", romanized="supne", translation_en="Dreams"),
+        ])
+
+    def search(self, q):
+        return [line.no for line in search_lines(Line.objects.all(), q)]
+
+    def test_database_index_is_used_and_ranked(self):
+        self.assertNotIsInstance(get_search_backend(), IContainsBackend)
+        self.assertEqual(self.search("dil"), [1, 2])
+        self.assertEqual(self.search("ਦਿਲ"), [1])
+        self.assertEqual(self.search("drea"), [3])
+        self.assertEqual(sorted(self.search('"heart')), [1, 2])
+
+    def test_index_follows_updates_and_deletes(self):
+        Line.objects.filter(no=3).update(translation_en="Heart of dreams")
+        Line.objects.filter(no=1).delete()
+        self.assertEqual(sorted(self.search("heart")), [2, 3])
+
+    @override_settings(SEARCH_BACKEND="icontains")
+    def test_icontains_fallback(self):
+        self.assertIsInstance(get_search_backend(), IContainsBackend)
+        self.assertEqual(self.search("eart"), [1, 2])
+
+    def test_search_page(self):
+        resp = self.client.get("/search/?q=supne")
+        self.assertContains(resp, "Dreams")
+
+
+class FuzzySearchTest(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Sidhu Moose Wala")
+        self.song = Song.objects.create(artist=self.artist, title="Mehnat", is_published=True)
+        Line.objects.create(song=self.song, no=1, original="ਮਿਹਨਤ", romanized="mehnaat karde", translation_en="Working hard")
+        Line.objects.create(song=self.song, no=2, original="ਕਿਸਮਤ", romanized="kismat", translation_en="Fate")
+
+    def test_similarity_matches_pg_trgm(self):
+        self.assertAlmostEqual(similarity("mehnat", "mehnaat"), 6 / 9)
+        self.assertEqual(similarity("mehnat", "mehnat"), 1.0)
+        self.assertEqual(similarity("", "mehnat"), 0.0)
+
+    def test_variants_and_nearest_names(self):
+        with self.assertNoLogs("core.fuzzy", "WARNING"):  # Well within FUZZY_SEARCH_TIMEOUT
+            fuzzy = FuzzyQuery("mihnat")
+        self.assertTrue(fuzzy.similar["mihnat"])
+        self.assertEqual(fuzzy.variants()["mihnat"], ["mehnat"])
+        self.assertEqual(FuzzyQuery("mehnat").variants()["mehnat"], ["mehnat", "mehnaat"])
+        self.assertEqual([pk for pk, _ in FuzzyQuery("sidhu moosewala").matches("artist")], [self.artist.pk])
+
+    def test_index_follows_renames(self):
+        Song.objects.filter(pk=self.song.pk).update(title="stale")
+        rebuild_fuzzy_index()
+        self.song.title = "Dollar"
+        self.song.save()
+        self.assertEqual(FuzzyQuery("dolar").matches("song")[0][0], self.song.pk)
+        self.assertEqual(FuzzyQuery("stale").matches("song"), [])
+
+    def test_saves_that_keep_the_name_skip_reindexing(self):
+        song = Song.objects.get(pk=self.song.pk)
+        sync = Mock()
+        with patch("core.signals.index_object") as index, \
+                patch.dict(signals.CREDITED_MODELS, {Song: (sync, SongCredit, "song_id")}):
+            song.year = 2020
+            song.save()
+            self.artist.about = "Singer"
+            self.artist.save()
+            self.assertFalse(index.called)
+            self.assertFalse(sync.called)
+
+            song.title = "Mehnat 2"
+            song.artist = Artist.objects.create(name="Karan Aujla")
+            song.save()
+            self.assertEqual(index.call_args.args, ("song", song.pk, "Mehnat 2"))
+            sync.assert_called_once_with([song.pk])
+
+    def test_unused_terms_are_pruned(self):
+        line = Line.objects.get(song=self.song, no=2)
+        line.romanized = "kismet"
+        line.save()
+        self.assertFalse(FuzzyTerm.objects.filter(text="kismat").exists())
+        self.assertEqual(FuzzyTerm.objects.get(text="kismet").line_count, 1)
+        self.song.delete()  # Its lines and title go too
+        self.assertFalse(FuzzyTerm.objects.filter(text__in=["kismet", "mehnaat", "mehnat"]).exists())
+        self.assertTrue(FuzzyTerm.objects.filter(text="sidhu").exists())
+
+        Line.objects.create(song=Song.objects.create(artist=self.artist, title="Kismat"), no=1,
+                            original="ਕਿਸਮਤ", romanized="kismat", translation_en="Fate")
+        rebuild_fuzzy_index()
+        self.assertEqual(FuzzyTerm.objects.get(text="kismat").line_count, 1)
+
+    @patch("core.fuzzy.similar_terms", side_effect=OperationalError("interrupted"))
+    def test_lookups_out_of_time_match_exactly(self, _):
+        with self.assertLogs("core.fuzzy", "WARNING"):
+            self.assertEqual(FuzzyQuery("mihnat").variants(), {"mihnat": []})
+            resp = self.client.get("/search/?q=mehnaat")
+        self.assertEqual([line.no for line in resp.context["lines_page"]], [1])
+
+    def count_up_to(self, n):
+        return Line.objects.extra(where=[f"""(WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {n})
+                                          SELECT count(*) FROM n) > 0"""]).count()
+
+    def test_time_limit_cancels_long_queries(self):
+        with self.assertRaises(OperationalError):
+            with time_limit(1):
+                self.count_up_to(10000000)
+        self.assertEqual(Line.objects.count(), 2)  # Connection still usable
+
+        # The budget is per query, as statement_timeout on PostgreSQL
+        with time_limit(200):
+            for _ in range(3):
+                time.sleep(0.1)
+                self.assertEqual(self.count_up_to(10000), 2)
+
+    def test_search_page_finds_other_romanizations(self):
+        # Line 1 only reads "mehnaat", so it can only be found through the trigram index
+        with self.assertNoLogs("core.fuzzy", "WARNING"):
+            resp = self.client.get("/search/?q=mehnat")
+        self.assertEqual([line.no for line in resp.context["lines_page"]], [1])
+        self.assertEqual([song.pk for song in resp.context["songs_page"]], [self.song.pk])
+
+
+class TypeaheadTest(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Sidhu Moose Wala")
+        self.song = Song.objects.create(artist=self.artist, title="So High", is_published=True)
+        Song.objects.create(artist=self.artist, title="Draft", is_published=False)
+
+    def labels(self, q):
+        return [item["label"] for item in self.client.get("/search/typeahead/", {"q": q}).json()["results"]]
+
+    def test_prefix_of_any_word(self):
+        self.assertEqual(self.labels("so"), ["So High"])
+        self.assertEqual(self.labels("moo"), ["Sidhu Moose Wala"])
+        self.assertEqual(self.labels("dra"), [])
+        self.assertEqual(self.labels(""), [])
+
+    def test_catalog_changes_rebuild_the_index(self):
+        self.assertEqual(self.labels("sid"), ["Sidhu Moose Wala"])
+        Artist.objects.create(name="Sidhu Sandhu")
+        prefix_index.invalidate()
+        self.assertEqual(self.labels("sid"), ["Sidhu Moose Wala", "Sidhu Sandhu"])
+
+    def test_only_name_changes_rebuild_the_index(self):
+        names = get_version(NAMES_VERSION)
+        Line.objects.create(song=self.song, no=1, original="ਸੋ ਹਾਈ", romanized="so high", translation_en="So high")
+        self.song.year = 2017
+        self.song.save()
+        self.assertEqual(get_version(NAMES_VERSION), names)
+        self.song.title = "So Low"
+        self.song.save()
+        self.assertNotEqual(get_version(NAMES_VERSION), names)
+
+    def test_keystrokes_stay_off_the_database(self):
+        self.labels("s")
+        with self.assertNumQueries(0):
+            self.labels("si")
+        self.assertFalse(PageView.objects.filter(url="/search/typeahead/").exists())
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="Babbu Maan")
+        Song.objects.bulk_create([
+            Song(artist=artist, title=f"Ishq {n % 7}", slug=f"ishq-{n}", is_published=True) for n in range(45)
+        ])
+
+    def page(self, **params):
+        return self.client.get("/search/", {"q": "ishq", **params}).context["songs_page"]
+
+    def test_walks_forward_and_back_without_gaps(self):
+        seen = []
+        page = self.page()
+        pages = [page]
+        while page.has_next:
+            seen += [song.pk for song in page]
+            page = self.page(sp=page.next_cursor)
+            pages.append(page)
+        seen += [song.pk for song in page]
+        self.assertEqual(sorted(seen), sorted(Song.objects.values_list("pk", flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual([len(p) for p in pages], [20, 20, 5])
+
+        back = self.page(sp=pages[2].previous_cursor)
+        self.assertEqual([song.pk for song in back], [song.pk for song in pages[1]])
+        self.assertTrue(back.has_previous and back.has_next)
+
+    def test_ranked_lines_page_on_search_rank(self):
+        song = Song.objects.first()
+        Line.objects.bulk_create([
+            Line(song=song, no=n, original="ਇਸ਼ਕ", romanized="ishq " + "naal " * (n % 4), translation_en="Love")
+            for n in range(1, 26)
+        ])
+        first = self.client.get("/search/", {"q": "ishq"}).context["lines_page"]
+        second = self.client.get("/search/", {"q": "ishq", "lp": first.next_cursor}).context["lines_page"]
+        numbers = [line.no for line in first] + [line.no for line in second]
+        self.assertEqual(sorted(numbers), list(range(1, 26)))
+        self.assertFalse(second.has_next)
+
+    def test_capped_count_and_bad_cursor(self):
+        self.assertEqual(self.page().count_label, "45")
+        with patch("core.pagination.COUNT_CAP", 30):
+            self.assertEqual(self.page().count_label, "30+")
+        self.assertEqual(len(self.page(sp="2")), 20)
+
+    @patch("core.search.COUNT_CAP", 30)
+    @patch("core.pagination.COUNT_CAP", 30)
+    def test_pages_continue_past_the_cached_results(self):
+        pages = [self.page()]
+        while pages[-1].has_next:
+            pages.append(self.page(sp=pages[-1].next_cursor))
+        seen = [song.pk for page in pages for song in page]
+        self.assertEqual([len(p) for p in pages], [20, 20, 5])
+        self.assertEqual(sorted(seen), sorted(Song.objects.values_list("pk", flat=True)))
+        self.assertEqual(pages[-1].count_label, "30+")
+
+        back = self.page(sp=pages[2].previous_cursor)
+        self.assertEqual([song.pk for song in back], [song.pk for song in pages[1]])
+
+
+class SearchResultCacheTest(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Gurdas Maan")
+        self.song = Song.objects.create(artist=self.artist, title="Challa", is_published=True)
+
+    def test_normalized_queries_share_an_entry_until_the_catalog_changes(self):
+        self.assertEqual(normalize_query("  CHALLA\u00a0 "), "challa")
+        before = search_cache_stats()
+        self.assertEqual(cached_result_ids("Challa")["songs"], [self.song.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_result_ids(" challa ")["songs"], [self.song.pk])
+        after = search_cache_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+        other = Song.objects.create(artist=self.artist, title="Challa 2", is_published=True)
+        self.assertEqual(cached_result_ids("challa")["songs"], [self.song.pk, other.pk])
+        Line.objects.create(song=self.song, no=1, original="ਛੱਲਾ", romanized="challa", translation_en="Ring")
+        self.assertEqual(len(cached_result_ids("challa")["lines"]), 1)
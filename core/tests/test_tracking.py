@@ -0,0 +1,93 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from core.models import Artist, ContentViewCounter, PageView, Song
+from core.tracking import PageViewBuffer, get_view_count
+
+
+def make_record(url="/songs/"):
+    return {
+        "content_type": "other",
+        "content_id": None,
+        "content_title": "Songs Index",
+        "url": url,
+        "ip_address": "127.0.0.1",
+        "user_id": None,
+        "session_key": "",
+        "user_agent": "test",
+        "viewed_at": timezone.now(),
+    }
+
+
+class PageViewTrackingTest(TestCase):
+    def test_sync_mode_writes_during_request(self):
+        self.client.get("/songs/")
+        self.assertEqual(PageView.objects.filter(url="/songs/").count(), 1)
+
+    @override_settings(PAGEVIEW_TRACKING_MODE="buffered")
+    def test_buffered_mode_defers_write(self):
+        from core import tracking
+        buffer = PageViewBuffer(batch_size=100, flush_interval=3600)
+        original, tracking._buffer = tracking._buffer, buffer
+        try:
+            self.client.get("/songs/")
+            self.assertEqual(PageView.objects.count(), 0)
+            self.assertEqual(buffer.flush(), 1)
+        finally:
+            tracking._buffer = original
+        self.assertEqual(PageView.objects.filter(url="/songs/").count(), 1)
+
+    def test_full_buffer_drops_and_counts(self):
+        buffer = PageViewBuffer(max_size=2, batch_size=100, flush_interval=3600)
+        self.assertTrue(buffer.add(make_record()))
+        self.assertTrue(buffer.add(make_record()))
+        self.assertFalse(buffer.add(make_record()))
+        self.assertEqual(buffer.dropped, 1)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(PageView.objects.count(), 2)
+
+
+class ContentResolutionTest(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Karan Aujla")
+        self.song = Song.objects.create(artist=self.artist, title="Softly", is_published=True)
+
+    def test_detail_view_records_content_id_and_title(self):
+        self.client.get(self.song.get_absolute_url())
+        self.client.get(self.artist.get_absolute_url())
+        song_view = PageView.objects.get(content_type="song")
+        self.assertEqual(song_view.content_id, self.song.pk)
+        self.assertEqual(song_view.content_title, "Softly — Karan Aujla")
+        artist_view = PageView.objects.get(content_type="artist")
+        self.assertEqual(artist_view.content_id, self.artist.pk)
+
+    def test_charts_rank_by_content_id(self):
+        self.client.get(self.song.get_absolute_url())
+        call_command("rollup_stats", stdout=StringIO())
+        resp = self.client.get("/charts/")
+        self.assertEqual([s.pk for s in resp.context["top_songs"]], [self.song.pk])
+        self.assertEqual(resp.context["top_songs"][0].chart_views, 1)
+
+
+class ViewCounterTest(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Shubh")
+        self.song = Song.objects.create(artist=self.artist, title="Cheques", is_published=True)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)  # A cached page shows the count it was rendered with
+    def test_views_increment_counter_shown_on_page(self):
+        url = self.song.get_absolute_url()
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(get_view_count("song", self.song.pk), 2)
+        resp = self.client.get(url)
+        self.assertEqual(resp.context["view_count"], 2)
+
+    def test_reconcile_rebuilds_from_page_views(self):
+        self.client.get(self.song.get_absolute_url())
+        ContentViewCounter.objects.update(views=99)
+        ContentViewCounter.objects.create(content_type="artist", content_id=self.artist.pk, views=5)
+        call_command("reconcile_view_counters", stdout=StringIO())
+        self.assertEqual(get_view_count("song", self.song.pk), 1)
+        self.assertEqual(get_view_count("artist", self.artist.pk), 0)
@@ -0,0 +1,228 @@
+"""Page view recording for PageViewMiddleware.
+
+Views are written either synchronously inside the request ('sync') or queued
+into a bounded in-process buffer that a background thread drains with
+bulk_create ('buffered'). Pick the mode with PAGEVIEW_TRACKING_MODE.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F
+
+from .models import Album, Artist, ContentViewCounter, PageView, Song
+
+logger = logging.getLogger(__name__)
+
+
+def describe_content(obj):
+    """Display title stored on PageView.content_title for a tracked object."""
+    if isinstance(obj, (Song, Album)):
+        return f"{obj.title} — {obj.artist.name}"
+    if isinstance(obj, Artist):
+        return obj.name
+    return str(obj)
+
+
+# Content types that get a ContentViewCounter row
+COUNTED_TYPES = ('song', 'artist', 'album')
+
+
+def save_page_views(records):
+    """Write a batch of page view records (dicts of PageView field values)."""
+    with transaction.atomic():
+        PageView.objects.bulk_create([PageView(**record) for record in records])
+        increment_view_counters(records)
+
+
+def increment_view_counters(records):
+    """Add a batch of page views to ContentViewCounter, one UPDATE per distinct item."""
+    deltas = Counter(
+        (record['content_type'], record['content_id'])
+        for record in records
+        if record.get('content_id') is not None and record['content_type'] in COUNTED_TYPES
+    )
+    for (content_type, content_id), views in deltas.items():
+        counter = ContentViewCounter.objects.filter(content_type=content_type, content_id=content_id)
+        if counter.update(views=F('views') + views):
+            continue
+        try:
+            with transaction.atomic():
+                ContentViewCounter.objects.create(content_type=content_type, content_id=content_id, views=views)
+        except IntegrityError:
+            # Another worker created the row first
+            counter.update(views=F('views') + views)
+
+
+def get_view_count(content_type, content_id):
+    """Total recorded views for one item, read from its counter row."""
+    return (
+        ContentViewCounter.objects.filter(content_type=content_type, content_id=content_id)
+        .values_list('views', flat=True)
+        .first()
+    ) or 0
+
+
+def reconcile_view_counters(archived=()):
+    """Reset every ContentViewCounter to the number of matching PageView rows.
+
+    `archived` is an iterable of archived page view dicts (see
+    core.archive.iter_archived_page_views) counted on top of the live table.
+    Returns the number of counters that were created, changed or removed.
+    """
+    totals = {
+        (row['content_type'], row['content_id']): row['views']
+        for row in PageView.objects.filter(content_id__isnull=False, content_type__in=COUNTED_TYPES)
+        .values('content_type', 'content_id')
+        .annotate(views=Count('id'))
+        .order_by()
+    }
+    for row in archived:
+        if row['content_id'] is not None and row['content_type'] in COUNTED_TYPES:
+            key = (row['content_type'], row['content_id'])
+            totals[key] = totals.get(key, 0) + 1
+    changed = []
+    stale = []
+    with transaction.atomic():
+        for counter in ContentViewCounter.objects.select_for_update():
+            views = totals.pop((counter.content_type, counter.content_id), None)
+            if views is None:
+                stale.append(counter.pk)
+            elif counter.views != views:
+                counter.views = views
+                changed.append(counter)
+        ContentViewCounter.objects.bulk_update(changed, ['views'], batch_size=500)
+        ContentViewCounter.objects.filter(pk__in=stale).delete()
+        ContentViewCounter.objects.bulk_create(
+            [ContentViewCounter(content_type=key[0], content_id=key[1], views=views)
+             for key, views in totals.items()],
+            batch_size=500,
+        )
+    return len(changed) + len(stale) + len(totals)
+
+
+class PageViewBuffer:
+    """Bounded queue of page view records flushed by a background thread.
+
+    A flush happens when `batch_size` records are waiting or every
+    `flush_interval` seconds, whichever comes first. When the queue is full
+    new records are dropped and counted in `dropped` instead of blocking the
+    request.
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=5.0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.flushed = 0
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reported_drops = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record):
+        """Queue a record; returns False if it was dropped because the buffer is full."""
+        with self._lock:
+            if len(self._records) >= self.max_size:
+                self.dropped += 1
+                return False
+            self._records.append(record)
+            pending = len(self._records)
+
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Write everything currently queued, in batches. Returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    count = min(self.batch_size, len(self._records))
+                    batch = [self._records.popleft() for _ in range(count)]
+                if not batch:
+                    break
+                try:
+                    save_page_views(batch)
+                except Exception:
+                    # Losing a batch of analytics is better than retrying forever
+                    logger.exception("Failed to write %d buffered page views", len(batch))
+                    continue
+                written += len(batch)
+
+        self.flushed += written
+        if self.dropped > self._reported_drops:
+            logger.warning(
+                "Page view buffer full: dropped %d views (%d total)",
+                self.dropped - self._reported_drops, self.dropped,
+            )
+            self._reported_drops = self.dropped
+        return written
+
+    def _ensure_flusher(self):
+        # Gunicorn forks workers after import, so each process needs its own thread
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != pid:
+                # Records inherited from the parent belong to the parent
+                self._records.clear()
+            else:
+                atexit.register(self.flush)
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="pageview-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Page view flusher failed")
+            finally:
+                # Don't keep an idle connection open per worker for the flusher thread
+                connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_page_view_buffer():
+    """Return this process's page view buffer, creating it from settings on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = PageViewBuffer(
+                    max_size=getattr(settings, 'PAGEVIEW_BUFFER_SIZE', 10000),
+                    batch_size=getattr(settings, 'PAGEVIEW_FLUSH_BATCH_SIZE', 500),
+                    flush_interval=getattr(settings, 'PAGEVIEW_FLUSH_INTERVAL', 5.0),
+                )
+    return _buffer
+
+
+def record_page_view(record):
+    """Record one page view according to PAGEVIEW_TRACKING_MODE."""
+    if getattr(settings, 'PAGEVIEW_TRACKING_MODE', 'sync') == 'buffered':
+        get_page_view_buffer().add(record)
+    else:
+        save_page_views([record])
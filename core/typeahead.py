@@ -0,0 +1,98 @@
+"""In-process prefix index for search-as-you-type suggestions.
+
+Each worker keeps a sorted array of keys covering every published song, every
+artist and every album. The keys are each normalized name plus every suffix
+of it that starts at a word, so "moose" finds "Sidhu Moose Wala". A lookup
+bisects to the first key with the prefix and walks forward. Results for short
+prefixes, which match many keys, are memoized.
+
+The index is built lazily and rebuilt when the 'names' version stamp moves.
+Signals bump that stamp when a name, slug, main artist or publish state
+changes, but not for lyrics edits, so a keystroke never touches the database
+and editing lines doesn't rebuild the index.
+"""
+from bisect import bisect_left
+
+from .caching import NAMES_VERSION, VersionedValue
+from .fuzzy import normalize
+from .models import Album, Artist, ContentViewCounter, Song
+
+MAX_RESULTS = 20
+MEMO_PREFIX_LENGTH = 3  # Results for prefixes this short or shorter are memoized
+
+
+class PrefixIndex:
+    """Sorted (key, entry) postings with top-K lookup by prefix."""
+
+    def __init__(self, entries):
+        # entries: dicts with type, id, label, detail, url and views
+        self.entries = entries
+        postings = []
+        for position, entry in enumerate(entries):
+            words = normalize(entry['label']).split()
+            for start in range(len(words)):
+                postings.append((' '.join(words[start:]), start > 0, position))
+        postings.sort()
+        self.keys = [key for key, _, _ in postings]
+        self.postings = postings
+        self._memo = {}
+
+    def search(self, q, limit=8):
+        prefix = normalize(q)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            if prefix not in self._memo:
+                self._memo[prefix] = self._search(prefix)
+            return self._memo[prefix][:limit]
+        return self._search(prefix)[:limit]
+
+    def _search(self, prefix):
+        best = {}
+        for i in range(bisect_left(self.keys, prefix), len(self.keys)):
+            key, mid_name, position = self.postings[i]
+            if not key.startswith(prefix):
+                break
+            # Names that start with the prefix beat ones where a later word does
+            if position not in best or not mid_name:
+                best[position] = mid_name
+        ranked = sorted(
+            best.items(),
+            key=lambda item: (item[1], -self.entries[item[0]]['views'], self.entries[item[0]]['label'].lower()),
+        )
+        return [self._public(self.entries[position]) for position, _ in ranked[:MAX_RESULTS]]
+
+    @staticmethod
+    def _public(entry):
+        return {field: entry[field] for field in ('type', 'label', 'detail', 'url')}
+
+
+def build_prefix_index():
+    views = {
+        (content_type, content_id): count
+        for content_type, content_id, count in ContentViewCounter.objects.values_list('content_type', 'content_id', 'views')
+    }
+    entries = []
+    for artist in Artist.objects.all():
+        entries.append(_entry('artist', artist, artist.name, '', views))
+    for song in Song.objects.filter(is_published=True).select_related('artist'):
+        entries.append(_entry('song', song, song.title, song.artist.name, views))
+    for album in Album.objects.select_related('artist'):
+        entries.append(_entry('album', album, album.title, album.artist.name, views))
+    return PrefixIndex(entries)
+
+
+def _entry(content_type, obj, label, detail, views):
+    return {
+        'type': content_type, 'id': obj.pk, 'label': label, 'detail': detail,
+        'url': obj.get_absolute_url(), 'views': views.get((content_type, obj.pk), 0),
+    }
+
+
+prefix_index = VersionedValue(NAMES_VERSION, build_prefix_index)
+
+
+def suggest(q, limit=8):
+    """Top `limit` songs, artists and albums whose name has a word starting with `q`."""
+    return prefix_index.get().search(q, limit)
@@ -11,9 +11,11 @@ urlpatterns = [
     # Home / Top Charts
     path("", views.charts, name="home"),          # base URL = charts
     path("charts/", views.charts, name="charts"),
+    path("charts/top-rated/", views.top_rated_view, name="top_rated"),
 
     # Search
     path("search/", views.search, name="search"),
+    path("search/typeahead/", views.typeahead, name="typeahead"),
 
     # Header links (index pages)
     path("artists/", views.artists_index, name="artists_index"),
@@ -34,6 +36,10 @@ urlpatterns = [
     path("profile/", views.profile_view, name="profile"),
     path("favorite/song/<int:song_id>/", views.toggle_favorite_song, name="toggle_favorite_song"),
     path("favorite/artist/<int:artist_id>/", views.toggle_favorite_artist, name="toggle_favorite_artist"),
+    path("me/state/", views.user_state, name="user_state"),
+
+    # Comment threads ("load more" and posting)
+    path("comments/<str:content_type>/<int:object_id>/", views.comment_thread, name="comment_thread"),
 
     # Private stats dashboard
     path("stats/", views.stats_view, name="stats"),
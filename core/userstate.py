@@ -0,0 +1,140 @@
+"""Per-user state of catalog pages, served separately from the pages themselves.
+
+Song and artist pages are rendered the same for every visitor, so they can be
+cached (core.conditional). static/js/user_state.js then fetches what differs
+per user from the user_state view: who is signed in, a CSRF token for the
+page's forms, and favorite and rating state for the objects on the page. It
+makes one request per page load.
+
+That state comes from UserState: every favorite id and rating of the user,
+loaded with five queries and cached under the user's version stamp, so
+membership checks are answered in memory. core.signals bumps the stamp on any
+favorite or rating change. The favorite toggles and rating views write the
+updated copy straight back, so the next page load needn't reload it.
+
+On a per-process cache (the default LocMemCache) a bump is only seen by the
+worker that made it, so there the state is kept for LOCAL_CACHE_TIMEOUT
+seconds at most, like other unshared values (see core.caching).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import get_version, is_shared
+from .models import Artist, ArtistRating, Song, SongRating, UserProfile
+
+# Content type: (model, rating model, rating foreign key, UserProfile favorites relation)
+USER_STATE_TYPES = {
+    'song': (Song, SongRating, 'song_id', 'favorite_songs'),
+    'artist': (Artist, ArtistRating, 'artist_id', 'favorite_artists'),
+}
+
+MAX_IDS = 50  # Per content type and request
+
+USER_STATE_TIMEOUT = 60 * 60 * 24  # On a shared cache backend
+
+
+def parse_ids(value):
+    """Integer ids from a comma-separated query parameter, invalid ones skipped."""
+    ids = []
+    for part in (value or '').split(','):
+        if part.strip().isdigit():
+            ids.append(int(part))
+    return list(dict.fromkeys(ids))[:MAX_IDS]
+
+
+def user_state_version(user_id):
+    """Name of the version stamp of one user's cached state (see core.caching)."""
+    return f"user:{user_id}"
+
+
+class UserState:
+    """Favorite ids and ratings of one user."""
+
+    def __init__(self, user_id, profile_id, favorites, ratings):
+        self.user_id = user_id
+        self.profile_id = profile_id  # None until the user has a UserProfile
+        self.favorites = favorites  # {content type: set of ids}
+        self.ratings = ratings  # {content type: {id: rating}}
+
+    @classmethod
+    def for_user(cls, user):
+        """The cached state of `user`, loaded from the database on a miss."""
+        data = cache.get(cls._key(user.pk))
+        if data is not None:
+            return cls(user.pk, *data)
+        state = cls.load(user.pk)
+        state.save()
+        return state
+
+    @classmethod
+    def load(cls, user_id):
+        profile_id = UserProfile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+        favorites, ratings = {}, {}
+        for content_type, (_, rating_model, rating_key, relation) in USER_STATE_TYPES.items():
+            through = getattr(UserProfile, relation).through
+            favorites[content_type] = set(
+                through.objects.filter(userprofile_id=profile_id).values_list(f"{content_type}_id", flat=True)
+            ) if profile_id else set()
+            ratings[content_type] = dict(
+                rating_model.objects.filter(user_id=user_id).values_list(rating_key, 'rating')
+            )
+        return cls(user_id, profile_id, favorites, ratings)
+
+    @staticmethod
+    def _key(user_id):
+        return f"userstate:{user_id}:{get_version(user_state_version(user_id))}"
+
+    def save(self):
+        # Keyed by the stamp as it is now, i.e. after the change being saved bumped it
+        cache.set(self._key(self.user_id), (self.profile_id, self.favorites, self.ratings), _timeout())
+
+    def is_favorite(self, content_type, object_id):
+        return object_id in self.favorites[content_type]
+
+    def rating(self, content_type, object_id):
+        return self.ratings[content_type].get(object_id)
+
+    def set_favorite(self, content_type, object_id, favorite):
+        """Add or remove a favorite; a no-op when it is already in that state."""
+        if self.is_favorite(content_type, object_id) == favorite:
+            return
+        if self.profile_id is None:
+            self.profile_id = UserProfile.objects.get_or_create(user_id=self.user_id)[0].pk
+        relation = getattr(UserProfile(pk=self.profile_id, user_id=self.user_id), USER_STATE_TYPES[content_type][3])
+        if favorite:
+            relation.add(object_id)
+            self.favorites[content_type].add(object_id)
+        else:
+            relation.remove(object_id)
+            self.favorites[content_type].discard(object_id)
+        self.save()
+
+    def set_rating(self, content_type, object_id, rating):
+        """Record a rating already written (see core.ratings.rate())."""
+        self.ratings[content_type][object_id] = rating
+        self.save()
+
+    def describe(self, ids_by_type):
+        """{content type: {id: {'favorite': bool, 'rating': int or None}}} for the given ids."""
+        return {
+            content_type: {
+                object_id: {
+                    'favorite': self.is_favorite(content_type, object_id),
+                    'rating': self.rating(content_type, object_id),
+                }
+                for object_id in ids
+            }
+            for content_type, ids in ids_by_type.items()
+        }
+
+
+def _timeout():
+    if is_shared():
+        return USER_STATE_TIMEOUT
+    # Other workers never see this worker's bumps
+    return min(USER_STATE_TIMEOUT, max(int(getattr(settings, 'LOCAL_CACHE_TIMEOUT', 30)), 1))
+
+
+def load_user_state(user, ids_by_type):
+    """{content type: {id: {'favorite': bool, 'rating': int or None}}} for a signed-in user."""
+    return UserState.for_user(user).describe(ids_by_type)
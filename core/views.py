@@ -1,79 +1,82 @@
 # core/views.py
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg, Count
+from django.http import Http404, HttpResponse, JsonResponse
+from django.db.models import Count, Sum
 from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
+from django.conf import settings
 from django.utils import timezone
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_http_methods, require_POST
 from datetime import timedelta
-
-from .models import Artist, Album, Song, Line, UserProfile, SongComment, ArtistComment, SongRating, ArtistRating, PageView
+from functools import partial
+
+from .models import Artist, Album, Song, Line, UserProfile, ChartEntry
+from .analytics import traffic_summary, visitor_summary
+from .caching import CATALOG_VERSION, CHARTS_VERSION, cached_value, get_version, tiered_cache
+from .tracking import get_view_count
+from .charts import chart_entries, resolve_chart, resolve_top_content
+from . import conditional
+from .comments import COMMENT_TYPES, comment_page, render_comments
+from .credits import discography
+from .conditional import conditional_page, page_cache_stats
+from .lyrics import render_lyrics_block
+from .pagination import paginate_ids
+from .ratings import rate, top_rated
+from .search import cached_result_ids, result_ids_from, search_cache_stats
+from .typeahead import MAX_RESULTS, suggest
+from .userstate import USER_STATE_TYPES, UserState, load_user_state, parse_ids
 from .forms import SignUpForm, LoginForm, SongCommentForm, ArtistCommentForm, SongRatingForm, ArtistRatingForm
 
 
+@conditional_page(conditional.charts_page)
 def charts(request):
-    """Homepage: Top charts / featured based on weekly views."""
-    # Get views from the last 7 days
-    seven_days_ago = timezone.now() - timedelta(days=7)
-
-    # Get top songs by weekly views
-    weekly_song_views = (
-        PageView.objects.filter(
-            content_type='song',
-            viewed_at__gte=seven_days_ago
-        )
-        .values('url')
-        .annotate(view_count=Count('id'))
-        .order_by('-view_count')[:10]
+    """Homepage: Top charts / featured artists, read from the materialized charts."""
+    chart = request.GET.get('chart', 'weekly')
+    chart_labels = dict(ChartEntry.CHART_CHOICES)
+    if chart not in chart_labels:
+        chart = 'weekly'
+
+    # Rebuilt by one worker at a time when the catalog or the charts change
+    data, fresh = cached_value(
+        f"charts:{chart}", lambda: _charts_data(chart), settings.CHARTS_CACHE_TIMEOUT,
+        version=(get_version(CATALOG_VERSION), get_version(CHARTS_VERSION)),
     )
+    if not fresh:
+        request.stale_page = True  # Not cached or validated as the current page
 
-    # Extract song slugs from URLs and get Song objects
-    top_songs = []
-    for view_data in weekly_song_views:
-        url = view_data['url']
-        # URL format: /a/<artist-slug>/<song-slug>/
-        parts = url.strip('/').split('/')
-        if len(parts) >= 3 and parts[0] == 'a':
-            artist_slug = parts[1]
-            song_slug = parts[2]
-            try:
-                song = Song.objects.select_related('artist', 'album').get(
-                    artist__slug=artist_slug,
-                    slug=song_slug,
-                    is_published=True
-                )
-                song.weekly_views = view_data['view_count']
-                top_songs.append(song)
-            except Song.DoesNotExist:
-                pass
-
-    # Get top artists by weekly views
-    weekly_artist_views = (
-        PageView.objects.filter(
-            content_type='artist',
-            viewed_at__gte=seven_days_ago
-        )
-        .values('url')
-        .annotate(view_count=Count('id'))
-        .order_by('-view_count')[:6]
+    return render(
+        request,
+        "charts.html",
+        {
+            **data,
+            "chart": chart,
+            "chart_label": chart_labels[chart],
+            "chart_choices": ChartEntry.CHART_CHOICES,
+        },
     )
 
-    # Extract artist slugs from URLs and get Artist objects
-    featured_artists = []
-    for view_data in weekly_artist_views:
-        url = view_data['url']
-        # URL format: /a/<artist-slug>/
-        parts = url.strip('/').split('/')
-        if len(parts) >= 2 and parts[0] == 'a':
-            artist_slug = parts[1]
-            try:
-                artist = Artist.objects.get(slug=artist_slug)
-                artist.weekly_views = view_data['view_count']
-                featured_artists.append(artist)
-            except Artist.DoesNotExist:
-                pass
+
+def top_rated_view(request):
+    """Best rated songs and artists by Bayesian average (see core.ratings)."""
+    return render(request, "top_rated.html", {
+        "songs": top_rated(Song, limit=20),
+        "artists": top_rated(Artist, limit=12),
+        "min_votes": settings.RATING_PRIOR_WEIGHT,
+    })
+
+
+def _charts_data(chart):
+    # Chart positions are precomputed by build_charts (run after rollup_stats)
+    entries = chart_entries(chart, ('song', 'artist'))
+
+    # One query per type; unpublished or deleted items drop out, chart order is kept
+    top_songs = resolve_chart(entries['song'], limit=10)
+    featured_artists = resolve_chart(entries['artist'], limit=6)
 
     # Fallback: if no views yet, show recent songs and all artists
     if not top_songs:
@@ -83,92 +86,135 @@ def charts(request):
             .order_by("-year", "title")[:10]
         )
         for song in top_songs:
-            song.weekly_views = 0
+            song.chart_views = 0
 
     if not featured_artists:
         featured_artists = list(Artist.objects.order_by("name")[:6])
         for artist in featured_artists:
-            artist.weekly_views = 0
+            artist.chart_views = 0
 
-    songs = (
+    songs = list(
         Song.objects.filter(is_published=True)
         .select_related("artist", "album")
+        .defer("lyrics_payload")
         .order_by("artist__name", "title")
     )
-    artists = Artist.objects.order_by("name")
+    artists = list(Artist.objects.order_by("name"))
 
-    return render(
-        request,
-        "charts.html",
-        {
-            "artists": artists,
-            "songs": songs,
-            "top_songs": top_songs,
-            "featured_artists": featured_artists,
-        },
-    )
+    return {
+        "artists": artists,
+        "songs": songs,
+        "top_songs": top_songs,
+        "featured_artists": featured_artists,
+    }
+
+
+# Search page sections: (page context name, cursor parameter, queryset the cached ids are loaded from)
+SEARCH_SECTIONS = {
+    "songs": ("songs_page", "sp", Song.objects.select_related("artist", "album")),
+    "lines": ("lines_page", "lp", Line.objects.select_related("song", "song__artist")),
+    "albums": ("albums_page", "ap", Album.objects.select_related("artist")),
+    "artists": ("artists_page", "arp", Artist.objects.all()),
+}
 
 
 def search(request):
     q = (request.GET.get("q") or "").strip()
-    song_matches = Song.objects.none()
-    line_matches = Line.objects.none()
-    album_matches = Album.objects.none()
-    artist_matches = Artist.objects.none()
+    context = {"q": q}
 
     if q:
-        song_matches = (
-            Song.objects.filter(is_published=True)
-            .filter(Q(title__icontains=q) | Q(artist__name__icontains=q) | Q(album__title__icontains=q))
-            .select_related("artist", "album")
-            .distinct()
-        )
-        line_matches = (
-            Line.objects.filter(
-                Q(original__icontains=q)
-                | Q(translation_en__icontains=q)
-                | Q(romanized__icontains=q),
-                song__is_published=True,
+        # Ordered ids per section come from the result cache; only the requested page is loaded
+        result_ids = cached_result_ids(q)
+        for section, (name, param, queryset) in SEARCH_SECTIONS.items():
+            context[name] = paginate_ids(
+                queryset, result_ids[section], request.GET, param,
+                more_ids=partial(result_ids_from, q, section),
             )
-            .select_related("song", "song__artist")
-            .order_by("song__artist__name", "song__title", "no")
-        )
-        album_matches = (
-            Album.objects.filter(Q(title__icontains=q) | Q(artist__name__icontains=q))
-            .select_related("artist")
-            .distinct()
-        )
-        artist_matches = Artist.objects.filter(Q(name__icontains=q)).distinct()
 
-    sp = Paginator(song_matches, 20)
-    lp = Paginator(line_matches, 20)
-    ap = Paginator(album_matches, 20)
-    arp = Paginator(artist_matches, 20)
-    return render(
-        request,
-        "search.html",
-        {
-            "q": q,
-            "songs_page": sp.get_page(request.GET.get("sp") or 1),
-            "lines_page": lp.get_page(request.GET.get("lp") or 1),
-            "albums_page": ap.get_page(request.GET.get("ap") or 1),
-            "artists_page": arp.get_page(request.GET.get("arp") or 1),
-        },
-    )
+    return render(request, "search.html", context)
+
 
+def typeahead(request):
+    """JSON search suggestions, served from the in-process prefix index."""
+    q = (request.GET.get("q") or "").strip()
+    try:
+        limit = min(int(request.GET.get("limit", 8)), MAX_RESULTS)
+    except ValueError:
+        limit = 8
+    return JsonResponse({"q": q, "results": suggest(q, limit)})
+
+
+@never_cache
+def user_state(request):
+    """JSON per-user state for the cached page shells: `?song=1,2&artist=3` (see core.userstate)."""
+    if not request.user.is_authenticated:
+        return JsonResponse({"authenticated": False})
+    ids_by_type = {content_type: parse_ids(request.GET.get(content_type)) for content_type in USER_STATE_TYPES}
+    return JsonResponse({
+        "authenticated": True,
+        "username": request.user.username,
+        "csrf_token": get_token(request),
+        **load_user_state(request.user, ids_by_type),
+    })
 
+
+@never_cache
+@require_http_methods(["GET", "POST"])
+def comment_thread(request, content_type, object_id):
+    """A song's or artist's comment thread: a JSON page of comment markup (`?c=cursor`), or POST a new one."""
+    if content_type not in COMMENT_TYPES:
+        raise Http404
+    model, form_class, key = COMMENT_TYPES[content_type]
+    queryset = model.objects.filter(is_published=True) if model is Song else model.objects.all()
+    obj = get_object_or_404(queryset, pk=object_id)
+    if request.method == "POST":
+        return _post_comment(request, obj, form_class, key)
+
+    page = comment_page(obj, request.GET)
+    next_url = f"{reverse('comment_thread', args=[content_type, obj.pk])}?{page.next_query}" if page.has_next else None
+    return JsonResponse({"html": render_comments(page), "next": next_url, "count": obj.comment_count})
+
+
+def _post_comment(request, obj, form_class, key):
+    # Fetched by static/js/comments.js, which inserts the returned markup; plain form posts go back to the page
+    fetched = request.headers.get("X-Requested-With") == "XMLHttpRequest"
+    if not request.user.is_authenticated:
+        if fetched:
+            return JsonResponse({"error": "Login required"}, status=403)
+        return redirect_to_login(obj.get_absolute_url())
+
+    form = form_class(request.POST)
+    if not form.is_valid():
+        if fetched:
+            return JsonResponse({"errors": form.errors}, status=400)
+        messages.error(request, "Your comment couldn't be posted.")
+        return redirect(obj)
+
+    comment = form.save(commit=False)
+    setattr(comment, key, obj)
+    comment.user = request.user
+    comment.save()
+    if fetched:
+        return HttpResponse(render_comments([comment]), status=201)
+    messages.success(request, 'Comment added!')
+    return redirect(obj)
+
+
+@conditional_page(conditional.artists_index_page)
 def artists_index(request):
     """A–Z list of all artists."""
     artists = Artist.objects.order_by("name")
     return render(request, "artists_index.html", {"artists": artists})
 
 
+@conditional_page(conditional.albums_index_page)
 def albums_index(request):
     """A–Z list of albums."""
     albums = Album.objects.select_related('artist').order_by('title')
     return render(request, "albums_index.html", {"albums": albums})
 
 
+@conditional_page(conditional.songs_index_page)
 def songs_index(request):
     """A-Z list of all published songs."""
     songs = (
@@ -179,67 +225,31 @@ def songs_index(request):
     return render(request, "songs_index.html", {"songs": songs})
 
 
+@conditional_page(conditional.artist_page)
 def artist_detail(request, artist):
     a = get_object_or_404(Artist, slug=artist)
-    # Get songs where this artist is the main artist
-    main_songs = (
-        Song.objects.filter(artist=a, is_published=True)
-        .select_related("artist")
-        .order_by("-year", "title")
-    )
-    # Get songs where this artist is featured
-    featured_songs = (
-        Song.objects.filter(featured_artists=a, is_published=True)
-        .select_related("artist")
-        .order_by("-year", "title")
-    )
-    # Combine both querysets
-    from itertools import chain
-    songs = list(chain(main_songs, featured_songs))
-    # Sort by year and title
-    songs = sorted(songs, key=lambda s: (-(s.year or 0), s.title))
-
-    years = [s.year for s in songs if s.year]
-    year_min, year_max = (min(years), max(years)) if years else (None, None)
-
-    # Get comments and ratings
-    comments = a.comments.select_related('user').all()
-    avg_rating = a.ratings.aggregate(Avg('rating'))['rating__avg']
-    user_rating = None
-    is_favorite = False
-
-    if request.user.is_authenticated:
-        user_rating = a.ratings.filter(user=request.user).first()
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        is_favorite = profile.favorite_artists.filter(id=a.id).exists()
-
-    # Handle comment submission
-    if request.method == 'POST' and request.user.is_authenticated:
-        if 'comment_text' in request.POST:
-            comment_form = ArtistCommentForm(request.POST)
-            if comment_form.is_valid():
-                comment = comment_form.save(commit=False)
-                comment.artist = a
-                comment.user = request.user
-                comment.save()
-                messages.success(request, 'Comment added!')
-                return redirect('artist_detail', artist=artist)
-        elif 'rating' in request.POST:
-            rating_form = ArtistRatingForm(request.POST)
-            if rating_form.is_valid():
-                rating, created = ArtistRating.objects.update_or_create(
-                    artist=a,
-                    user=request.user,
-                    defaults={'rating': rating_form.cleaned_data['rating']}
-                )
-                messages.success(request, 'Rating updated!' if not created else 'Rating added!')
-                return redirect('artist_detail', artist=artist)
-
+    request.tracked_object = a  # recorded by PageViewMiddleware
+    # Main, additional and featured appearances in one paged query, totals aggregated by the database
+    songs, discography_summary = discography(a, request.GET)
+
+    # Newest comments only; the rest load from comment_thread (see core.comments)
+    comments = comment_page(a, request.GET)
+    avg_rating = a.rating_average
+
+    # Handle rating submission (comments are posted to comment_thread)
+    if request.method == 'POST' and request.user.is_authenticated and 'rating' in request.POST:
+        rating_form = ArtistRatingForm(request.POST)
+        if rating_form.is_valid():
+            created = rate(a, request.user, rating_form.cleaned_data['rating'])
+            UserState.for_user(request.user).set_rating('artist', a.pk, rating_form.cleaned_data['rating'])
+            messages.success(request, 'Rating updated!' if not created else 'Rating added!')
+            return redirect('artist_detail', artist=artist)
+
+    # Favorite and rating state of the signed-in user are filled in by user_state.js
     comment_form = ArtistCommentForm()
-    rating_form = ArtistRatingForm(instance=user_rating)
 
     # Get view count for this artist
-    artist_views = PageView.objects.filter(content_type='artist', url=request.path).count()
+    artist_views = get_view_count('artist', a.pk)
 
     return render(
         request,
@@ -247,29 +257,27 @@ def artist_detail(request, artist):
         {
             "artist": a,
             "songs": songs,
-            "year_min": year_min,
-            "year_max": year_max,
+            "discography": discography_summary,
             "comments": comments,
             "comment_form": comment_form,
-            "rating_form": rating_form,
             "avg_rating": avg_rating,
-            "user_rating": user_rating,
-            "is_favorite": is_favorite,
             "view_count": artist_views,
         },
     )
 
 
+@conditional_page(conditional.album_page)
 def album_detail(request, artist, album):
     """Album detail page showing all songs in the album."""
     a = get_object_or_404(Artist, slug=artist)
-    alb = get_object_or_404(Album, slug=album, artist=a)
+    alb = get_object_or_404(Album.objects.with_credits(), slug=album, artist=a)
+    request.tracked_object = alb  # recorded by PageViewMiddleware
 
     # Get all songs in this album
-    songs = Song.objects.filter(album=alb, is_published=True).select_related('artist').order_by('title')
+    songs = Song.objects.filter(album=alb, is_published=True).select_related('artist').with_credits().order_by('title')
 
     # Get view count for this album
-    album_views = PageView.objects.filter(content_type='album', url=request.path).count()
+    album_views = get_view_count('album', alb.pk)
 
     return render(request, 'album_detail.html', {
         'album': alb,
@@ -279,74 +287,42 @@ def album_detail(request, artist, album):
     })
 
 
+@conditional_page(conditional.song_page)
 def song_detail(request, artist, song):
-    import json
     s = get_object_or_404(
-        Song.objects.select_related("artist", "album").prefetch_related("lines", "featured_artists"),
+        Song.objects.select_related("artist", "album").with_credits(),
         artist__slug=artist,
         slug=song,
         is_published=True,
     )
-
-    # Get comments and ratings
-    comments = s.comments.select_related('user').all()
-    avg_rating = s.ratings.aggregate(Avg('rating'))['rating__avg']
-    user_rating = None
-    is_favorite = False
-
-    if request.user.is_authenticated:
-        user_rating = s.ratings.filter(user=request.user).first()
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        is_favorite = profile.favorite_songs.filter(id=s.id).exists()
-
-    # Handle comment submission
-    if request.method == 'POST' and request.user.is_authenticated:
-        if 'comment_text' in request.POST:
-            comment_form = SongCommentForm(request.POST)
-            if comment_form.is_valid():
-                comment = comment_form.save(commit=False)
-                comment.song = s
-                comment.user = request.user
-                comment.save()
-                messages.success(request, 'Comment added!')
-                return redirect('song_detail', artist=artist, song=song)
-        elif 'rating' in request.POST:
-            rating_form = SongRatingForm(request.POST)
-            if rating_form.is_valid():
-                rating, created = SongRating.objects.update_or_create(
-                    song=s,
-                    user=request.user,
-                    defaults={'rating': rating_form.cleaned_data['rating']}
-                )
-                messages.success(request, 'Rating updated!' if not created else 'Rating added!')
-                return redirect('song_detail', artist=artist, song=song)
-
+    request.tracked_object = s  # recorded by PageViewMiddleware
+
+    # Newest comments only; the rest load from comment_thread (see core.comments)
+    comments = comment_page(s, request.GET)
+    avg_rating = s.rating_average
+
+    # Handle rating submission (comments are posted to comment_thread)
+    if request.method == 'POST' and request.user.is_authenticated and 'rating' in request.POST:
+        rating_form = SongRatingForm(request.POST)
+        if rating_form.is_valid():
+            created = rate(s, request.user, rating_form.cleaned_data['rating'])
+            UserState.for_user(request.user).set_rating('song', s.pk, rating_form.cleaned_data['rating'])
+            messages.success(request, 'Rating updated!' if not created else 'Rating added!')
+            return redirect('song_detail', artist=artist, song=song)
+
+    # Favorite and rating state of the signed-in user are filled in by user_state.js
     comment_form = SongCommentForm()
-    rating_form = SongRatingForm(instance=user_rating)
-
-    # Prepare lyrics data for JavaScript
-    lyrics_data = [
-        {
-            "no": line.no,
-            "original": line.original,
-            "romanized": line.romanized or "",
-            "translation": line.translation_en,
-        }
-        for line in s.lines.all()
-    ]
 
     # Get view count for this song
-    song_views = PageView.objects.filter(content_type='song', url=request.path).count()
+    song_views = get_view_count('song', s.pk)
 
     return render(request, "song_detail.html", {
         "song": s,
-        "lyrics_json": json.dumps(lyrics_data),
+        # Lines + JSON for the display toggles, cached per lyrics version
+        "lyrics_block": render_lyrics_block(s),
         "comments": comments,
         "comment_form": comment_form,
-        "rating_form": rating_form,
         "avg_rating": avg_rating,
-        "user_rating": user_rating,
-        "is_favorite": is_favorite,
         "view_count": song_views,
     })
 
@@ -410,39 +386,43 @@ def profile_view(request):
 
 
 @login_required
+@require_POST
 def toggle_favorite_song(request, song_id):
-    song = get_object_or_404(Song, id=song_id)
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
-
-    if profile.favorite_songs.filter(id=song_id).exists():
-        profile.favorite_songs.remove(song)
-        messages.info(request, f'{song.title} removed from favorites.')
-    else:
-        profile.favorite_songs.add(song)
-        messages.success(request, f'{song.title} added to favorites!')
-
-    return redirect(request.META.get('HTTP_REFERER', 'charts'))
+    return _set_favorite(request, 'song', get_object_or_404(Song, id=song_id).pk)
 
 
 @login_required
+@require_POST
 def toggle_favorite_artist(request, artist_id):
-    artist = get_object_or_404(Artist, id=artist_id)
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    return _set_favorite(request, 'artist', get_object_or_404(Artist, id=artist_id).pk)
 
-    if profile.favorite_artists.filter(id=artist_id).exists():
-        profile.favorite_artists.remove(artist)
-        messages.info(request, f'{artist.name} removed from favorites.')
-    else:
-        profile.favorite_artists.add(artist)
-        messages.success(request, f'{artist.name} added to favorites!')
 
-    return redirect(request.META.get('HTTP_REFERER', 'charts'))
+def _set_favorite(request, content_type, object_id):
+    """Set (`favorite=1` or `0`) or, without the parameter, flip a favorite. JSON {"favorite": bool}."""
+    state = UserState.for_user(request.user)
+    favorite = request.POST.get('favorite')
+    favorite = not state.is_favorite(content_type, object_id) if favorite is None else favorite == '1'
+    state.set_favorite(content_type, object_id, favorite)
+    return JsonResponse({'favorite': favorite})
 
 
 def stats_view(request):
     """Private stats dashboard showing site analytics"""
+    # Recomputed by one worker at a time; the rest are served the previous numbers
+    context, _ = cached_value("stats", _stats_context, settings.STATS_CACHE_TIMEOUT)
+    context = {
+        **context,
+        # Result cache hit rates (help size the caches); cheap, so always live
+        'search_cache': search_cache_stats(),
+        'page_cache': page_cache_stats(),
+        'object_cache': tiered_cache.stats(),
+    }
+    return render(request, 'stats.html', context)
+
+
+def _stats_context():
     from django.contrib.auth.models import User
-    from django.db.models import Count, Avg
+    from django.db.models import Count
 
     # Time periods
     now = timezone.now()
@@ -450,16 +430,13 @@ def stats_view(request):
     seven_days_ago = now - timedelta(days=7)
     thirty_days_ago = now - timedelta(days=30)
 
+    # Distinct IPs/users are HyperLogLog estimates merged from the daily rollups
+    visitors = visitor_summary(now)
+
     # USER STATISTICS
     total_users = User.objects.count()
-    active_users_7d = PageView.objects.filter(
-        viewed_at__gte=seven_days_ago,
-        user__isnull=False
-    ).values('user').distinct().count()
-    active_users_30d = PageView.objects.filter(
-        viewed_at__gte=thirty_days_ago,
-        user__isnull=False
-    ).values('user').distinct().count()
+    active_users_7d = visitors['active_users_7d']
+    active_users_30d = visitors['active_users_30d']
     new_users_today = User.objects.filter(date_joined__date=today).count()
     new_users_7d = User.objects.filter(date_joined__gte=seven_days_ago).count()
     new_users_30d = User.objects.filter(date_joined__gte=thirty_days_ago).count()
@@ -469,99 +446,36 @@ def stats_view(request):
     total_unpublished_songs = Song.objects.filter(is_published=False).count()
     total_artists = Artist.objects.count()
     total_albums = Album.objects.count()
-    total_song_comments = SongComment.objects.count()
-    total_artist_comments = ArtistComment.objects.count()
-    total_song_ratings = SongRating.objects.count()
-    total_artist_ratings = ArtistRating.objects.count()
+    total_song_comments = Song.objects.aggregate(total=Sum('comment_count'))['total'] or 0
+    total_artist_comments = Artist.objects.aggregate(total=Sum('comment_count'))['total'] or 0
+    # Rating totals are kept on the rated rows (core.ratings)
+    song_ratings = Song.objects.aggregate(count=Sum('rating_count'), total=Sum('rating_sum'))
+    artist_ratings = Artist.objects.aggregate(count=Sum('rating_count'), total=Sum('rating_sum'))
+    total_song_ratings = song_ratings['count'] or 0
+    total_artist_ratings = artist_ratings['count'] or 0
     total_lines = Line.objects.count()
 
     # TRAFFIC STATISTICS
-    total_views = PageView.objects.count()
-    views_today = PageView.objects.filter(viewed_at__date=today).count()
-    views_7d = PageView.objects.filter(viewed_at__gte=seven_days_ago).count()
-    views_30d = PageView.objects.filter(viewed_at__gte=thirty_days_ago).count()
+    # View totals come from the daily rollups (see `manage.py rollup_stats`)
+    traffic = traffic_summary(now)
+    total_views = traffic['total_views']
+    views_today = traffic['views_today']
+    views_7d = traffic['views_7d']
+    views_30d = traffic['views_30d']
 
-    unique_ips_total = PageView.objects.values('ip_address').distinct().count()
-    unique_ips_today = PageView.objects.filter(viewed_at__date=today).values('ip_address').distinct().count()
-    unique_ips_7d = PageView.objects.filter(viewed_at__gte=seven_days_ago).values('ip_address').distinct().count()
-    unique_ips_30d = PageView.objects.filter(viewed_at__gte=thirty_days_ago).values('ip_address').distinct().count()
+    unique_ips_total = visitors['unique_ips_total']
+    unique_ips_today = visitors['unique_ips_today']
+    unique_ips_7d = visitors['unique_ips_7d']
+    unique_ips_30d = visitors['unique_ips_30d']
 
-    registered_views = PageView.objects.filter(user__isnull=False).count()
-    anonymous_views = PageView.objects.filter(user__isnull=True).count()
+    registered_views = traffic['registered_views']
+    anonymous_views = traffic['anonymous_views']
 
     # TOP CONTENT
-    # Get top URLs with view counts, then fetch actual objects to get titles
-    top_song_urls = PageView.objects.filter(content_type='song').values(
-        'url'
-    ).annotate(
-        views=Count('id')
-    ).order_by('-views')[:10]
-
-    top_songs = []
-    for item in top_song_urls:
-        url = item['url']
-        # Parse URL: /a/<artist-slug>/<song-slug>/
-        parts = url.strip('/').split('/')
-        if len(parts) >= 3:
-            try:
-                song = Song.objects.select_related('artist').get(
-                    artist__slug=parts[1],
-                    slug=parts[2]
-                )
-                top_songs.append({
-                    'url': url,
-                    'content_title': f"{song.title} — {song.artist.name}",
-                    'views': item['views']
-                })
-            except Song.DoesNotExist:
-                pass
-
-    top_artist_urls = PageView.objects.filter(content_type='artist').values(
-        'url'
-    ).annotate(
-        views=Count('id')
-    ).order_by('-views')[:10]
-
-    top_artists = []
-    for item in top_artist_urls:
-        url = item['url']
-        # Parse URL: /a/<artist-slug>/
-        parts = url.strip('/').split('/')
-        if len(parts) >= 2:
-            try:
-                artist = Artist.objects.get(slug=parts[1])
-                top_artists.append({
-                    'url': url,
-                    'content_title': artist.name,
-                    'views': item['views']
-                })
-            except Artist.DoesNotExist:
-                pass
-
-    top_album_urls = PageView.objects.filter(content_type='album').values(
-        'url'
-    ).annotate(
-        views=Count('id')
-    ).order_by('-views')[:10]
-
-    top_albums = []
-    for item in top_album_urls:
-        url = item['url']
-        # Parse URL: /album/<artist-slug>/<album-slug>/
-        parts = url.strip('/').split('/')
-        if len(parts) >= 3:
-            try:
-                album = Album.objects.select_related('artist').get(
-                    artist__slug=parts[1],
-                    slug=parts[2]
-                )
-                top_albums.append({
-                    'url': url,
-                    'content_title': f"{album.title} — {album.artist.name}",
-                    'views': item['views']
-                })
-            except Album.DoesNotExist:
-                pass
+    # Ranked ids from the daily rollup, resolved with one query per type
+    top_songs = resolve_top_content('song')
+    top_artists = resolve_top_content('artist')
+    top_albums = resolve_top_content('album')
 
     # ENGAGEMENT STATISTICS
     total_song_favorites = UserProfile.objects.annotate(
@@ -572,8 +486,8 @@ def stats_view(request):
         fav_count=Count('favorite_artists')
     ).aggregate(total=Count('favorite_artists'))['total'] or 0
 
-    avg_song_rating = SongRating.objects.aggregate(avg=Avg('rating'))['avg']
-    avg_artist_rating = ArtistRating.objects.aggregate(avg=Avg('rating'))['avg']
+    avg_song_rating = song_ratings['total'] / total_song_ratings if total_song_ratings else None
+    avg_artist_rating = artist_ratings['total'] / total_artist_ratings if total_artist_ratings else None
 
     # Calculate average comments/ratings per day
     if total_users > 0:
@@ -629,5 +543,4 @@ def stats_view(request):
         'comments_per_day': comments_per_day,
         'ratings_per_day': ratings_per_day,
     }
-
-    return render(request, 'stats.html', context)
+    return context
@@ -140,6 +140,70 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'charts'
 LOGOUT_REDIRECT_URL = 'charts'
 
+# Page view tracking
+# 'sync' writes each view during the request; 'buffered' queues views in-process
+# and writes them in batches from a background thread (flushed on worker exit).
+PAGEVIEW_TRACKING_MODE = config('PAGEVIEW_TRACKING_MODE', default='sync')
+PAGEVIEW_BUFFER_SIZE = config('PAGEVIEW_BUFFER_SIZE', default=10000, cast=int)
+PAGEVIEW_FLUSH_BATCH_SIZE = config('PAGEVIEW_FLUSH_BATCH_SIZE', default=500, cast=int)
+PAGEVIEW_FLUSH_INTERVAL = config('PAGEVIEW_FLUSH_INTERVAL', default=5.0, cast=float)
+
+# Raw page views older than this are moved to gzip archives by `manage.py archive_pageviews`
+PAGEVIEW_RETENTION_DAYS = config('PAGEVIEW_RETENTION_DAYS', default=180, cast=int)
+PAGEVIEW_ARCHIVE_DIR = config('PAGEVIEW_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'pageviews'))
+
+# Cache for version stamps and cached pages/fragments. LocMemCache is per
+# process; with several gunicorn workers point this at a shared backend (e.g.
+# django.core.cache.backends.db.DatabaseCache with a table name) so every
+# worker sees invalidations.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Lyric search: 'auto' uses the database's full-text index (PostgreSQL tsvector
+# or SQLite FTS5) when installed; 'icontains' forces plain substring scans.
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='auto')
+
+# Seconds search results (matched ids per section) stay cached; any catalog
+# edit invalidates them sooner. 0 disables the cache.
+SEARCH_CACHE_TIMEOUT = config('SEARCH_CACHE_TIMEOUT', default=300, cast=int)
+
+# Milliseconds each fuzzy lookup query may take (core.fuzzy); words not
+# matched in time are searched for exactly. 0 disables the limit.
+FUZZY_SEARCH_TIMEOUT = config('FUZZY_SEARCH_TIMEOUT', default=100, cast=int)
+
+# Mixed into the ETags of catalog pages (core.conditional); change it on deploys
+# that change their markup so browsers stop revalidating old copies
+PAGE_MARKUP_VERSION = config('PAGE_MARKUP_VERSION', default='1')
+
+# Seconds a rendered catalog page is cached (core.conditional);
+# content edits invalidate it sooner, so this only bounds how stale view
+# counts get. 0 disables the page cache.
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds the charts data and the /stats/ numbers are cached before one
+# worker recomputes them (core.caching.cached_value)
+CHARTS_CACHE_TIMEOUT = config('CHARTS_CACHE_TIMEOUT', default=60, cast=int)
+STATS_CACHE_TIMEOUT = config('STATS_CACHE_TIMEOUT', default=60, cast=int)
+# Seconds past expiry other workers keep serving the old value meanwhile, and
+# how long it is served instead when recomputing fails with a database error
+CACHE_STALE_TIMEOUT = config('CACHE_STALE_TIMEOUT', default=300, cast=int)
+CACHE_STALE_IF_ERROR = config('CACHE_STALE_IF_ERROR', default=3600, cast=int)
+
+# Per-process cache in front of the shared one for small hot values
+# (core.caching.tiered_cache): entries kept, and seconds each is trusted
+LOCAL_CACHE_MAX_ENTRIES = config('LOCAL_CACHE_MAX_ENTRIES', default=1000, cast=int)
+LOCAL_CACHE_TIMEOUT = config('LOCAL_CACHE_TIMEOUT', default=30, cast=float)
+
+# Bayesian average of the top rated lists (core.ratings): every song and
+# artist counts as if it also had RATING_PRIOR_WEIGHT votes of
+# RATING_PRIOR_MEAN. Run `manage.py rebuild_rating_totals` after changing them.
+RATING_PRIOR_WEIGHT = config('RATING_PRIOR_WEIGHT', default=5, cast=int)
+RATING_PRIOR_MEAN = config('RATING_PRIOR_MEAN', default=3.0, cast=float)
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
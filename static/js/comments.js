@@ -0,0 +1,53 @@
+// Comment threads on song and artist pages (templates/partials/comments.html):
+// "Load more" appends the next page from the comment_thread view, and posting
+// inserts the new comment that view returns instead of reloading the page.
+(function () {
+  document.querySelectorAll("[data-comments]").forEach((thread) => {
+    const list = thread.querySelector("[data-comment-list]");
+    const empty = thread.querySelector("[data-comments-empty]");
+    const form = thread.querySelector("[data-comment-form]");
+    const more = thread.querySelector("[data-more-comments]");
+
+    if (more) {
+      more.addEventListener("click", (event) => {
+        event.preventDefault();
+        fetch(more.dataset.moreComments, { credentials: "same-origin" })
+          .then((resp) => resp.json())
+          .then((page) => {
+            list.insertAdjacentHTML("beforeend", page.html);
+            if (page.next) {
+              more.dataset.moreComments = page.next;
+            } else {
+              more.remove();
+            }
+          })
+          .catch(() => { window.location = more.href; });
+      });
+    }
+
+    if (form) {
+      form.addEventListener("submit", (event) => {
+        event.preventDefault();
+        const button = form.querySelector("button[type=submit]");
+        button.disabled = true;
+        fetch(form.action, {
+          method: "POST",
+          body: new FormData(form),
+          credentials: "same-origin",
+          headers: { "X-Requested-With": "XMLHttpRequest" },
+        })
+          .then((resp) => {
+            if (!resp.ok) throw new Error(resp.status);
+            return resp.text();
+          })
+          .then((html) => {
+            list.insertAdjacentHTML("afterbegin", html);
+            if (empty) empty.hidden = true;
+            form.reset();
+          })
+          .catch(() => form.submit())
+          .finally(() => { button.disabled = false; });
+      });
+    }
+  });
+})();
@@ -0,0 +1,79 @@
+// Fills the per-user parts of pages that are rendered (and cached) the same
+// for every visitor: signed-in header, CSRF tokens, favorite and rating state.
+// One request per page load to the user_state view (see core/userstate.py).
+// Also submits favorite forms in the background.
+(function () {
+  const script = document.currentScript;
+
+  function objectIds() {
+    const ids = {};
+    document.querySelectorAll("[data-favorite], [data-user-rating]").forEach((el) => {
+      const [type, id] = (el.dataset.favorite || el.dataset.userRating).split(":");
+      (ids[type] = ids[type] || new Set()).add(id);
+    });
+    return ids;
+  }
+
+  function showFavorite(el, favorite) {
+    el.dataset.favorited = favorite ? "1" : "0";
+    el.classList.toggle("text-red-400", !!favorite);
+    el.textContent = favorite ? "♥ Favorited" : "♡ Add to Favorites";
+  }
+
+  // Favorite forms post the state they switch to and get JSON back (toggle_favorite_* views)
+  document.addEventListener("submit", (event) => {
+    const form = event.target.closest("[data-favorite-form]");
+    if (!form) return;
+    event.preventDefault();
+    const button = form.querySelector("[data-favorite]");
+    const body = new FormData(form);
+    if (button) body.set("favorite", button.dataset.favorited === "1" ? "0" : "1");
+    fetch(form.action, { method: "POST", body, credentials: "same-origin" })
+      .then((resp) => resp.json())
+      .then((result) => {
+        if (button) {
+          showFavorite(button, result.favorite);
+        } else if (!result.favorite) {
+          const item = form.closest("[data-favorite-item]");
+          if (item) item.remove();
+        }
+      })
+      .catch(() => {});
+  });
+
+  function apply(state) {
+    document.querySelectorAll("[data-user-only]").forEach((el) => { el.hidden = !state.authenticated; });
+    document.querySelectorAll("[data-anon-only]").forEach((el) => { el.hidden = state.authenticated; });
+    if (!state.authenticated) return;
+
+    document.querySelectorAll("[data-username]").forEach((el) => { el.textContent = state.username; });
+    document.querySelectorAll("[data-csrf]").forEach((el) => { el.value = state.csrf_token; });
+
+    document.querySelectorAll("[data-favorite]").forEach((el) => {
+      const [type, id] = el.dataset.favorite.split(":");
+      showFavorite(el, ((state[type] || {})[id] || {}).favorite);
+    });
+
+    document.querySelectorAll("[data-user-rating]").forEach((el) => {
+      const [type, id] = el.dataset.userRating.split(":");
+      const rating = ((state[type] || {})[id] || {}).rating;
+      if (!rating) return;
+      el.dataset.rating = rating;
+      const input = document.getElementById("ratingInput");
+      const current = document.getElementById("currentRating");
+      const note = document.getElementById("currentRatingNote");
+      if (input) input.value = rating;
+      if (current) current.textContent = rating;
+      if (note) note.hidden = false;
+    });
+
+    document.dispatchEvent(new CustomEvent("userstate", { detail: state }));
+  }
+
+  const params = new URLSearchParams();
+  Object.entries(objectIds()).forEach(([type, ids]) => params.set(type, [...ids].join(",")));
+  fetch(`${script.dataset.url}?${params}`, { credentials: "same-origin" })
+    .then((resp) => resp.json())
+    .then(apply)
+    .catch(() => {});
+})();